@@ -1,15 +1,17 @@
 import os
 import logging
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
-from threading import Thread
+import hmac
 import json
+import queue
 from datetime import datetime
+from log_config import setup_logging
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging (queued, written by a background thread)
+setup_logging()
 
 class Base(DeclarativeBase):
     pass
@@ -31,32 +33,123 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 # initialize the app with the extension
 db.init_app(app)
 
-# Import signal bot functionality
-from signal_bot import SignalBot
+# The bot runs in its own process (bot_worker.py); web workers control it
+# over a local connection and relay its events to their SSE subscribers
+from bot_control import BotControl, BotUnavailable, EventRelay
+from routing import RouteTable
+from event_stream import broadcaster, format_sse, parse_sse
+from signal_cache import ConfigCache, RecentSignals
 
-# Global bot instance
-bot_instance = None
+# Per-worker copies of the newest signals and the config, kept current by
+# the relayed bot events (see signal_cache.py)
+RECENT_SIGNALS_SIZE = int(os.environ.get("RECENT_SIGNALS_SIZE", 100))
+recent_signals = RecentSignals(RECENT_SIGNALS_SIZE)
+config_cache = ConfigCache()
 
-with app.app_context():
-    # Import models
-    from models import Config, Signal
-    db.create_all()
+def relay_connected():
+    recent_signals.enable()
+    config_cache.enable()
+
+def relay_disconnected():
+    recent_signals.disable()
+    config_cache.disable()
+
+def relay_event(message):
+    """Apply one relayed bot event to the local caches"""
+    event, data = parse_sse(message)
+    if event == 'signal':
+        recent_signals.add(data)
+    elif event == 'signal_changed':
+        recent_signals.changed(data['ids'])
+    elif event == 'invalidate':
+        if 'signals' in data['caches']:
+            recent_signals.invalidate()
+        if 'config' in data['caches']:
+            config_cache.invalidate()
+
+bot_control = BotControl()
+event_relay = EventRelay(broadcaster, on_connect=relay_connected, on_message=relay_event,
+                         on_disconnect=relay_disconnected)
+
+# Largest page /api/signals will return
+API_MAX_PAGE_SIZE = 100
+
+# Seconds between keep-alive comments on idle event streams
+STREAM_HEARTBEAT = 15
+# Browser reconnect delay after a dropped event stream (milliseconds)
+STREAM_RETRY_MS = 3000
+
+# Shared secret for the admin routes, sent as the X-Admin-Token header;
+# without it they are disabled
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Import models
+from models import Config, Signal, SignalCounter, SignalUpdate, format_price
+
+def init_db():
+    """Create missing tables, apply schema upgrades and seed counters.
+    
+    An explicit deploy step (``flask --app app init-db`` or ``python
+    migrate.py``) rather than import-time work, so restarting a web worker
+    does not touch the schema. Set DB_INIT_ON_START=1 to run it on import
+    instead.
+    """
+    from migrate import upgrade_all
+    from stats import ensure_rollups
+    with app.app_context():
+        db.create_all()
+        upgrade_all(db)
+        SignalCounter.ensure(SignalCounter.TOTAL_SIGNALS, lambda: Signal.query.count())
+        SignalCounter.ensure(SignalCounter.SIGNAL_REVISION, lambda: 0)
+        ensure_rollups(db.session)
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create or upgrade the database schema"""
+    init_db()
+    print("Database schema is up to date")
+
+if os.environ.get("DB_INIT_ON_START") == "1":
+    init_db()
+
+app.add_template_filter(format_price, 'price')
+
+def load_config():
+    """Stored Config detached from the session, for ConfigCache"""
+    config = Config.query.first()
+    if config is not None:
+        db.session.expunge(config)
+    return config
+
+def load_recent_signals(limit):
+    """Newest ``limit`` signal payloads, the total count and the signal revision, for RecentSignals"""
+    signals = Signal.query.order_by(Signal.id.desc()).limit(limit).all()
+    return ([signal.to_dict() for signal in signals], SignalCounter.get(SignalCounter.TOTAL_SIGNALS),
+            SignalCounter.get(SignalCounter.SIGNAL_REVISION))
+
+def get_config():
+    """Stored Config for display (read-only; may be the cached copy)"""
+    event_relay.start()
+    return config_cache.get(load_config)
 
 @app.route('/')
 def index():
     """Main dashboard page"""
-    config = Config.query.first()
-    recent_signals = Signal.query.order_by(Signal.timestamp.desc()).limit(10).all()
+    config = get_config()
+    if recent_signals.enabled:
+        signals = recent_signals.get(load_recent_signals)[0][:10]
+    else:
+        signals = Signal.query.order_by(Signal.id.desc()).limit(10).all()
     
     bot_status = "Not Running"
-    if bot_instance and bot_instance.is_running():
+    if bot_control.is_running():
         bot_status = "Running"
     elif config and config.api_id and config.api_hash:
         bot_status = "Configured - Ready to Start"
     
     return render_template('index.html', 
                          config=config, 
-                         recent_signals=recent_signals,
+                         recent_signals=signals,
                          bot_status=bot_status)
 
 @app.route('/config', methods=['GET', 'POST'])
@@ -76,6 +169,16 @@ def config_page():
             config.session_name = request.form.get('session_name', 'signal_bot')
             config.to_channel = request.form.get('to_channel')
             
+            # Optional forwarding rules (JSON list), validated before saving
+            routes_str = request.form.get('routes', '').strip()
+            if routes_str:
+                try:
+                    RouteTable.from_config(routes_str)
+                except Exception as e:
+                    flash(f'Error parsing routes: {str(e)}', 'error')
+                    return redirect(url_for('config_page'))
+            config.routes = routes_str or None
+            
             # Parse source channels (comma separated)
             from_channels_str = request.form.get('from_channels', '')
             if from_channels_str:
@@ -94,13 +197,15 @@ def config_page():
                     return redirect(url_for('config_page'))
             
             db.session.commit()
+            config_cache.invalidate()
+            bot_control.invalidate('config')
             flash('Configuration saved successfully!', 'success')
             return redirect(url_for('index'))
             
         except Exception as e:
             flash(f'Error saving configuration: {str(e)}', 'error')
     
-    config = Config.query.first()
+    config = get_config()
     return render_template('config.html', config=config)
 
 @app.route('/dashboard')
@@ -108,71 +213,291 @@ def dashboard():
     """Real-time dashboard page"""
     return render_template('dashboard.html')
 
+def get_bot_status():
+    """Bot status string used by the JSON API"""
+    if bot_control.is_running():
+        return "running"
+    return "stopped"
+
 @app.route('/api/signals')
 def api_signals():
-    """API endpoint for real-time signal updates"""
+    """API endpoint for real-time signal updates.
+    
+    Keyset paginated newest first: ``before_id`` pages back through history,
+    ``since_id`` returns only signals newer than the client's latest. Replies
+    carry an ETag (newest id, count and signal revision) so unchanged polls
+    get a 304 without touching the signal rows. While the event relay is connected, pages within the newest
+    RECENT_SIGNALS_SIZE signals come from memory without a query.
+    """
     try:
-        signals = Signal.query.order_by(Signal.timestamp.desc()).limit(20).all()
-        signals_data = []
+        limit = min(request.args.get('limit', 20, type=int) or 20, API_MAX_PAGE_SIZE)
+        before_id = request.args.get('before_id', type=int)
+        since_id = request.args.get('since_id', type=int)
+        
+        event_relay.start()
+        recent = signals = None
+        if recent_signals.enabled:
+            recent, total_signals, revision = recent_signals.get(load_recent_signals)
+            latest_id = recent[0].id if recent else 0
+        else:
+            latest_id = db.session.query(db.func.max(Signal.id)).scalar() or 0
+            total_signals = SignalCounter.get(SignalCounter.TOTAL_SIGNALS)
+            revision = SignalCounter.get(SignalCounter.SIGNAL_REVISION)
+        bot_status = get_bot_status()
         
-        for signal in signals:
-            signals_data.append({
-                'id': signal.id,
-                'symbol': signal.symbol,
-                'position': signal.position,
-                'entry': signal.entry,
-                'stop_loss': signal.stop_loss,
-                'take_profits': signal.take_profits,
-                'risk_reward': signal.risk_reward,
-                'source_channel': signal.source_channel,
-                'timestamp': signal.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                'formatted_signal': signal.formatted_signal
-            })
+        # The revision covers status updates and edits of signals already sent
+        etag = f"{latest_id}-{total_signals}-{revision}-{bot_status}-{limit}-{before_id}-{since_id}"
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
         
-        bot_status = "stopped"
-        if bot_instance and bot_instance.is_running():
-            bot_status = "running"
+        if recent is not None:
+            signals = recent_signals.select(recent, limit, before_id, since_id)
+        if signals is None:
+            query = Signal.query
+            if before_id is not None:
+                query = query.filter(Signal.id < before_id)
+            if since_id is not None:
+                query = query.filter(Signal.id > since_id)
+            signals = query.order_by(Signal.id.desc()).limit(limit).all()
         
-        return jsonify({
-            'signals': signals_data,
+        response = jsonify({
+            'signals': [signal.to_dict() for signal in signals],
             'bot_status': bot_status,
-            'total_signals': Signal.query.count()
+            'total_signals': total_signals,
+            'latest_id': latest_id,
+            'next_before_id': signals[-1].id if len(signals) == limit else None
         })
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/signals/<int:signal_id>')
+def api_signal(signal_id):
+    """Single signal, for the dashboard detail view"""
+    signal = db.session.get(Signal, signal_id)
+    if signal is None:
+        return jsonify({'error': 'Signal not found'}), 404
+    data = signal.to_dict()
+    updates = SignalUpdate.query.filter_by(signal_id=signal_id).order_by(SignalUpdate.id).all()
+    data['updates'] = [update.to_dict() for update in updates]
+    return jsonify(data)
+
+@app.route('/api/search')
+def api_search():
+    """Ranked full-text search over the original signal messages (see search.py).
+    
+    ``q`` is the search text; ``channel`` limits it to one source channel;
+    ``page`` and ``limit`` page through the results. ``archive=1`` searches
+    the archived signals instead (a scan, newest first; see retention.py).
+    """
+    from search import SearchError, search_archive, search_signals
+    limit = min(request.args.get('limit', 20, type=int) or 20, API_MAX_PAGE_SIZE)
+    page = request.args.get('page', 1, type=int) or 1
+    search = search_archive if request.args.get('archive') == '1' else search_signals
+    try:
+        results, has_more = search(db.session, request.args.get('q', ''),
+                                   channel=request.args.get('channel') or None, limit=limit, page=page)
+    except SearchError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error searching signals: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({
+        'results': results,
+        'page': page,
+        'next_page': page + 1 if has_more else None
+    })
+
+@app.route('/api/stats')
+def api_stats():
+    """Signal counts and buy/sell split per channel or symbol over a window (see stats.py).
+    
+    ``window`` (e.g. 1h, 24h, 7d) or ``since``/``until`` (ISO 8601, UTC);
+    optional ``resolution`` (minute, hour, day), ``group`` (channel or
+    symbol) and repeatable ``channel`` / ``symbol`` filters.
+    """
+    from export import parse_date
+    from stats import StatsError, parse_window, query_stats
+    try:
+        window = request.args.get('window')
+        return jsonify(query_stats(
+            db.session,
+            since=parse_date(request.args.get('since')),
+            until=parse_date(request.args.get('until')),
+            window=parse_window(window) if window else None,
+            resolution=request.args.get('resolution') or None,
+            group=request.args.get('group', 'channel'),
+            channels=request.args.getlist('channel'),
+            symbols=request.args.getlist('symbol')
+        ))
+    except (StatsError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/stream')
+def api_stream():
+    """Server-Sent Events stream of new signals and bot status changes.
+    
+    A reconnecting browser sends Last-Event-ID (the last signal id it saw);
+    anything newer is replayed from the database before live events.
+    """
+    event_relay.start()
+    
+    # Subscribe before reading the backlog so nothing falls in between;
+    # the dashboard ignores ids it has already shown.
+    subscriber = broadcaster.subscribe()
+    try:
+        backlog = []
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        if last_event_id is not None:
+            missed = (Signal.query.filter(Signal.id > last_event_id)
+                      .order_by(Signal.id).limit(API_MAX_PAGE_SIZE).all())
+            backlog = [format_sse('signal', signal.to_dict(), event_id=signal.id) for signal in missed]
+        backlog.append(format_sse('status', {'bot_status': get_bot_status()}))
+    except Exception:
+        broadcaster.unsubscribe(subscriber)
+        raise
+    
+    def stream():
+        try:
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            yield from backlog
+            while broadcaster.is_subscribed(subscriber):
+                try:
+                    yield subscriber.get(timeout=STREAM_HEARTBEAT)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            broadcaster.unsubscribe(subscriber)
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def bot_stats_response(name):
+    """JSON reply with one set of counters from the bot worker"""
+    try:
+        reply = bot_control.stats(name)
+    except BotUnavailable:
+        return jsonify({'error': 'Bot has not been started'}), 404
+    if not reply['ok']:
+        return jsonify({'error': reply['error']}), 404
+    return jsonify(reply['stats'])
+
+@app.route('/api/dedup_stats')
+def api_dedup_stats():
+    """Duplicate suppression cache counters"""
+    return bot_stats_response('dedup')
+
+@app.route('/api/open_signals')
+def api_open_signals():
+    """Open-signal index size and follow-up match counters"""
+    return bot_stats_response('open_signals')
+
+@app.route('/api/send_stats')
+def api_send_stats():
+    """Outbound send queue depth, retries and latency per destination"""
+    return bot_stats_response('send')
+
+@app.route('/metrics')
+def metrics():
+    """Pipeline counters and stage latency histograms for Prometheus"""
+    try:
+        body = bot_control.metrics()
+        up = 1
+    except BotUnavailable:
+        body = ''
+        up = 0
+    header = ("# HELP signal_bot_worker_up Whether the bot worker process answered\n"
+              "# TYPE signal_bot_worker_up gauge\n"
+              f"signal_bot_worker_up {up}\n")
+    return Response(header + body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def admin_allowed():
+    """Check the X-Admin-Token header; admin routes are closed when ADMIN_TOKEN is not set.
+    
+    Only the header is accepted, so the token does not end up in access logs.
+    """
+    if not ADMIN_TOKEN:
+        return False
+    token = request.headers.get('X-Admin-Token', '')
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+@app.route('/admin/profile')
+def admin_profile():
+    """Sample the running bot for ``seconds`` and return collapsed stacks.
+    
+    ``format=json`` also returns the per-pattern regex breakdown for the
+    messages handled during the run.
+    """
+    if not admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    seconds = request.args.get('seconds', 10, type=float)
+    interval = request.args.get('interval_ms', 5, type=float) / 1000.0
+    thread = request.args.get('thread', 'bot')
+    try:
+        reply = bot_control.profile(seconds, interval=interval, thread=thread)
+    except BotUnavailable as e:
+        return jsonify({'error': str(e)}), 503
+    if not reply['ok']:
+        return jsonify({'error': reply['error']}), 409
+    
+    if request.args.get('format') == 'json':
+        reply.pop('ok')
+        return jsonify(reply)
+    return Response(reply['collapsed'], content_type='text/plain; charset=utf-8')
+
+@app.route('/api/export')
+def api_export():
+    """Stream the signal history as ``format`` csv, ndjson or parquet.
+    
+    Optional filters: ``since`` / ``until`` (ISO 8601, UTC) and repeatable
+    ``symbol`` and ``channel``; ``archive=0`` leaves out archived signals.
+    Rows are streamed in chunks (see export.py), so large exports do not
+    build up in memory. Admin only, like /admin/profile.
+    """
+    if not admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    from export import FORMATS, check_format, export, parse_date
+    fmt = request.args.get('format', 'csv')
+    try:
+        check_format(fmt)
+        since = parse_date(request.args.get('since'))
+        until = parse_date(request.args.get('until'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 501
+    
+    blocks = export(db.session, fmt, since=since, until=until, symbols=request.args.getlist('symbol'),
+                    channels=request.args.getlist('channel'), include_archive=request.args.get('archive') != '0')
+    mimetype, extension = FORMATS[fmt]
+    return Response(stream_with_context(blocks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=signals.{extension}',
+                             'X-Accel-Buffering': 'no'})
+
 @app.route('/start_bot', methods=['POST'])
 def start_bot():
     """Start the Telegram bot"""
-    global bot_instance
-    
     try:
-        config = Config.query.first()
+        config = get_config()
         if not config or not config.api_id or not config.api_hash:
             flash('Please configure API credentials first', 'error')
             return redirect(url_for('index'))
         
-        if bot_instance and bot_instance.is_running():
-            flash('Bot is already running', 'warning')
+        # The worker builds the bot from the stored config
+        reply = bot_control.start()
+        if not reply['ok']:
+            flash(reply['error'], 'warning')
             return redirect(url_for('index'))
         
-        # Parse from_channels
-        from_channels = []
-        if config.from_channels:
-            from_channels = json.loads(config.from_channels)
-        
-        # Create and start bot
-        bot_instance = SignalBot(
-            api_id=int(config.api_id),
-            api_hash=config.api_hash,
-            session_name=config.session_name,
-            from_channels=from_channels,
-            to_channel=config.to_channel
-        )
-        
-        # Start bot in background thread
-        bot_thread = Thread(target=bot_instance.start, daemon=True)
-        bot_thread.start()
+        # Relay the worker's signal and status events to live dashboards
+        event_relay.start()
         
         flash('Bot started successfully!', 'success')
         
@@ -185,14 +510,14 @@ def start_bot():
 @app.route('/stop_bot', methods=['POST'])
 def stop_bot():
     """Stop the Telegram bot"""
-    global bot_instance
-    
     try:
-        if bot_instance and bot_instance.is_running():
-            bot_instance.stop()
+        reply = bot_control.stop()
+        if reply['ok']:
             flash('Bot stopped successfully!', 'success')
         else:
-            flash('Bot is not running', 'warning')
+            flash(reply['error'], 'warning')
+    except BotUnavailable:
+        flash('Bot is not running', 'warning')
     except Exception as e:
         flash(f'Error stopping bot: {str(e)}', 'error')
     
@@ -202,8 +527,10 @@ def stop_bot():
 def clear_signals():
     """Clear all signal history"""
     try:
-        Signal.query.delete()
-        db.session.commit()
+        from retention import clear_history
+        clear_history(db.session)
+        recent_signals.invalidate()
+        bot_control.clear_caches()
         flash('Signal history cleared successfully!', 'success')
     except Exception as e:
         flash(f'Error clearing signals: {str(e)}', 'error')
@@ -211,4 +538,5 @@ def clear_signals():
     return redirect(url_for('index'))
 
 if __name__ == '__main__':
+    init_db()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,81 @@
+"""Parse a channel history dump for backfilling a new source channel.
+
+Reads NDJSON (one Telegram message per line) and writes one NDJSON result
+per input line, in the same order:
+
+    python backfill.py history.ndjson --channel -1001234567890 -o parsed.ndjson
+    cat history.ndjson | python backfill.py - --signals-only
+
+Each input record needs the message text (``message`` or ``text``) and may
+carry ``chat_id``/``channel`` and ``id``; ``--channel`` fills in the channel
+for dumps that do not include it.
+"""
+import argparse
+import json
+import sys
+from collections import deque
+
+from signal_parser import parse_many
+
+
+def read_records(stream, default_channel=None):
+    """Yield (record id, text, channel) for every non-blank NDJSON line"""
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise SystemExit(f"Line {line_no}: invalid JSON ({e})")
+
+        text = record.get('message') or record.get('text') or ''
+        channel = record.get('chat_id', record.get('channel', default_channel))
+        yield record.get('id', line_no), text, channel
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parse an NDJSON message dump into signals')
+    parser.add_argument('input', help="NDJSON file, or '-' for stdin")
+    parser.add_argument('-o', '--output', help='output NDJSON file (default: stdout)')
+    parser.add_argument('--channel', help='source channel id for records without chat_id')
+    parser.add_argument('--workers', type=int, default=None, help='process pool size (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=256, help='messages per worker task')
+    parser.add_argument('--signals-only', action='store_true', help='omit messages that are not signals')
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+    sink = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+
+    ids = deque()
+
+    def pairs():
+        # Ids are kept aside so only (text, channel) crosses the process boundary
+        for record_id, text, channel in read_records(source, args.channel):
+            ids.append(record_id)
+            yield text, channel
+
+    parsed = 0
+    signals = 0
+    try:
+        for result in parse_many(pairs(), workers=args.workers, chunk_size=args.chunk_size):
+            record_id = ids.popleft()
+            parsed += 1
+            if result is None:
+                if args.signals_only:
+                    continue
+            else:
+                signals += 1
+            sink.write(json.dumps({'id': record_id, 'signal': result}, ensure_ascii=False) + '\n')
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+    print(f"Parsed {parsed} messages, {signals} signals", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""Parser benchmark driven by the golden corpus.
+
+Checks every corpus entry against its expected parse result, then measures
+throughput, per-message latency percentiles and allocations for
+``parse_text`` (the function behind ``SignalBot.parse_signal``).
+
+Usage:
+    python benchmarks/bench_parser.py
+    python benchmarks/bench_parser.py --rounds 500 --output bench.json
+    python benchmarks/bench_parser.py --regenerate   # rewrite expectations
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from signal_parser import parse_text
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parser_corpus.jsonl')
+
+
+def load_corpus(path=CORPUS_PATH):
+    """Load corpus entries (name, channel, text, expected)"""
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _comparable(result):
+    """Strip fields that are a copy of the input"""
+    if result is None:
+        return None
+    result = dict(result)
+    result.pop('original_message', None)
+    return result
+
+
+def check_corpus(entries):
+    """Return the list of entries whose parse differs from the expectation"""
+    failures = []
+    for entry in entries:
+        actual = _comparable(parse_text(entry['text'], entry['channel']))
+        if actual != entry['expected']:
+            failures.append({'name': entry['name'], 'expected': entry['expected'], 'actual': actual})
+    return failures
+
+
+def regenerate_corpus(entries, path=CORPUS_PATH):
+    """Rewrite expected results from the current parser"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            entry['expected'] = _comparable(parse_text(entry['text'], entry['channel']))
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure_latency(entries, rounds):
+    """Time every parse individually and return per-message latencies in seconds"""
+    samples = []
+    clock = time.perf_counter
+    for _ in range(rounds):
+        for entry in entries:
+            text = entry['text']
+            channel = entry['channel']
+            start = clock()
+            parse_text(text, channel)
+            samples.append(clock() - start)
+    return samples
+
+
+def measure_throughput(entries, rounds):
+    """Parse the corpus ``rounds`` times back to back and return messages/sec"""
+    pairs = [(entry['text'], entry['channel']) for entry in entries]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text, channel in pairs:
+            parse_text(text, channel)
+    elapsed = time.perf_counter() - start
+    return len(pairs) * rounds / elapsed if elapsed else 0.0
+
+
+def measure_allocations(entries):
+    """Allocated blocks and bytes for one pass over the corpus"""
+    pairs = [(entry['text'], entry['channel']) for entry in entries]
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        results = [parse_text(text, channel) for text, channel in pairs]
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del results
+
+    stats = after.compare_to(before, 'filename')
+    total_blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+    total_bytes = sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+    return {
+        'blocks_per_message': round(total_blocks / len(pairs), 2) if pairs else 0.0,
+        'bytes_per_message': round(total_bytes / len(pairs), 1) if pairs else 0.0,
+        'peak_bytes': peak,
+    }
+
+
+def run(rounds=200, warmup=5):
+    """Run the full suite and return a JSON-serialisable report"""
+    entries = load_corpus()
+    failures = check_corpus(entries)
+
+    measure_throughput(entries, warmup)
+    latencies = sorted(measure_latency(entries, rounds))
+    throughput = measure_throughput(entries, rounds)
+    allocations = measure_allocations(entries)
+
+    return {
+        'python': platform.python_version(),
+        'corpus_size': len(entries),
+        'corpus_signals': sum(1 for entry in entries if entry['expected'] is not None),
+        'rounds': rounds,
+        'correctness': {'passed': len(entries) - len(failures), 'failed': len(failures), 'failures': failures},
+        'messages_per_sec': round(throughput, 1),
+        'latency_us': {
+            'p50': round(_percentile(latencies, 50) * 1e6, 2),
+            'p90': round(_percentile(latencies, 90) * 1e6, 2),
+            'p99': round(_percentile(latencies, 99) * 1e6, 2),
+            'max': round(latencies[-1] * 1e6, 2) if latencies else 0.0,
+        },
+        'allocations': allocations,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark parse_text against the golden corpus')
+    parser.add_argument('--rounds', type=int, default=200, help='passes over the corpus per measurement')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    parser.add_argument('--regenerate', action='store_true', help='rewrite expected results from the current parser')
+    args = parser.parse_args(argv)
+
+    if args.regenerate:
+        regenerate_corpus(load_corpus())
+        print(f"Expected results regenerated in {CORPUS_PATH}")
+        return 0
+
+    report = run(rounds=args.rounds)
+    payload = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(payload + '\n')
+    else:
+        print(payload)
+
+    # A correctness regression fails the run so it can gate CI
+    return 1 if report['correctness']['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Cold-start benchmark for the web app and the bot worker.
+
+Every measurement runs in a fresh interpreter, the way a restarted web or
+worker process starts, against a scratch SQLite database:
+
+    web_import         import app (what a gunicorn worker does on boot)
+    web_first_request  the first GET /api/signals after importing app
+    worker_import      import bot_worker (until it can answer control requests)
+    bot_import         import signal_bot (paid once, when the bot is started)
+
+``init_db`` (the explicit schema step) is timed once on the empty database.
+The run fails if importing the web app loads Telethon.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --rounds 20 --output startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules the web tier should not need at startup
+WATCHED_MODULES = ('telethon', 'numpy', 'signal_parser', 'signal_bot', 'profiler')
+
+# name: (untimed setup, timed code)
+PROBES = {
+    'web_import': ('', 'import app'),
+    'web_first_request': ('import app', 'app.app.test_client().get("/api/signals")'),
+    'worker_import': ('', 'import bot_worker'),
+    'bot_import': ('', 'import signal_bot'),
+}
+
+_PROBE_TEMPLATE = '''
+import json, sys, time
+sys.path.insert(0, {root!r})
+{setup}
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'modules': len(sys.modules),
+                  'loaded': [name for name in {watched!r} if name in sys.modules]}}))
+'''
+
+
+def _environment(database):
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': f"sqlite:///{os.path.abspath(database)}",
+        'LOG_LEVEL': 'WARNING',
+        'BOT_WORKER_AUTOSPAWN': '0',
+        'DB_INIT_ON_START': '0',
+    })
+    return env
+
+
+def run_probe(code, env, setup=''):
+    """Run ``setup`` then ``code`` (timed) in a new interpreter; returns its report plus the process wall time"""
+    script = _PROBE_TEMPLATE.format(root=ROOT, setup=setup, code=code, watched=WATCHED_MODULES)
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', script], env=env, cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    wall = time.perf_counter() - start
+    report = json.loads(output.strip().splitlines()[-1])
+    report['process_seconds'] = wall
+    return report
+
+
+def _summary_ms(values):
+    return {
+        'median': round(statistics.median(values) * 1000, 1),
+        'min': round(min(values) * 1000, 1),
+        'max': round(max(values) * 1000, 1),
+    }
+
+
+def run(rounds=5, database=None):
+    """Run every probe ``rounds`` times and return a JSON-serialisable report"""
+    database = database or os.path.join(tempfile.mkdtemp(prefix='startup-'), 'startup.db')
+    env = _environment(database)
+    init = run_probe('init_db()', env, setup='from app import init_db')
+
+    results = {}
+    for name, (setup, code) in PROBES.items():
+        reports = [run_probe(code, env, setup) for _ in range(rounds)]
+        results[name] = {
+            'in_process_ms': _summary_ms([report['seconds'] for report in reports]),
+            'process_ms': _summary_ms([report['process_seconds'] for report in reports]),
+            'modules': reports[-1]['modules'],
+            'loaded': reports[-1]['loaded'],
+        }
+
+    return {
+        'python': platform.python_version(),
+        'rounds': rounds,
+        'database': database,
+        'init_db_ms': round(init['seconds'] * 1000, 1),
+        'probes': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure cold-start time of the web app and bot worker')
+    parser.add_argument('--rounds', type=int, default=5, help='fresh interpreters per probe')
+    parser.add_argument('--database', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    report = run(rounds=args.rounds, database=args.database)
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(payload + '\n')
+    else:
+        print(payload)
+
+    # The web tier pulling Telethon back in fails the run so it can gate CI
+    return 1 if 'telethon' in report['probes']['web_import']['loaded'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""End-to-end replay of recorded channel messages through SignalBot.
+
+Runs the real bot (parser, dedup, routing, send queue, batched writer)
+against fake_telegram.FakeTelegramClient, so no Telegram account or network
+is needed. It reports latency from message arrival to DB commit and to
+forward.
+
+Usage:
+    python benchmarks/replay_bot.py                          # parser corpus, 0.2s apart
+    python benchmarks/replay_bot.py history.ndjson --speed 10
+    python benchmarks/replay_bot.py --repeat 50 --speed 0 --dedup-window -1 --send-rate 1000
+
+Recordings are NDJSON with ``message``/``text``, ``chat_id``/``channel``,
+``id`` and optionally ``date`` (ISO 8601 or epoch seconds),
+``reply_to_msg_id`` and ``edit_date`` (the record is an edit of the earlier
+message with that ``id``). Inter-arrival gaps come from ``edit_date`` or
+``date`` and are divided by ``--speed``; ``--speed 0`` replays everything as
+a single burst.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from functools import partial
+from threading import Lock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_parser import _percentile, load_corpus
+from fake_telegram import FakeMessage, FakeTelegramClient
+
+
+def _timestamp(value):
+    """Epoch seconds from an ISO 8601 string or a number, None if missing"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    date = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date.timestamp()
+
+
+def load_recording(path, interval=0.2):
+    """Script of (offset seconds, FakeMessage) from an NDJSON recording"""
+    script = []
+    first = None
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            edit_date = record.get('edit_date')
+            sent_at = _timestamp(edit_date or record.get('date'))
+            if sent_at is None:
+                offset = len(script) * interval
+            else:
+                first = sent_at if first is None else first
+                offset = sent_at - first
+            message = FakeMessage(
+                record.get('id', line_no),
+                record.get('chat_id', record.get('channel')),
+                record.get('message') or record.get('text') or '',
+                reply_to_msg_id=record.get('reply_to_msg_id', record.get('reply_to')),
+                edit_date=edit_date or None
+            )
+            script.append((offset, message))
+    return script
+
+
+def corpus_script(interval=0.2):
+    """Script built from the parser benchmark corpus, ``interval`` seconds apart"""
+    return [(index * interval, FakeMessage(index + 1, entry['channel'], entry['text']))
+            for index, entry in enumerate(load_corpus())]
+
+
+def repeat_script(script, times, interval=0.2):
+    """Concatenate ``times`` copies of ``script`` with fresh message ids"""
+    if times <= 1 or not script:
+        return script
+    span = max(offset for offset, _ in script) + interval
+    id_step = max(message.id for _, message in script)
+    repeated = []
+    for copy in range(times):
+        for offset, message in script:
+            reply_to = message.reply_to_msg_id
+            repeated.append((offset + copy * span, FakeMessage(
+                message.id + copy * id_step, message.chat_id, message.message,
+                reply_to_msg_id=None if reply_to is None else reply_to + copy * id_step,
+                edit_date=message.edit_date)))
+    return repeated
+
+
+def _latency_ms(samples):
+    samples = sorted(samples)
+    return {
+        'count': len(samples),
+        'p50': round(_percentile(samples, 50) * 1000, 2),
+        'p90': round(_percentile(samples, 90) * 1000, 2),
+        'p99': round(_percentile(samples, 99) * 1000, 2),
+        'max': round(samples[-1] * 1000, 2) if samples else 0.0,
+    }
+
+
+def replay(script, speed=1.0, send_rate=1.0, send_burst=5, send_latency=0.0,
+           dedup_window=60, destination='replay-destination', drain_timeout=60, metrics_path=None):
+    """Run ``script`` through a SignalBot and return the latency report"""
+    from signal_bot import SignalBot
+
+    clock = time.perf_counter
+    arrivals = {}
+    forwards = {}
+    commit_latencies = []
+    lock = Lock()
+
+    class ReplayBot(SignalBot):
+        def save_signal_to_db(self, signal_data, seen=None, timestamp=None):
+            # Remember which arrival each forwarded text belongs to; every
+            # destination receives the texts in this order
+            key = (signal_data['source_channel'], signal_data['source_message_id'])
+            forwards.setdefault(signal_data['formatted_signal'], []).append(arrivals[key])
+            super().save_signal_to_db(signal_data, seen=seen, timestamp=timestamp)
+
+    def on_dispatch(message, arrived_at):
+        arrivals[(str(message.chat_id), message.id)] = arrived_at
+
+    def on_commit(signal_id, signal_data, timestamp):
+        committed_at = clock()
+        key = (signal_data['source_channel'], signal_data['source_message_id'])
+        with lock:
+            commit_latencies.append(committed_at - arrivals[key])
+
+    async def drain():
+        await bot.sender.drain(drain_timeout)
+
+    channels = sorted({message.chat_id for _, message in script}, key=str)
+    bot = ReplayBot(
+        api_id=0,
+        api_hash='replay',
+        session_name='replay',
+        from_channels=channels,
+        to_channel=destination,
+        dedup_window=dedup_window,
+        send_rate=send_rate,
+        send_burst=send_burst,
+        client_factory=partial(FakeTelegramClient, script=script, speed=speed, send_latency=send_latency,
+                               after_replay=drain, on_dispatch=on_dispatch, clock=clock)
+    )
+    bot.writer.add_listener(on_commit)
+    # Create the schema and open the database before the clock starts
+    from app import init_db
+    init_db()
+    bot.writer.load_checkpoints()
+
+    started = clock()
+    bot.start()
+    elapsed = clock() - started
+    if metrics_path:
+        with open(metrics_path, 'w', encoding='utf-8') as f:
+            f.write(bot.metrics.render())
+
+    cursors = {}
+    forward_latencies = []
+    for sent in bot.client.sent:
+        index = cursors.get((sent.destination, sent.text), 0)
+        cursors[(sent.destination, sent.text)] = index + 1
+        pending = forwards.get(sent.text, [])
+        if index < len(pending):
+            forward_latencies.append(sent.sent_at - pending[index])
+
+    return {
+        'messages': len(script),
+        'signals_committed': len(commit_latencies),
+        'duplicates': bot.deduplicator.hits,
+        'forwarded': len(bot.client.sent),
+        'edited': sum(sent.edits for sent in bot.client.sent),
+        'speed': speed,
+        'elapsed_sec': round(elapsed, 3),
+        'messages_per_sec': round(len(script) / elapsed, 1) if elapsed else 0.0,
+        'commit_latency_ms': _latency_ms(commit_latencies),
+        'forward_latency_ms': _latency_ms(forward_latencies),
+        'writer': {'rows_written': bot.writer.rows_written, 'batches': bot.writer.batches_written,
+                   'failed_rows': bot.writer.failed_rows},
+        'send_queue': bot.sender.stats(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay recorded channel messages through SignalBot offline')
+    parser.add_argument('recording', nargs='?', help='NDJSON recording (default: the parser corpus)')
+    parser.add_argument('--speed', type=float, default=1.0, help='time multiplier; 0 replays as one burst')
+    parser.add_argument('--interval', type=float, default=0.2, help='gap between messages without a date')
+    parser.add_argument('--repeat', type=int, default=1, help='replay the recording this many times back to back')
+    parser.add_argument('--send-rate', type=float, default=1.0, help='forwards per second per destination')
+    parser.add_argument('--send-burst', type=int, default=5, help='token bucket size per destination')
+    parser.add_argument('--send-latency', type=float, default=0.0, help='simulated send_message round trip (s)')
+    parser.add_argument('--dedup-window', type=float, default=60, help='seconds; -1 disables duplicate suppression')
+    parser.add_argument('--database', help='SQLite file to write to (default: a temporary file)')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    parser.add_argument('--metrics', help='write the per-stage metrics (Prometheus text) to this file')
+    parser.add_argument('--verbose', action='store_true', help='show bot logging')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    # The app configures logging from the environment when it is imported
+    os.environ.setdefault('LOG_LEVEL', 'INFO' if args.verbose else 'WARNING')
+
+    # Point the writer at a scratch database before the app is imported
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix='replay-'), 'replay.db')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.abspath(database)}"
+
+    script = load_recording(args.recording, args.interval) if args.recording else corpus_script(args.interval)
+    script = repeat_script(script, args.repeat, args.interval)
+
+    report = replay(script, speed=args.speed, send_rate=args.send_rate, send_burst=args.send_burst,
+                    send_latency=args.send_latency, dedup_window=args.dedup_window, metrics_path=args.metrics)
+    report['database'] = database
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(payload + '\n')
+    else:
+        print(payload)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,238 @@
+import logging
+import os
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing.connection import Client
+from threading import Lock, Thread
+
+
+def control_address():
+    """(host, port) the bot worker listens on, from BOT_CONTROL_ADDRESS"""
+    host, _, port = os.environ.get('BOT_CONTROL_ADDRESS', '127.0.0.1:6001').rpartition(':')
+    return (host or '127.0.0.1', int(port))
+
+
+def control_authkey():
+    """Shared secret for the control channel.
+
+    The worker unpickles what it receives, so the key must not be
+    guessable: BOT_CONTROL_KEY or SESSION_SECRET, otherwise a random key
+    kept in BOT_CONTROL_KEY_FILE (default ``bot_control.key``, mode 0600)
+    that the web and bot worker processes both read.
+    """
+    key = os.environ.get('BOT_CONTROL_KEY') or os.environ.get('SESSION_SECRET')
+    if key:
+        return key.encode()
+    return _install_key(os.environ.get('BOT_CONTROL_KEY_FILE', 'bot_control.key'))
+
+
+def _install_key(path):
+    """Read the key file, creating it with a random key first if needed"""
+    if not os.path.exists(path):
+        # Written to a private temp file and linked into place, so a process
+        # racing to create it never reads a partial key
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.bot_control_key.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(secrets.token_hex(32))
+            try:
+                os.link(temp_path, path)
+            except FileExistsError:
+                pass
+        finally:
+            os.unlink(temp_path)
+    with open(path) as f:
+        key = f.read().strip()
+    if not key:
+        raise RuntimeError(f"Bot control key file {path} is empty")
+    return key.encode()
+
+
+class BotUnavailable(Exception):
+    """The bot worker process is not reachable"""
+
+
+class BotControl:
+    """Client side of the bot worker's control channel.
+
+    Each call opens a short connection to the worker, sends one
+    ``{'cmd': ...}`` request and waits up to ``timeout`` seconds for the
+    reply. Any number of web workers can hold one of these; the worker
+    process itself is a singleton because only one process can bind the
+    control address.
+    """
+
+    def __init__(self, address=None, authkey=None, timeout=5, autospawn=None, logger=None):
+        self.address = address or control_address()
+        self.authkey = authkey or control_authkey()
+        self.timeout = timeout
+        if autospawn is None:
+            autospawn = os.environ.get('BOT_WORKER_AUTOSPAWN', '1') == '1'
+        self.autospawn = autospawn
+        self.logger = logger or logging.getLogger(__name__)
+        self._spawn_lock = Lock()
+
+    def _connect(self):
+        try:
+            return Client(self.address, authkey=self.authkey)
+        except (OSError, EOFError) as e:
+            raise BotUnavailable(f"Bot worker is not running ({str(e)})")
+
+    def request(self, cmd, timeout=None, **params):
+        """Send one command and return the worker's reply dict"""
+        timeout = timeout or self.timeout
+        conn = self._connect()
+        try:
+            conn.send(dict(params, cmd=cmd))
+            if not conn.poll(timeout):
+                raise BotUnavailable(f"Bot worker did not answer '{cmd}' within {timeout}s")
+            return conn.recv()
+        except (OSError, EOFError) as e:
+            raise BotUnavailable(f"Lost connection to bot worker ({str(e)})")
+        finally:
+            conn.close()
+
+    def ensure_worker(self, wait=10):
+        """Make sure a worker is listening, launching ``bot_worker.py`` if allowed"""
+        try:
+            self.request('ping')
+            return
+        except BotUnavailable:
+            if not self.autospawn:
+                raise
+
+        with self._spawn_lock:
+            self.logger.info("Launching bot worker process")
+            # A second launch from another web worker exits as soon as it
+            # finds the control address taken
+            subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot_worker.py')],
+                             start_new_session=True)
+            deadline = time.monotonic() + wait
+            while True:
+                try:
+                    self.request('ping')
+                    return
+                except BotUnavailable:
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.2)
+
+    def start(self):
+        self.ensure_worker()
+        return self.request('start')
+
+    def stop(self):
+        return self.request('stop')
+
+    def status(self):
+        """Worker status, or a 'stopped' placeholder when no worker is running"""
+        try:
+            return self.request('status')
+        except BotUnavailable:
+            return {'ok': True, 'running': False, 'worker': False}
+
+    def is_running(self):
+        return self.status().get('running', False)
+
+    def clear_caches(self):
+        """Drop the bot's duplicate cache and open-signal index, and every web
+        worker's cached signals"""
+        try:
+            return self.request('clear_caches')
+        except BotUnavailable:
+            return {'ok': True}
+
+    def invalidate(self, *caches):
+        """Have the worker tell every web worker to drop ``caches`` ('signals', 'config')"""
+        try:
+            return self.request('invalidate', caches=list(caches))
+        except BotUnavailable:
+            # Nobody is relaying events, so no web worker is caching
+            return {'ok': True}
+
+    def metrics(self):
+        """The bot's metrics in the Prometheus text format ('' before the first start)"""
+        return self.request('metrics')['text']
+
+    def profile(self, seconds, interval=0.005, thread='bot'):
+        """Run the worker's sampling profiler; blocks for about ``seconds``"""
+        return self.request('profile', timeout=seconds + self.timeout, seconds=seconds,
+                            interval=interval, thread=thread)
+
+    def stats(self, name):
+        """'dedup', 'send' or 'open_signals' counters from the running bot"""
+        return self.request('stats', name=name)
+
+
+class EventRelay:
+    """Feeds events published in the bot worker into a local broadcaster.
+
+    Holds one long-lived 'subscribe' connection to the worker and calls
+    ``broadcaster.forward`` with every SSE message it receives. Reconnects
+    (every ``retry`` seconds) whenever the worker is down or restarts.
+
+    ``on_connect()`` runs once the worker has registered the subscription
+    (its first message arrived), ``on_message(message)`` for every event
+    after that and ``on_disconnect()`` when the connection is lost; web
+    workers use them to keep their caches (see signal_cache.py) in step.
+    """
+
+    def __init__(self, broadcaster, address=None, authkey=None, retry=2, logger=None,
+                 on_connect=None, on_message=None, on_disconnect=None):
+        self.broadcaster = broadcaster
+        self.on_connect = on_connect
+        self.on_message = on_message
+        self.on_disconnect = on_disconnect
+        self.connected = False
+        self.address = address or control_address()
+        self.authkey = authkey or control_authkey()
+        self.retry = retry
+        self.logger = logger or logging.getLogger(__name__)
+        self._thread = None
+        self._lock = Lock()
+
+    def start(self):
+        """Start the relay thread (no-op if already running)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = Thread(target=self._run, name='bot-event-relay', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                conn = Client(self.address, authkey=self.authkey)
+            except (OSError, EOFError):
+                time.sleep(self.retry)
+                continue
+            try:
+                conn.send({'cmd': 'subscribe'})
+                while True:
+                    message = conn.recv()
+                    if not self.connected:
+                        # The worker answers a subscription with the bot status,
+                        # so from here on no event can be missed
+                        self.connected = True
+                        if self.on_connect:
+                            self.on_connect()
+                    if message is not None:
+                        self.broadcaster.forward(message)
+                        if self.on_message:
+                            self.on_message(message)
+            except (OSError, EOFError):
+                # Worker gone; dashboards need to know it is no longer running
+                self.broadcaster.publish_status('stopped')
+            except Exception as e:
+                self.logger.error(f"Error relaying bot events: {str(e)}")
+            finally:
+                conn.close()
+                if self.connected:
+                    self.connected = False
+                    if self.on_disconnect:
+                        self.on_disconnect()
+            time.sleep(self.retry)
@@ -0,0 +1,286 @@
+"""Standalone process that runs the Telegram bot.
+
+The web app talks to it over a local control channel (see bot_control.py):
+
+    python bot_worker.py [--autostart]
+
+Only one worker can run at a time, since only one process can bind the
+control address.
+"""
+import argparse
+import json
+import logging
+import queue
+import time
+from collections import deque
+from multiprocessing.connection import Listener
+from threading import Lock, Thread
+
+from bot_control import control_address, control_authkey
+from event_stream import EventBroadcaster
+from log_config import setup_logging
+from retention import retention_days, retention_interval
+from routing import RouteTable
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for one profiling run, and how many message texts it keeps
+# for the per-pattern breakdown
+MAX_PROFILE_SECONDS = 60
+PROFILE_SAMPLE_MESSAGES = 500
+
+
+class BotWorker:
+    """Owns the SignalBot and answers control requests"""
+
+    def __init__(self, address=None, authkey=None):
+        self.address = address or control_address()
+        self.authkey = authkey or control_authkey()
+        self.bot = None
+        self.bot_thread = None
+        self.events = EventBroadcaster()
+        self._lock = Lock()
+        self._profile_lock = Lock()
+
+    def is_running(self):
+        return bool(self.bot and self.bot.is_running())
+
+    def start_bot(self):
+        """Build a SignalBot from the stored Config and run it on a thread"""
+        # Telethon and the parser load with the first start, so the worker
+        # answers control requests as soon as it is spawned
+        from app import app
+        from models import Config
+        from signal_bot import SignalBot
+
+        with self._lock:
+            if self.is_running() or (self.bot_thread and self.bot_thread.is_alive()):
+                return {'ok': False, 'error': 'Bot is already running'}
+
+            with app.app_context():
+                config = Config.query.first()
+                if not config or not config.api_id or not config.api_hash:
+                    return {'ok': False, 'error': 'Please configure API credentials first'}
+                from_channels = json.loads(config.from_channels) if config.from_channels else []
+                bot = SignalBot(
+                    api_id=int(config.api_id),
+                    api_hash=config.api_hash,
+                    session_name=config.session_name,
+                    from_channels=from_channels,
+                    to_channel=config.to_channel,
+                    routes=RouteTable.from_config(config.routes, config.to_channel)
+                )
+
+            # Saved signals and status changes go to every subscribed web worker
+            bot.writer.add_listener(self.events.publish_signal)
+            bot.writer.add_change_listener(self.events.publish_changed)
+            bot.status_listeners.append(self.events.publish_status)
+
+            self.bot = bot
+            self.bot_thread = Thread(target=bot.start, name='signal-bot', daemon=True)
+            self.bot_thread.start()
+            return {'ok': True}
+
+    def stop_bot(self):
+        with self._lock:
+            if not self.is_running():
+                return {'ok': False, 'error': 'Bot is not running'}
+            self.bot.stop()
+            return {'ok': True}
+
+    def status(self):
+        return {
+            'ok': True,
+            'running': self.is_running(),
+            'worker': True,
+            'subscribers': self.events.subscriber_count(),
+        }
+
+    def stats(self, name):
+        if not self.bot:
+            return {'ok': False, 'error': 'Bot has not been started'}
+        if name == 'dedup':
+            return {'ok': True, 'stats': self.bot.deduplicator.stats()}
+        if name == 'open_signals':
+            return {'ok': True, 'stats': self.bot.open_signals.stats()}
+        if name == 'send':
+            if not self.bot.sender:
+                return {'ok': False, 'error': 'Bot has not been started'}
+            return {'ok': True, 'stats': self.bot.sender.stats()}
+        return {'ok': False, 'error': f'Unknown stats: {name}'}
+
+    def metrics(self):
+        """Prometheus text exposition of the bot's pipeline metrics"""
+        return {'ok': True, 'text': self.bot.metrics.render() if self.bot else ''}
+
+    def profile(self, seconds=10, interval=0.005, thread='bot'):
+        """Sample the bot's stacks for ``seconds`` and time each parser pattern.
+
+        ``thread`` is 'bot' (the event loop), 'writer' (the database writer)
+        or 'all'.
+        """
+        from profiler import SamplingProfiler, collapse, pattern_breakdown
+
+        if not self.is_running():
+            return {'ok': False, 'error': 'Bot is not running'}
+        thread_ids = {'bot': {self.bot.loop_thread_id}, 'writer': {self.bot.writer.thread_id}, 'all': None}
+        if thread not in thread_ids:
+            return {'ok': False, 'error': f'Unknown thread: {thread}'}
+        if not self._profile_lock.acquire(blocking=False):
+            return {'ok': False, 'error': 'A profile is already running'}
+
+        bot = self.bot
+        seconds = min(max(float(seconds), 0.1), MAX_PROFILE_SECONDS)
+        try:
+            bot.profile_sample = deque(maxlen=PROFILE_SAMPLE_MESSAGES)
+            stacks, samples = SamplingProfiler(interval=interval).sample(seconds, thread_ids[thread])
+            texts = list(bot.profile_sample)
+        finally:
+            bot.profile_sample = None
+            self._profile_lock.release()
+
+        return {
+            'ok': True,
+            'seconds': seconds,
+            'thread': thread,
+            'samples': samples,
+            'collapsed': collapse(stacks),
+            'messages': len(texts),
+            'patterns': pattern_breakdown(texts),
+        }
+
+    def clear_caches(self):
+        """Forget cached signals after the history was deleted"""
+        if self.bot:
+            self.bot.call_in_loop(self.bot.clear_caches)
+        self.events.publish_invalidate(['signals'])
+        return {'ok': True}
+
+    def invalidate(self, caches):
+        """Pass a cache invalidation from one web worker on to all of them"""
+        self.events.publish_invalidate(caches)
+        return {'ok': True}
+
+    def archive_old_signals(self, days):
+        """One retention run (see retention.py); returns the number of signals archived"""
+        from retention import run_retention
+
+        archived_ids = set()
+        archived = run_retention(days, on_archived=archived_ids.update)
+        if archived:
+            if self.bot:
+                # Follow-ups and edits of archived signals have nothing left to apply to
+                self.bot.call_in_loop(self.bot.forget_signals, archived_ids)
+            self.events.publish_invalidate(['signals'])
+        return archived
+
+    def start_retention(self, days, interval):
+        """Archive signals older than ``days`` now and every ``interval`` seconds"""
+        def run():
+            while True:
+                try:
+                    self.archive_old_signals(days)
+                except Exception as e:
+                    logger.error(f"Error archiving old signals: {str(e)}")
+                time.sleep(interval)
+
+        Thread(target=run, name='retention', daemon=True).start()
+        logger.info(f"Archiving signals older than {days:g} days every {interval / 3600:g} hours")
+
+    def handle(self, request):
+        """Dispatch one control request to its handler"""
+        cmd = request.get('cmd')
+        if cmd == 'ping':
+            return {'ok': True}
+        if cmd == 'start':
+            return self.start_bot()
+        if cmd == 'stop':
+            return self.stop_bot()
+        if cmd == 'status':
+            return self.status()
+        if cmd == 'stats':
+            return self.stats(request.get('name'))
+        if cmd == 'clear_caches':
+            return self.clear_caches()
+        if cmd == 'invalidate':
+            return self.invalidate(request.get('caches', []))
+        if cmd == 'metrics':
+            return self.metrics()
+        if cmd == 'profile':
+            return self.profile(request.get('seconds', 10), request.get('interval', 0.005),
+                                request.get('thread', 'bot'))
+        return {'ok': False, 'error': f'Unknown command: {cmd}'}
+
+    def _serve_connection(self, conn):
+        try:
+            request = conn.recv()
+            if request.get('cmd') == 'subscribe':
+                self._stream_events(conn)
+                return
+            try:
+                reply = self.handle(request)
+            except Exception as e:
+                logger.error(f"Error handling control request {request.get('cmd')}: {str(e)}")
+                reply = {'ok': False, 'error': str(e)}
+            conn.send(reply)
+        except (OSError, EOFError):
+            pass
+        finally:
+            conn.close()
+
+    def _stream_events(self, conn):
+        """Forward every published event to one web worker until it disconnects"""
+        subscriber = self.events.subscribe()
+        try:
+            conn.send(self.events.status_message('running' if self.is_running() else 'stopped'))
+            while self.events.is_subscribed(subscriber):
+                try:
+                    conn.send(subscriber.get(timeout=15))
+                except queue.Empty:
+                    # Heartbeat, so a vanished web worker is noticed
+                    conn.send(None)
+        finally:
+            self.events.unsubscribe(subscriber)
+
+    def listen(self):
+        """Bind the control address; raises OSError if another worker holds it"""
+        return Listener(self.address, authkey=self.authkey)
+
+    def serve_forever(self, listener):
+        with listener:
+            logger.info(f"Bot worker listening on {self.address[0]}:{self.address[1]}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # Bad authkey or a client that hung up mid-handshake
+                    logger.warning(f"Rejected control connection: {str(e)}")
+                    continue
+                Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--autostart', action='store_true', help='start the bot immediately from the stored config')
+    args = parser.parse_args()
+
+    setup_logging()
+    worker = BotWorker()
+    try:
+        listener = worker.listen()
+    except OSError:
+        logger.info("Another bot worker is already running")
+        return
+
+    if args.autostart:
+        reply = worker.start_bot()
+        if not reply['ok']:
+            logger.error(f"Could not start bot: {reply['error']}")
+    days = retention_days()
+    if days:
+        worker.start_retention(days, retention_interval())
+    worker.serve_forever(listener)
+
+
+if __name__ == '__main__':
+    main()
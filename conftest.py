@@ -0,0 +1,45 @@
+"""pytest setup: the app runs against a throwaway SQLite database.
+
+The environment is set before anything imports ``app``, which reads it at
+import time.
+"""
+import os
+import tempfile
+
+import pytest
+
+_database_dir = tempfile.mkdtemp(prefix='signal-bot-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_database_dir, 'test.db')}"
+os.environ['BOT_WORKER_AUTOSPAWN'] = '0'
+os.environ['BOT_CONTROL_KEY_FILE'] = os.path.join(_database_dir, 'bot_control.key')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.pop('DB_INIT_ON_START', None)
+
+
+@pytest.fixture
+def database():
+    """The schema-initialized test database inside an app context; emptied afterwards"""
+    from app import app, db, init_db
+
+    init_db()
+    with app.app_context():
+        yield db
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+
+
+class FakeClock:
+    """Stand-in for time.monotonic; tests move ``now`` by hand"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
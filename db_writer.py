@@ -0,0 +1,555 @@
+import logging
+import queue
+import time
+from datetime import datetime
+from threading import Thread
+
+from prices import format_price, parse_price
+
+_STOP = object()
+
+# Seconds between deletions of expired stats buckets
+ROLLUP_PRUNE_INTERVAL = 600
+
+
+class _PendingWrite:
+    """Queued row plus the dedup cache entry and source message it belongs to"""
+
+    __slots__ = ('kind', 'data', 'seen', 'received_at', 'channel', 'message_id')
+
+    def __init__(self, kind, data=None, seen=None, timestamp=None, channel=None, message_id=None):
+        self.kind = kind
+        self.data = data
+        self.seen = seen
+        self.received_at = timestamp or datetime.utcnow()
+        if data is not None:
+            channel = data['source_channel']
+            message_id = data.get('source_message_id')
+        self.channel = channel
+        self.message_id = message_id
+
+
+class SignalWriter:
+    """Background writer that batches signal inserts into single transactions.
+
+    Producers call ``submit_signal``/``submit_duplicate`` which only enqueue,
+    so the bot's event loop never waits on the database. A worker thread
+    commits a batch once ``batch_size`` rows are queued or ``flush_interval``
+    seconds have passed since the first queued row, whichever comes first.
+
+    Every queued item may carry its source (channel, message id). The highest
+    id per channel is stored as a ``ChannelCheckpoint`` in the same
+    transaction as the rows, so a checkpoint never runs ahead of what has
+    been saved, and a signal whose source message is already stored is
+    skipped instead of saved twice. While the bot catches up after a restart,
+    checkpoints are held (``hold_checkpoints``): live messages of a channel
+    then only raise its pending id, which is written once the channel's
+    backlog has been queued and saved (``release_checkpoints``).
+    """
+
+    def __init__(self, batch_size=50, flush_interval=0.5, logger=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.logger = logger or logging.getLogger(__name__)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._listeners = []
+        self._flush_listeners = []
+        self._change_listeners = []
+        self.rows_written = 0
+        self.batches_written = 0
+        self.failed_rows = 0
+        self._next_prune = 0
+        # Ids of the signals added in the transaction being written, by cache entry
+        self._new_ids = {}
+        # Checkpoint holds, only touched by the worker thread (see _advance_checkpoints)
+        self._holding = False
+        self._released = set()
+        self._held = {}
+
+    def start(self):
+        """Start the worker thread (no-op if already running)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = Thread(target=self._run, name='signal-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Flush everything still queued and stop the worker"""
+        if not self._thread or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            self.logger.warning(f"Signal writer did not drain within {timeout}s "
+                                f"({self._queue.qsize()} rows still queued)")
+
+    def add_listener(self, callback):
+        """Register ``callback(signal_id, signal_data, timestamp)``, called after each commit"""
+        self._listeners.append(callback)
+
+    def add_flush_listener(self, callback):
+        """Register ``callback(rows, seconds)``, called after each committed batch"""
+        self._flush_listeners.append(callback)
+
+    def add_change_listener(self, callback):
+        """Register ``callback(signal_ids)``, called after a commit that changed stored signals
+        (status updates and edits)"""
+        self._change_listeners.append(callback)
+
+    def submit_signal(self, signal_data, seen=None, timestamp=None):
+        """Queue a parsed signal; ``seen`` (a ``SeenSignal``) receives the new id"""
+        self._queue.put(_PendingWrite('signal', signal_data, seen=seen, timestamp=timestamp))
+
+    def submit_duplicate(self, original, signal_data):
+        """Queue a reference to an earlier signal (a ``SeenSignal`` entry)"""
+        self._queue.put(_PendingWrite('duplicate', signal_data, seen=original))
+
+    def submit_update(self, entry, update, message_id, timestamp=None):
+        """Queue a follow-up for the signal of ``entry`` (an ``OpenSignal``).
+
+        ``update`` is a ``parse_update`` result plus the signal's new ``status``.
+        """
+        data = dict(update, source_message_id=message_id)
+        self._queue.put(_PendingWrite('update', data, seen=entry, timestamp=timestamp))
+
+    def load_open_signals(self, limit):
+        """Newest ``limit`` signals not yet closed, oldest first, as
+        (id, source_channel, source_message_id, symbol, TP count, status) rows"""
+        self._bind()
+        from signal_index import TERMINAL_STATUSES
+
+        with self._app.app_context():
+            Signal, TakeProfit = self._models[0], self._models[2]
+            tp_counts = (self._db.select(TakeProfit.signal_id, self._db.func.count().label('tp_count'))
+                         .group_by(TakeProfit.signal_id).subquery())
+            rows = self._db.session.execute(
+                self._db.select(Signal.id, Signal.source_channel, Signal.source_message_id, Signal.symbol,
+                                self._db.func.coalesce(tp_counts.c.tp_count, 0), Signal.status)
+                .outerjoin(tp_counts, tp_counts.c.signal_id == Signal.id)
+                .where(self._db.or_(Signal.status.is_(None), Signal.status.notin_(TERMINAL_STATUSES)))
+                .order_by(Signal.id.desc())
+                .limit(limit)
+            ).all()
+            return list(reversed(rows))
+
+    def is_duplicate_post(self, channel, message_id):
+        """True if the source post was stored as a duplicate of another signal
+        (uses the (source_channel, source_message_id) index)"""
+        self._bind()
+        with self._app.app_context():
+            SignalDuplicate = self._models[1]
+            return self._db.session.execute(
+                self._db.select(SignalDuplicate.id)
+                .where(SignalDuplicate.source_channel == channel, SignalDuplicate.source_message_id == message_id)
+                .limit(1)
+            ).first() is not None
+
+    def submit_edit(self, posted, signal_data, timestamp=None):
+        """Queue new field values for the stored signal of ``posted`` (a ``PostedSignal``)"""
+        self._queue.put(_PendingWrite('edit', signal_data, seen=posted, timestamp=timestamp))
+
+    def submit_forwarded(self, posted, destination, message_id):
+        """Queue the message id ``posted``'s signal was forwarded as in ``destination``"""
+        data = {'source_channel': posted.channel, 'destination': str(destination), 'message_id': message_id}
+        self._queue.put(_PendingWrite('forwarded', data, seen=posted))
+
+    def load_posted(self, channel, message_id):
+        """Stored signal of a source post as (id, parse result fields, {destination: message id}), or None.
+
+        Uses the (source_channel, source_message_id) index and the
+        ForwardedMessage primary key, so no table is scanned.
+        """
+        self._bind()
+        with self._app.app_context():
+            Signal, ForwardedMessage = self._models[0], self._models[5]
+            signal = self._db.session.execute(
+                self._db.select(Signal)
+                .where(Signal.source_channel == channel, Signal.source_message_id == message_id)
+                .order_by(Signal.id)
+                .limit(1)
+            ).scalar()
+            if signal is None:
+                return None
+            forwarded = dict(self._db.session.execute(
+                self._db.select(ForwardedMessage.destination, ForwardedMessage.message_id)
+                .where(ForwardedMessage.signal_id == signal.id)
+            ).all())
+            signal_data = {
+                'symbol': signal.symbol,
+                'position': signal.position,
+                'entry': format_price(signal.entry),
+                'stop_loss': format_price(signal.stop_loss),
+                'take_profits': signal.get_take_profits_list(),
+                'risk_reward': signal.risk_reward or '',
+                'source_channel': signal.source_channel,
+            }
+            return signal.id, signal_data, forwarded
+
+    def mark_processed(self, channel, message_id):
+        """Advance a channel's checkpoint for a message that produced no row"""
+        self._queue.put(_PendingWrite('checkpoint', channel=channel, message_id=message_id))
+
+    def hold_checkpoints(self):
+        """Stop writing checkpoints until each channel is released; rows queued
+        before the hold are unaffected"""
+        self._queue.put(_PendingWrite('hold'))
+
+    def release_checkpoints(self, channel=None):
+        """Write ``channel``'s held checkpoint (every channel's if None) once
+        everything queued before this call has been saved"""
+        self._queue.put(_PendingWrite('release', channel=channel))
+
+    def load_checkpoints(self):
+        """Stored checkpoints as {channel: last message id} (reads the database directly)"""
+        self._bind()
+        with self._app.app_context():
+            ChannelCheckpoint = self._models[3]
+            return {checkpoint.channel: checkpoint.last_message_id
+                    for checkpoint in ChannelCheckpoint.query.all()}
+
+    @property
+    def thread_id(self):
+        """Ident of the worker thread (for the profiler), None before start"""
+        return self._thread.ident if self._thread else None
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue_depth(),
+            'rows_written': self.rows_written,
+            'batches_written': self.batches_written,
+            'failed_rows': self.failed_rows,
+        }
+
+    def _bind(self):
+        """Import the app and models once, outside the per-row path"""
+        if hasattr(self, '_app'):
+            return
+        from app import app, db
+        from models import (ChannelCheckpoint, ForwardedMessage, Signal, SignalCounter, SignalDuplicate, SignalRollup,
+                            SignalUpdate, TakeProfit)
+
+        self._app = app
+        self._db = db
+        self._models = (Signal, SignalDuplicate, TakeProfit, ChannelCheckpoint, SignalUpdate, ForwardedMessage)
+        self._counter = SignalCounter
+        self._rollup = SignalRollup
+
+    def _run(self):
+        self._bind()
+        # One app context (and session) for the thread's lifetime rather
+        # than one per batch
+        with self._app.app_context():
+            self._consume()
+
+    def _consume(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch.append(item)
+            deadline = time.monotonic() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._flush(batch)
+
+        # Drain anything queued behind the stop marker
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftover.append(item)
+        for start in range(0, len(leftover), self.batch_size):
+            self._flush(leftover[start:start + self.batch_size])
+
+    def _build_row(self, item):
+        Signal, SignalDuplicate, TakeProfit, _, SignalUpdate, _ = self._models
+        data = item.data
+        if item.kind == 'signal':
+            take_profits = [parse_price(tp) for tp in data['take_profits']]
+            return Signal(
+                symbol=data['symbol'],
+                position=data['position'],
+                entry=parse_price(data['entry']),
+                stop_loss=parse_price(data['stop_loss']),
+                take_profit_levels=[TakeProfit(level=level, price=price)
+                                    for level, price in enumerate(take_profits, 1)
+                                    if price is not None],
+                risk_reward=data['risk_reward'],
+                source_channel=data['source_channel'],
+                formatted_signal=data['formatted_signal'],
+                original_message=data['original_message'],
+                source_message_id=item.message_id,
+                timestamp=item.received_at
+            )
+        if item.kind == 'update':
+            return SignalUpdate(
+                signal_id=self._signal_id(item),
+                kind=data['kind'],
+                level=data['level'],
+                price=parse_price(data['price']),
+                status=data['status'],
+                source_channel=data['source_channel'],
+                source_message_id=item.message_id,
+                timestamp=item.received_at
+            )
+        return SignalDuplicate(
+            signal_id=self._signal_id(item),
+            source_channel=data['source_channel'],
+            source_message_id=item.message_id,
+            timestamp=item.received_at
+        )
+
+    def _signal_id(self, item):
+        """Id of the signal ``item`` refers to, including one added earlier in the uncommitted batch"""
+        signal_id = item.seen.signal_id
+        if signal_id is None:
+            # Updates, edits and forwards refer to the SeenSignal through an
+            # OpenSignal or PostedSignal
+            signal_id = self._new_ids.get(getattr(item.seen, 'seen', item.seen))
+        return signal_id
+
+    def _commit(self, session, batch):
+        """Write ``batch`` in one transaction; cache entries only get the new signal ids once it commits"""
+        try:
+            saved, changed, rows = self._write(session, batch)
+            session.commit()
+        finally:
+            self._new_ids = {}
+        for item, signal_id in saved:
+            if item.seen is not None:
+                item.seen.signal_id = signal_id
+        return saved, changed, rows
+
+    def _flush(self, batch):
+        """Write one batch in a single transaction, falling back to row by row on error.
+
+        Runs inside the worker thread's app context (see ``_run``).
+        """
+        start = time.perf_counter()
+        session = self._db.session
+        try:
+            saved, changed, rows = self._commit(session, batch)
+            self.rows_written += rows
+            self.batches_written += 1
+            self._notify_flush(rows, time.perf_counter() - start)
+            self._notify(saved)
+            self._notify_changed(changed)
+        except Exception as e:
+            session.rollback()
+            self.logger.error(f"Error saving batch of {len(batch)} signals, retrying row by row: {str(e)}")
+            for item in batch:
+                try:
+                    saved, changed, rows = self._commit(session, [item])
+                    self.rows_written += rows
+                    self._notify(saved)
+                    self._notify_changed(changed)
+                except Exception as row_error:
+                    session.rollback()
+                    self.failed_rows += 1
+                    self.logger.error(f"Error saving signal to database: {str(row_error)}")
+
+    def _write(self, session, batch):
+        """Add a batch to the session; returns ((item, signal id) for new signals, row count)"""
+        Signal = self._models[0]
+        signal_items = [item for item in batch if item.kind == 'signal']
+
+        # Skip signals whose source message is already stored (e.g. seen
+        # again while catching up after a restart). Message ids are only
+        # unique within a channel, so stored rows are matched on the
+        # (channel, id) pair; filtering both columns with IN lets the lookup
+        # search ix_signal_source_message (a row-value IN scans it)
+        sources = {(item.channel, item.message_id) for item in signal_items if item.message_id is not None}
+        if sources:
+            stored = set(session.execute(
+                self._db.select(Signal.source_channel, Signal.source_message_id)
+                .where(Signal.source_channel.in_({channel for channel, _ in sources}),
+                       Signal.source_message_id.in_({message_id for _, message_id in sources}))
+            ).all())
+            if stored:
+                signal_items = [item for item in signal_items
+                                if (item.channel, item.message_id) not in stored]
+
+        # Signals are flushed before duplicates so a duplicate queued in the
+        # same batch as its original can already reference the new id.
+        signals = [(item, self._build_row(item)) for item in signal_items]
+        session.add_all([row for _, row in signals])
+        session.flush()
+
+        if signals:
+            self._counter.increment(session, self._counter.TOTAL_SIGNALS, len(signals))
+            counts = {}
+            for _, row in signals:
+                self._rollup.count(counts, row.timestamp, row.source_channel, row.symbol, row.position)
+            self._rollup.apply(session, counts)
+            if time.monotonic() >= self._next_prune:
+                self._next_prune = time.monotonic() + ROLLUP_PRUNE_INTERVAL
+                self._rollup.prune(session, datetime.utcnow())
+
+        saved = [(item, row.id) for item, row in signals]
+        # Later items of the batch may refer to these signals; the cache
+        # entries themselves are only updated after the commit
+        self._new_ids = {item.seen: signal_id for item, signal_id in saved if item.seen is not None}
+
+        duplicates = [self._build_row(item) for item in batch if item.kind == 'duplicate']
+        if duplicates:
+            session.add_all(duplicates)
+
+        updates = self._write_updates(session, [item for item in batch if item.kind == 'update'])
+        edits = self._write_edits(session, [item for item in batch if item.kind == 'edit'])
+        forwards = self._write_forwards(session, [item for item in batch if item.kind == 'forwarded'])
+
+        self._advance_checkpoints(session, batch)
+        changed = sorted(set(updates + edits))
+        if changed:
+            self._counter.increment(session, self._counter.SIGNAL_REVISION)
+        return saved, changed, len(signals) + len(duplicates) + len(updates) + len(edits) + forwards
+
+    def _write_updates(self, session, items):
+        """Add update rows and move each signal to its new status; returns the ids updated"""
+        Signal = self._models[0]
+        changed = []
+        for item in items:
+            signal_id = self._signal_id(item)
+            if signal_id is None:
+                # The original signal was never stored
+                self.logger.warning(f"Dropping {item.data['kind']} update: its signal was not saved")
+                continue
+            session.add(self._build_row(item))
+            session.execute(
+                self._db.update(Signal)
+                .where(Signal.id == signal_id)
+                .values(status=item.data['status'], status_updated_at=item.received_at)
+            )
+            changed.append(signal_id)
+        return changed
+
+    def _write_edits(self, session, items):
+        """Rewrite edited signals in place and record the edit in their history; returns the ids edited"""
+        Signal, _, TakeProfit, _, SignalUpdate, _ = self._models
+        changed = []
+        counts = {}
+        for item in items:
+            signal_id = self._signal_id(item)
+            if signal_id is None:
+                self.logger.warning(f"Dropping edit of message {item.message_id}: its signal was not saved")
+                continue
+            data = item.data
+            # Move the signal between stats buckets if its symbol or side changed
+            old = session.execute(
+                self._db.select(Signal.timestamp, Signal.source_channel, Signal.symbol, Signal.position)
+                .where(Signal.id == signal_id)
+            ).first()
+            if old is not None and (old.symbol, old.position) != (data['symbol'], data['position']):
+                self._rollup.count(counts, old.timestamp, old.source_channel, old.symbol, old.position, amount=-1)
+                self._rollup.count(counts, old.timestamp, old.source_channel, data['symbol'], data['position'])
+            session.execute(
+                self._db.update(Signal)
+                .where(Signal.id == signal_id)
+                .values(symbol=data['symbol'], position=data['position'], entry=parse_price(data['entry']),
+                        stop_loss=parse_price(data['stop_loss']), risk_reward=data['risk_reward'],
+                        formatted_signal=data['formatted_signal'], original_message=data['original_message'])
+            )
+            session.execute(self._db.delete(TakeProfit).where(TakeProfit.signal_id == signal_id))
+            take_profits = [parse_price(tp) for tp in data['take_profits']]
+            session.add_all([TakeProfit(signal_id=signal_id, level=level, price=price)
+                             for level, price in enumerate(take_profits, 1) if price is not None])
+            session.add(SignalUpdate(signal_id=signal_id, kind='edited', source_channel=data['source_channel'],
+                                     source_message_id=item.message_id, timestamp=item.received_at))
+            changed.append(signal_id)
+        self._rollup.apply(session, counts)
+        return changed
+
+    def _write_forwards(self, session, items):
+        """Store forwarded message ids (replacing earlier ones per destination); returns rows written"""
+        ForwardedMessage = self._models[5]
+        rows = 0
+        for item in items:
+            signal_id = self._signal_id(item)
+            if signal_id is None:
+                continue
+            session.merge(ForwardedMessage(signal_id=signal_id, destination=item.data['destination'],
+                                           message_id=item.data['message_id']))
+            rows += 1
+        return rows
+
+    def _advance_checkpoints(self, session, batch):
+        """Move each channel's checkpoint to the newest message id of the batch,
+        or remember that id while the channel is held"""
+        ChannelCheckpoint = self._models[3]
+        latest = {}
+        for item in batch:
+            if item.kind == 'hold':
+                self._holding = True
+                self._released = set()
+                self._held = {}
+            elif item.kind == 'release':
+                if item.channel is None:
+                    self._holding = False
+                    channels = list(self._held)
+                else:
+                    self._released.add(item.channel)
+                    channels = [item.channel]
+                for channel in channels:
+                    message_id = self._held.get(channel)
+                    if message_id is not None and message_id > latest.get(channel, -1):
+                        latest[channel] = message_id
+            elif item.message_id is not None:
+                held = self._holding and item.channel not in self._released
+                target = self._held if held else latest
+                if item.message_id > target.get(item.channel, -1):
+                    target[item.channel] = item.message_id
+
+        for channel, message_id in latest.items():
+            checkpoint = session.get(ChannelCheckpoint, channel)
+            if checkpoint is None:
+                session.add(ChannelCheckpoint(channel=channel, last_message_id=message_id))
+            elif message_id > checkpoint.last_message_id:
+                checkpoint.last_message_id = message_id
+
+    def _notify(self, saved):
+        for item, signal_id in saved:
+            self.logger.info("Signal saved: %s %s", item.data['symbol'], item.data['position'],
+                             extra={'channel': item.channel, 'symbol': item.data['symbol'],
+                                    'signal_id': signal_id, 'stage': 'commit'})
+            for listener in self._listeners:
+                try:
+                    listener(signal_id, item.data, item.received_at)
+                except Exception as e:
+                    self.logger.error(f"Error in signal writer listener: {str(e)}")
+
+    def _notify_changed(self, signal_ids):
+        if not signal_ids:
+            return
+        for listener in self._change_listeners:
+            try:
+                listener(signal_ids)
+            except Exception as e:
+                self.logger.error(f"Error in signal writer change listener: {str(e)}")
+
+    def _notify_flush(self, rows, seconds):
+        for listener in self._flush_listeners:
+            try:
+                listener(rows, seconds)
+            except Exception as e:
+                self.logger.error(f"Error in signal writer flush listener: {str(e)}")
@@ -0,0 +1,96 @@
+import time
+from collections import OrderedDict
+
+
+def _normalize_price(price):
+    """Canonical form of a price string so '3350', '3350.0' and '3350.00' compare equal"""
+    try:
+        return format(float(price), '.10g')
+    except (TypeError, ValueError):
+        return str(price or '').strip()
+
+
+def signal_fingerprint(signal_data):
+    """Key identifying a signal regardless of which channel posted it"""
+    return (
+        signal_data['symbol'].upper(),
+        signal_data['position'],
+        _normalize_price(signal_data['entry']),
+        _normalize_price(signal_data['stop_loss']),
+        tuple(_normalize_price(tp) for tp in signal_data['take_profits']),
+    )
+
+
+class SeenSignal:
+    """Cache entry for the first occurrence of a fingerprint.
+
+    ``destinations`` holds every destination (as a string) the signal has
+    been forwarded to, so a repost only reaches the ones still missing.
+    """
+
+    __slots__ = ('signal_id', 'source_channel', 'first_seen', 'repeats', 'destinations')
+
+    def __init__(self, source_channel, first_seen):
+        self.signal_id = None
+        self.source_channel = source_channel
+        self.first_seen = first_seen
+        self.repeats = 0
+        self.destinations = set()
+
+
+class SignalDeduplicator:
+    """Bounded LRU/TTL cache of recently seen signal fingerprints.
+
+    A fingerprint seen again within ``window`` seconds of its first
+    occurrence is a duplicate. At most ``max_entries`` fingerprints are kept;
+    the least recently used one is evicted first.
+    """
+
+    def __init__(self, window=60, max_entries=4096, clock=time.monotonic):
+        self.window = window
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def check(self, signal_data):
+        """Return ``(entry, is_duplicate)``, registering the signal if it is new"""
+        key = signal_fingerprint(signal_data)
+        now = self.clock()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if now - entry.first_seen <= self.window:
+                self._entries.move_to_end(key)
+                entry.repeats += 1
+                self.hits += 1
+                return entry, True
+            del self._entries[key]
+            self.expirations += 1
+
+        self.misses += 1
+        entry = self._entries[key] = SeenSignal(signal_data['source_channel'], now)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return entry, False
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        """Counters for sizing the cache"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'window_seconds': self.window,
+        }
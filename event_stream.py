@@ -0,0 +1,113 @@
+import json
+import queue
+from threading import Lock
+
+from prices import format_price, parse_price
+
+
+def format_sse(event, data, event_id=None):
+    """Encode one Server-Sent Events message"""
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    message += f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return message
+
+
+def parse_sse(message):
+    """(event, data) of a message built by ``format_sse``"""
+    event = data = None
+    for line in message.split('\n'):
+        if line.startswith('event: '):
+            event = line[7:]
+        elif line.startswith('data: '):
+            data = json.loads(line[6:])
+    return event, data
+
+
+def signal_event_payload(signal_id, signal_data, timestamp):
+    """Same shape as ``Signal.to_dict`` built from parsed data, without a DB read"""
+    return {
+        'id': signal_id,
+        'symbol': signal_data['symbol'],
+        'position': signal_data['position'],
+        'entry': format_price(parse_price(signal_data['entry'])),
+        'stop_loss': format_price(parse_price(signal_data['stop_loss'])),
+        'take_profits': [format_price(parse_price(tp)) for tp in signal_data['take_profits']],
+        'risk_reward': signal_data['risk_reward'],
+        'source_channel': signal_data['source_channel'],
+        'status': 'open',
+        'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        'formatted_signal': signal_data['formatted_signal']
+    }
+
+
+class EventBroadcaster:
+    """Fan-out of live events to Server-Sent Events subscribers.
+
+    Each subscriber gets a bounded queue. A subscriber that falls behind is
+    dropped rather than slowing the publisher; its stream then ends and the
+    browser reconnects with Last-Event-ID to catch up from the database.
+    """
+
+    def __init__(self, max_queue=256):
+        self.max_queue = max_queue
+        self._subscribers = set()
+        self._lock = Lock()
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def is_subscribed(self, subscriber):
+        return subscriber in self._subscribers
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, event, data, event_id=None):
+        """Queue an event for every subscriber without blocking"""
+        self.forward(format_sse(event, data, event_id))
+
+    def forward(self, message):
+        """Queue an already encoded event (e.g. relayed from the bot worker)"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        self.published += 1
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                self.unsubscribe(subscriber)
+                self.dropped_subscribers += 1
+
+    def publish_signal(self, signal_id, signal_data, timestamp):
+        """SignalWriter listener: push a newly committed signal"""
+        self.publish('signal', signal_event_payload(signal_id, signal_data, timestamp), event_id=signal_id)
+
+    def publish_changed(self, signal_ids):
+        """SignalWriter change listener: stored signals were updated or edited"""
+        self.publish('signal_changed', {'ids': list(signal_ids)})
+
+    def publish_invalidate(self, caches):
+        """Tell web workers to drop cached data ('signals', 'config')"""
+        self.publish('invalidate', {'caches': list(caches)})
+
+    def publish_status(self, status):
+        """Push a bot status change ('running' / 'stopped')"""
+        self.forward(self.status_message(status))
+
+    def status_message(self, status):
+        return format_sse('status', {'bot_status': status})
+
+
+# Process-wide broadcaster used by the web routes
+broadcaster = EventBroadcaster()
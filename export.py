@@ -0,0 +1,275 @@
+"""Stream the stored signal history out as CSV, NDJSON or Parquet.
+
+    python export.py -f csv -o signals.csv
+    python export.py -f parquet -o signals.parquet --since 2024-01-01 --symbol BTCUSDT
+    GET /api/export?format=ndjson&since=2024-01-01&until=2024-07-01&channel=-1001234567890
+
+Signals and their TP levels are read with a single streamed query (a
+server-side cursor on PostgreSQL, SQLite steps its cursor natively),
+``chunk_size`` rows at a time, and each chunk is encoded and handed on
+before the next is fetched, so memory use does not grow with the history.
+``since`` is inclusive and ``until`` exclusive, both on the signal
+timestamp (UTC). Parquet needs pyarrow and gets one row group per chunk.
+Signals moved to the archive (see retention.py) come first, unless
+``--no-archive`` / ``archive=0`` leaves them out.
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+
+from prices import format_price
+
+DEFAULT_CHUNK_SIZE = 5000
+
+FIELDS = ('id', 'timestamp', 'symbol', 'position', 'entry', 'stop_loss', 'take_profits', 'risk_reward',
+          'source_channel', 'source_message_id', 'status', 'status_updated_at', 'original_message')
+
+# format: (mimetype, file extension)
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def parse_date(value):
+    """Naive UTC datetime from an ISO 8601 date or datetime string (None if empty)"""
+    if not value:
+        return None
+    date = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if date.tzinfo is not None:
+        date = (date - date.utcoffset()).replace(tzinfo=None)
+    return date
+
+
+def _format_time(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else None
+
+
+def iter_signal_chunks(session, since=None, until=None, symbols=None, channels=None,
+                       chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of at most ``chunk_size`` signal records (dicts with FIELDS), oldest first"""
+    from app import db
+    from models import Signal, TakeProfit
+
+    query = (db.select(Signal.id, Signal.timestamp, Signal.symbol, Signal.position, Signal.entry, Signal.stop_loss,
+                       Signal.risk_reward, Signal.source_channel, Signal.source_message_id, Signal.status,
+                       Signal.status_updated_at, Signal.original_message, TakeProfit.price)
+             .outerjoin(TakeProfit, TakeProfit.signal_id == Signal.id)
+             .order_by(Signal.id, TakeProfit.level))
+    if since is not None:
+        query = query.where(Signal.timestamp >= since)
+    if until is not None:
+        query = query.where(Signal.timestamp < until)
+    if symbols:
+        query = query.where(Signal.symbol.in_([symbol.upper() for symbol in symbols]))
+    if channels:
+        query = query.where(Signal.source_channel.in_(channels))
+
+    result = session.execute(query, execution_options={'yield_per': chunk_size})
+    chunk = []
+    record = None
+    # One row per TP level; rows of a signal are adjacent
+    for (signal_id, timestamp, symbol, position, entry, stop_loss, risk_reward, source_channel, source_message_id,
+         status, status_updated_at, original_message, price) in result:
+        if record is None or signal_id != record['id']:
+            if record is not None:
+                chunk.append(record)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            record = {
+                'id': signal_id,
+                'timestamp': timestamp,
+                'symbol': symbol,
+                'position': position,
+                'entry': entry,
+                'stop_loss': stop_loss,
+                'take_profits': [],
+                'risk_reward': risk_reward,
+                'source_channel': source_channel,
+                'source_message_id': source_message_id,
+                'status': status or 'open',
+                'status_updated_at': status_updated_at,
+                'original_message': original_message,
+            }
+        if price is not None:
+            record['take_profits'].append(price)
+    if record is not None:
+        chunk.append(record)
+    if chunk:
+        yield chunk
+
+
+def encode_csv(chunks):
+    """CSV (header first) as one bytes block per chunk; TPs are space separated"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for chunk in chunks:
+        for record in chunk:
+            writer.writerow([
+                record['id'], _format_time(record['timestamp']), record['symbol'], record['position'],
+                format_price(record['entry']), format_price(record['stop_loss']),
+                ' '.join(format_price(price) for price in record['take_profits']), record['risk_reward'],
+                record['source_channel'], record['source_message_id'], record['status'],
+                _format_time(record['status_updated_at']), record['original_message'],
+            ])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def encode_ndjson(chunks):
+    """One JSON object per line, as one bytes block per chunk"""
+    for chunk in chunks:
+        lines = []
+        for record in chunk:
+            record = dict(record, timestamp=_format_time(record['timestamp']),
+                          status_updated_at=_format_time(record['status_updated_at']))
+            lines.append(json.dumps(record, ensure_ascii=False))
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class _ChunkSink:
+    """Write-only file object that hands pyarrow's output back in pieces"""
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _parquet_modules():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    return pa, pq
+
+
+def encode_parquet(chunks):
+    """Parquet file, one row group per chunk, as bytes blocks"""
+    pa, pq = _parquet_modules()
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('timestamp', pa.timestamp('us')),
+        ('symbol', pa.string()),
+        ('position', pa.string()),
+        ('entry', pa.float64()),
+        ('stop_loss', pa.float64()),
+        ('take_profits', pa.list_(pa.float64())),
+        ('risk_reward', pa.string()),
+        ('source_channel', pa.string()),
+        ('source_message_id', pa.int64()),
+        ('status', pa.string()),
+        ('status_updated_at', pa.timestamp('us')),
+        ('original_message', pa.string()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {
+    'csv': encode_csv,
+    'ndjson': encode_ndjson,
+    'parquet': encode_parquet,
+}
+
+
+def check_format(fmt):
+    """Raise ValueError for an unknown format, RuntimeError if its library is missing"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt} (expected one of {', '.join(FORMATS)})")
+    if fmt == 'parquet':
+        _parquet_modules()
+
+
+def _history_chunks(session, include_archive, **filters):
+    if include_archive:
+        from retention import iter_archived_chunks
+        yield from iter_archived_chunks(session, **filters)
+    yield from iter_signal_chunks(session, **filters)
+
+
+def export(session, fmt, since=None, until=None, symbols=None, channels=None, chunk_size=DEFAULT_CHUNK_SIZE,
+           include_archive=True):
+    """Bytes blocks of the filtered signal history encoded as ``fmt``"""
+    check_format(fmt)
+    chunks = _history_chunks(session, include_archive, since=since, until=until, symbols=symbols,
+                             channels=channels, chunk_size=chunk_size)
+    return ENCODERS[fmt](chunks)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export the stored signal history')
+    parser.add_argument('-f', '--format', choices=sorted(FORMATS), default='csv', help='output format (default: csv)')
+    parser.add_argument('-o', '--output', help='file to write (default: stdout)')
+    parser.add_argument('--since', help='only signals at or after this UTC date/time (ISO 8601)')
+    parser.add_argument('--until', help='only signals before this UTC date/time (ISO 8601)')
+    parser.add_argument('--symbol', action='append', help='only signals for this symbol (repeatable)')
+    parser.add_argument('--channel', action='append', help='only signals from this source channel (repeatable)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='rows fetched and written at a time')
+    parser.add_argument('--no-archive', action='store_true', help='leave out archived signals (see retention.py)')
+    args = parser.parse_args(argv)
+
+    try:
+        check_format(args.format)
+        since, until = parse_date(args.since), parse_date(args.until)
+    except (ValueError, RuntimeError) as e:
+        parser.error(str(e))
+
+    from app import app, db
+
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        with app.app_context():
+            for block in export(db.session, args.format, since=since, until=until, symbols=args.symbol,
+                                channels=args.channel, chunk_size=args.chunk_size,
+                                include_archive=not args.no_archive):
+                output.write(block)
+    finally:
+        if args.output:
+            output.close()
+        else:
+            output.flush()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""Offline stand-in for the parts of TelegramClient that SignalBot uses.
+
+Replays a scripted list of channel messages into the registered NewMessage
+handlers (MessageEdited handlers for messages with an ``edit_date``) and
+records outbound sends and edits instead of talking to Telegram, so the bot
+can be driven end to end without an account or network (see
+benchmarks/replay_bot.py).
+"""
+import asyncio
+import itertools
+import time
+from datetime import datetime, timezone
+
+from telethon import events
+
+
+class FakeMessage:
+    """The attributes of a Telethon message the bot reads"""
+
+    __slots__ = ('id', 'chat_id', 'message', 'date', 'reply_to_msg_id', 'edit_date')
+
+    def __init__(self, id, chat_id, message, date=None, reply_to_msg_id=None, edit_date=None):
+        self.id = id
+        self.chat_id = chat_id
+        self.message = message
+        self.date = date or datetime.now(timezone.utc)
+        self.reply_to_msg_id = reply_to_msg_id
+        self.edit_date = edit_date
+
+
+class FakeEvent:
+    """NewMessage event wrapper"""
+
+    __slots__ = ('message', 'chat_id')
+
+    def __init__(self, message):
+        self.message = message
+        self.chat_id = message.chat_id
+
+
+class SentMessage:
+    """Outbound message captured by the fake client"""
+
+    __slots__ = ('id', 'destination', 'text', 'sent_at', 'edits')
+
+    def __init__(self, id, destination, text, sent_at):
+        self.id = id
+        self.destination = destination
+        self.text = text
+        self.sent_at = sent_at
+        self.edits = 0
+
+
+class FakeTelegramClient:
+    """Drop-in for ``TelegramClient`` that replays ``script`` on start.
+
+    ``script`` is a list of ``(offset_seconds, FakeMessage)`` pairs; offsets
+    are divided by ``speed`` (0 replays everything as one burst). Each
+    message is dispatched as its own task, like Telethon does for
+    concurrent updates. ``send_latency`` simulates the round trip of
+    ``send_message``. ``after_replay`` is awaited once every message has
+    been dispatched, before the client disconnects, e.g. to let send
+    queues drain. ``on_dispatch(message, arrived_at)`` is called as each
+    message is handed to the handlers. A scripted message with an
+    ``edit_date`` is an edit of the earlier message with the same id.
+    """
+
+    def __init__(self, session=None, api_id=None, api_hash=None, script=(), speed=1.0,
+                 send_latency=0.0, after_replay=None, on_dispatch=None, clock=time.perf_counter, **kwargs):
+        self.session = session
+        self.script = sorted(script, key=lambda item: item[0])
+        self.speed = speed
+        self.send_latency = send_latency
+        self.after_replay = after_replay
+        self.on_dispatch = on_dispatch
+        self.clock = clock
+        self.handlers = []
+        self.edit_handlers = []
+        self.sent = []
+        self.history = {}
+        self._ids = itertools.count(1)
+        self._connected = False
+        self._disconnected = None
+
+    def on(self, event_builder):
+        """Decorator registering a handler (the event filter is not applied)"""
+        def decorator(callback):
+            # MessageEdited subclasses NewMessage, so check it first
+            if isinstance(event_builder, events.MessageEdited):
+                self.edit_handlers.append(callback)
+            else:
+                self.handlers.append(callback)
+            return callback
+        return decorator
+
+    async def start(self):
+        self._connected = True
+        self._disconnected = asyncio.Event()
+        return self
+
+    def is_connected(self):
+        return self._connected
+
+    def disconnect(self):
+        self._connected = False
+        if self._disconnected is not None:
+            self._disconnected.set()
+
+    async def run_until_disconnected(self):
+        replay = asyncio.get_running_loop().create_task(self.replay())
+        try:
+            await self._disconnected.wait()
+        finally:
+            if not replay.done():
+                replay.cancel()
+            await asyncio.gather(replay, return_exceptions=True)
+
+    async def replay(self):
+        """Dispatch every scripted message at its (scaled) offset, then disconnect"""
+        loop = asyncio.get_running_loop()
+        tasks = []
+        start = loop.time()
+        for offset, message in self.script:
+            if self.speed:
+                delay = start + offset / self.speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            history = self.history.setdefault(message.chat_id, [])
+            if message.edit_date is None:
+                history.append(message)
+                handlers = self.handlers
+            else:
+                history[:] = [message if earlier.id == message.id else earlier for earlier in history]
+                handlers = self.edit_handlers
+            if self.on_dispatch:
+                self.on_dispatch(message, self.clock())
+            event = FakeEvent(message)
+            tasks.extend(loop.create_task(handler(event)) for handler in handlers)
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.after_replay:
+            await self.after_replay()
+        self.disconnect()
+
+    async def send_message(self, entity, message):
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency)
+        sent = SentMessage(next(self._ids), entity, message, self.clock())
+        self.sent.append(sent)
+        return sent
+
+    async def edit_message(self, entity, message, text):
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency)
+        for sent in self.sent:
+            if sent.id == message and sent.destination == entity:
+                sent.text = text
+                sent.edits += 1
+                return sent
+        raise ValueError(f"No message {message} in {entity} to edit")
+
+    async def get_input_entity(self, peer):
+        return peer
+
+    async def get_messages(self, entity, limit=1):
+        """Newest ``limit`` messages already replayed in ``entity``"""
+        return list(reversed(self.history.get(entity, [])[-limit:]))
+
+    async def iter_messages(self, entity, min_id=0, max_id=0, reverse=False, limit=None):
+        messages = [message for message in self.history.get(entity, [])
+                    if message.id > min_id and (not max_id or message.id < max_id)]
+        if not reverse:
+            messages.reverse()
+        for message in messages[:limit]:
+            yield message
@@ -0,0 +1,125 @@
+"""Queue-based, structured logging shared by the web app and the bot worker.
+
+Log calls only build a LogRecord and put it on a queue; a background
+listener thread does the formatting and the I/O. Records can carry
+structured fields through ``extra`` (``channel``, ``symbol``, ``stage``,
+...), which the JSON formatter emits as top-level keys. Records with a
+``category`` listed in the sample rates are kept 1 in N, so the chattiest
+lines cannot flood the log.
+
+Configured from the environment:
+
+    LOG_LEVEL=INFO      root level
+    LOG_FORMAT=json     'json' (one object per line) or 'text'
+    LOG_SAMPLE=message_received=20,no_match=20   1-in-N per category
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from threading import Lock
+
+DEFAULT_SAMPLE_RATES = {'message_received': 20, 'no_match': 20}
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RECORD_ATTRS = frozenset(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime'}
+
+_listener = None
+_setup_lock = Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with ``extra`` fields as top-level keys"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep 1 in N records of each sampled ``category``; others pass untouched"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = {category: rate for category, rate in rates.items() if rate > 1}
+        self._counts = dict.fromkeys(self.rates, 0)
+
+    def filter(self, record):
+        category = getattr(record, 'category', None)
+        rate = self.rates.get(category)
+        if rate is None:
+            return True
+        # Unlocked increment: an occasional miscount only shifts which
+        # record of the N is kept
+        count = self._counts[category]
+        self._counts[category] = count + 1
+        if count % rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread"""
+
+    def prepare(self, record):
+        return record
+
+
+def parse_sample_rates(spec):
+    """'category=N,category=N' into {category: N}"""
+    rates = {}
+    for item in (spec or '').split(','):
+        category, _, rate = item.partition('=')
+        if category.strip() and rate.strip().isdigit():
+            rates[category.strip()] = int(rate)
+    return rates
+
+
+def setup_logging(level=None, log_format=None, sample_rates=None, stream=None):
+    """Route all logging through a queue to a background writer (idempotent)"""
+    global _listener
+
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+
+        level = level or os.environ.get('LOG_LEVEL', 'INFO')
+        log_format = log_format or os.environ.get('LOG_FORMAT', 'json')
+        if sample_rates is None:
+            sample_rates = dict(DEFAULT_SAMPLE_RATES, **parse_sample_rates(os.environ.get('LOG_SAMPLE')))
+
+        output = logging.StreamHandler(stream or sys.stderr)
+        if log_format == 'json':
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+        log_queue = queue.SimpleQueue()
+        handler = DeferredQueueHandler(log_queue)
+        handler.addFilter(SamplingFilter(sample_rates))
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        return _listener
@@ -1,4 +1,6 @@
-from app import app
+from app import app, init_db
 
 if __name__ == '__main__':
+    # Development server: create or upgrade the schema first
+    init_db()
     app.run(host='0.0.0.0', port=5000, debug=True)
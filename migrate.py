@@ -0,0 +1,204 @@
+"""Schema upgrades for databases created by earlier versions.
+
+Run as part of the explicit schema step (``app.init_db``), e.g. before
+starting the web and bot workers on deploy:
+
+    python migrate.py
+"""
+import json
+import logging
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from prices import parse_price
+from search import ensure_search_index
+
+logger = logging.getLogger(__name__)
+
+# Columns of the original string-typed Signal table
+LEGACY_SIGNAL_COLUMNS = ('entry', 'stop_loss', 'take_profits')
+
+# SchemaMigration name recorded once the legacy prices are copied
+TYPED_PRICES_MIGRATION = 'signal_typed_prices'
+
+
+def migration_applied(engine, name):
+    from models import SchemaMigration
+
+    table = SchemaMigration.__table__
+    table.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        return conn.execute(table.select().where(table.c.name == name)).first() is not None
+
+
+def record_migration(engine, name):
+    from models import SchemaMigration
+
+    with engine.begin() as conn:
+        conn.execute(SchemaMigration.__table__.insert(), {'name': name, 'applied_at': datetime.utcnow()})
+
+
+def drop_legacy_columns(engine, columns):
+    """Drop whichever legacy price columns are still present; returns those that could not be dropped"""
+    remaining = []
+    for column in LEGACY_SIGNAL_COLUMNS:
+        if column not in columns:
+            continue
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE signal DROP COLUMN {column}'))
+        except Exception as e:
+            # Older SQLite builds cannot drop columns
+            logger.debug(f"Could not drop legacy column signal.{column}: {str(e)}")
+            remaining.append(column)
+    return remaining
+
+
+def upgrade_signal_schema(db, batch_size=1000):
+    """Convert the legacy signal table to numeric prices and a take_profit table.
+
+    Idempotent: returns False when there is nothing to do. Rows are copied in
+    id-ordered batches, each in its own transaction, so an interrupted run can
+    simply be repeated. Only rows whose new price columns are still empty are
+    copied, and completion is recorded as a ``SchemaMigration``, so legacy
+    columns that cannot be dropped never cause rows written since to be
+    copied over again.
+    """
+    from models import Signal, TakeProfit
+
+    engine = db.engine
+    inspector = inspect(engine)
+    if 'signal' not in inspector.get_table_names():
+        return False
+
+    columns = {column['name'] for column in inspector.get_columns('signal')}
+    if 'take_profits' not in columns:
+        return False
+    if migration_applied(engine, TYPED_PRICES_MIGRATION):
+        # Left behind by a drop that failed; retried in case SQLite was upgraded
+        drop_legacy_columns(engine, columns)
+        return False
+
+    logger.info("Upgrading signal table to the typed schema")
+
+    with engine.begin() as conn:
+        if 'entry_price' not in columns:
+            conn.execute(text('ALTER TABLE signal ADD COLUMN entry_price NUMERIC(20, 8)'))
+        if 'stop_loss_price' not in columns:
+            conn.execute(text('ALTER TABLE signal ADD COLUMN stop_loss_price NUMERIC(20, 8)'))
+    TakeProfit.__table__.create(engine, checkfirst=True)
+
+    take_profit_table = TakeProfit.__table__
+    last_id = 0
+    migrated = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                text('SELECT id, entry, stop_loss, take_profits FROM signal '
+                     'WHERE id > :last_id AND entry_price IS NULL AND stop_loss_price IS NULL '
+                     'AND (entry IS NOT NULL OR stop_loss IS NOT NULL OR take_profits IS NOT NULL) '
+                     'ORDER BY id LIMIT :limit'),
+                {'last_id': last_id, 'limit': batch_size}
+            ).fetchall()
+            if not rows:
+                break
+
+            updates = []
+            take_profits = []
+            for row in rows:
+                updates.append({
+                    'id': row.id,
+                    'entry_price': parse_price(row.entry),
+                    'stop_loss_price': parse_price(row.stop_loss),
+                })
+                try:
+                    levels = json.loads(row.take_profits) if row.take_profits else []
+                except ValueError:
+                    levels = []
+                for level, value in enumerate(levels, 1):
+                    price = parse_price(value)
+                    if price is not None:
+                        take_profits.append({'signal_id': row.id, 'level': level, 'price': price})
+
+            conn.execute(
+                text('UPDATE signal SET entry_price = :entry_price, stop_loss_price = :stop_loss_price '
+                     'WHERE id = :id'),
+                updates
+            )
+            # Clear rows a previous, interrupted run may already have copied
+            ids = [row.id for row in rows]
+            conn.execute(take_profit_table.delete().where(take_profit_table.c.signal_id.in_(ids)))
+            if take_profits:
+                conn.execute(take_profit_table.insert(), take_profits)
+
+            last_id = rows[-1].id
+            migrated += len(rows)
+
+    ensure_indexes(db, Signal)
+    record_migration(engine, TYPED_PRICES_MIGRATION)
+
+    remaining = drop_legacy_columns(engine, columns)
+    if remaining:
+        logger.warning(f"Could not drop legacy columns {', '.join(f'signal.{column}' for column in remaining)}; "
+                       f"they are no longer read, and the migration will not run again")
+
+    logger.info(f"Signal table upgraded ({migrated} rows migrated)")
+    return True
+
+
+# Nullable columns added after the first release, per table
+ADDED_COLUMNS = {
+    'config': {'routes': 'TEXT'},
+    'signal': {'source_message_id': 'BIGINT', 'status': "VARCHAR(20) DEFAULT 'open'",
+               'status_updated_at': 'TIMESTAMP'},
+    'signal_duplicate': {'source_message_id': 'BIGINT'},
+}
+
+
+def add_missing_columns(db, table_name, columns):
+    """ALTER TABLE ADD COLUMN for each of ``columns`` ({name: SQL type}) not present yet"""
+    inspector = inspect(db.engine)
+    if table_name not in inspector.get_table_names():
+        return False
+
+    existing = {column['name'] for column in inspector.get_columns(table_name)}
+    missing = [(name, sql_type) for name, sql_type in columns.items() if name not in existing]
+    if not missing:
+        return False
+
+    with db.engine.begin() as conn:
+        for name, sql_type in missing:
+            conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {name} {sql_type}'))
+            logger.info(f"Added {table_name}.{name} column")
+    return True
+
+
+def ensure_indexes(db, model):
+    """Create any index declared on ``model`` that the database lacks (once its table exists)"""
+    if not inspect(db.engine).has_table(model.__tablename__):
+        return
+    for index in model.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+
+
+def upgrade_all(db):
+    """Apply every schema upgrade; returns True if anything changed"""
+    from models import Signal, SignalDuplicate
+
+    changed = False
+    for table_name, columns in ADDED_COLUMNS.items():
+        changed = add_missing_columns(db, table_name, columns) or changed
+    changed = upgrade_signal_schema(db) or changed
+    ensure_indexes(db, Signal)
+    ensure_indexes(db, SignalDuplicate)
+    changed = ensure_search_index(db) or changed
+    return changed
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    from app import init_db
+
+    init_db()
+    print("Database schema is up to date")
@@ -1,6 +1,7 @@
 from app import db
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
+from prices import format_price
 
 class Config(db.Model):
     """Configuration model for storing bot settings"""
@@ -10,6 +11,7 @@ class Config(db.Model):
     session_name = db.Column(db.String(50), default='signal_bot')
     from_channels = db.Column(db.Text)  # JSON string of channel IDs/usernames
     to_channel = db.Column(db.String(100))
+    routes = db.Column(db.Text)  # JSON list of forwarding rules (see routing.py)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -24,26 +26,278 @@ class Config(db.Model):
 
 class Signal(db.Model):
     """Model for storing parsed trading signals"""
+    __table_args__ = (
+        db.Index('ix_signal_timestamp', 'timestamp'),
+        db.Index('ix_signal_symbol_timestamp', 'symbol', 'timestamp'),
+        db.Index('ix_signal_source_channel_timestamp', 'source_channel', 'timestamp'),
+        db.Index('ix_signal_source_message', 'source_channel', 'source_message_id'),
+        db.Index('ix_signal_status', 'status'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     symbol = db.Column(db.String(20))
     position = db.Column(db.String(10))  # BUY/SELL
-    entry = db.Column(db.String(20))
-    stop_loss = db.Column(db.String(20))
-    take_profits = db.Column(db.Text)  # JSON string of TP levels
+    entry = db.Column('entry_price', db.Numeric(20, 8, asdecimal=False))
+    stop_loss = db.Column('stop_loss_price', db.Numeric(20, 8, asdecimal=False))
     risk_reward = db.Column(db.String(20))
     source_channel = db.Column(db.String(100))
     formatted_signal = db.Column(db.Text)
     original_message = db.Column(db.Text)
+    source_message_id = db.Column(db.BigInteger)  # Telegram message id in source_channel
+    status = db.Column(db.String(20), default='open')  # open, tp1, stopped, closed, ... (see signal_index.py)
+    status_updated_at = db.Column(db.DateTime)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
+    take_profit_levels = db.relationship('TakeProfit', order_by='TakeProfit.level',
+                                         cascade='all, delete-orphan', lazy='selectin')
+    
     def get_take_profits_list(self):
-        """Get take_profits as a Python list"""
-        if self.take_profits:
-            try:
-                return json.loads(self.take_profits)
-            except:
-                return []
-        return []
+        """Get take profit prices as a list of strings, in TP order"""
+        return [format_price(tp.price) for tp in self.take_profit_levels]
+    
+    def to_dict(self):
+        """Serialize for the JSON API"""
+        return {
+            'id': self.id,
+            'symbol': self.symbol,
+            'position': self.position,
+            'entry': format_price(self.entry),
+            'stop_loss': format_price(self.stop_loss),
+            'take_profits': self.get_take_profits_list(),
+            'risk_reward': self.risk_reward,
+            'source_channel': self.source_channel,
+            'status': self.status or 'open',
+            'timestamp': self.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            'formatted_signal': self.formatted_signal
+        }
     
     def __repr__(self):
         return f'<Signal {self.symbol} {self.position} @ {self.timestamp}>'
+
+class TakeProfit(db.Model):
+    """One take-profit level of a signal (TP1, TP2, ...)"""
+    __table_args__ = (
+        db.Index('ix_take_profit_signal_level', 'signal_id', 'level'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    signal_id = db.Column(db.Integer, db.ForeignKey('signal.id'), nullable=False)
+    level = db.Column(db.Integer, nullable=False)  # 1-based TP number
+    price = db.Column(db.Numeric(20, 8, asdecimal=False), nullable=False)
+    
+    def __repr__(self):
+        return f'<TakeProfit TP{self.level} {self.price} of {self.signal_id}>'
+
+class SignalUpdate(db.Model):
+    """A follow-up message (TP hit, SL moved, cancelled, ...) about a signal"""
+    id = db.Column(db.Integer, primary_key=True)
+    signal_id = db.Column(db.Integer, db.ForeignKey('signal.id'), nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False)  # tp_hit, sl_hit, move_sl, ... (see signal_parser.py), or edited
+    level = db.Column(db.Integer)  # TP number for tp_hit
+    price = db.Column(db.Numeric(20, 8, asdecimal=False))  # new stop for move_sl
+    status = db.Column(db.String(20))  # signal status after this update
+    source_channel = db.Column(db.String(100))
+    source_message_id = db.Column(db.BigInteger)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'level': self.level,
+            'price': format_price(self.price),
+            'status': self.status,
+            'source_channel': self.source_channel,
+            'timestamp': self.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+        }
+    
+    def __repr__(self):
+        return f'<SignalUpdate {self.kind} of {self.signal_id}>'
+
+class ForwardedMessage(db.Model):
+    """Message id a signal was forwarded as, per destination, so source edits can edit it"""
+    signal_id = db.Column(db.Integer, db.ForeignKey('signal.id'), primary_key=True)
+    destination = db.Column(db.String(100), primary_key=True)
+    message_id = db.Column(db.BigInteger, nullable=False)
+    
+    def __repr__(self):
+        return f'<ForwardedMessage {self.message_id} in {self.destination} of {self.signal_id}>'
+
+class SignalDuplicate(db.Model):
+    """Repeat of an already stored signal, usually re-posted by another channel"""
+    __table_args__ = (
+        db.Index('ix_signal_duplicate_source_message', 'source_channel', 'source_message_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    signal_id = db.Column(db.Integer, db.ForeignKey('signal.id'), index=True)
+    source_channel = db.Column(db.String(100))
+    source_message_id = db.Column(db.BigInteger)  # the repost, so its edits can be recognised
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SignalDuplicate of {self.signal_id} from {self.source_channel}>'
+
+class SignalCounter(db.Model):
+    """Named counters kept up to date by writers, so readers avoid COUNT(*)"""
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    
+    TOTAL_SIGNALS = 'total_signals'
+    # Bumped whenever stored signals change in place (status updates, edits,
+    # cleared history), so /api/signals ETags change with them
+    SIGNAL_REVISION = 'signal_revision'
+    
+    @classmethod
+    def get(cls, name):
+        """Current value of a counter (0 if it does not exist)"""
+        counter = db.session.get(cls, name)
+        return counter.value if counter else 0
+    
+    @classmethod
+    def increment(cls, session, name, amount=1):
+        """Add to a counter inside the caller's transaction"""
+        session.execute(
+            db.update(cls).where(cls.name == name).values(value=cls.value + amount)
+        )
+    
+    @classmethod
+    def reset(cls, session, name, value=0):
+        session.execute(db.update(cls).where(cls.name == name).values(value=value))
+    
+    @classmethod
+    def ensure(cls, name, initial):
+        """Create a counter seeded by ``initial()`` if it does not exist yet"""
+        if db.session.get(cls, name) is None:
+            db.session.add(cls(name=name, value=initial()))
+            db.session.commit()
+
+class SignalRollup(db.Model):
+    """Signal counts per time bucket, source channel and symbol.
+    
+    Kept up to date by the writer in the same transaction as the signals,
+    at minute, hour and day resolution, so activity stats read a few
+    buckets instead of grouping the signal table (see stats.py).
+    """
+    resolution = db.Column(db.String(10), primary_key=True)  # minute, hour, day
+    bucket = db.Column(db.DateTime, primary_key=True)  # UTC start of the bucket
+    source_channel = db.Column(db.String(100), primary_key=True)
+    symbol = db.Column(db.String(20), primary_key=True)
+    signals = db.Column(db.Integer, nullable=False, default=0)
+    buys = db.Column(db.Integer, nullable=False, default=0)
+    sells = db.Column(db.Integer, nullable=False, default=0)
+    
+    # resolution: (bucket length, how long its buckets are kept; None = forever)
+    RESOLUTIONS = {
+        'minute': (timedelta(minutes=1), timedelta(days=2)),
+        'hour': (timedelta(hours=1), timedelta(days=90)),
+        'day': (timedelta(days=1), None),
+    }
+    
+    @classmethod
+    def bucket_start(cls, resolution, timestamp):
+        """Start of the ``resolution`` bucket holding ``timestamp``"""
+        if resolution == 'minute':
+            return timestamp.replace(second=0, microsecond=0)
+        if resolution == 'hour':
+            return timestamp.replace(minute=0, second=0, microsecond=0)
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    @classmethod
+    def count(cls, counts, timestamp, source_channel, symbol, position, amount=1, resolutions=None):
+        """Add one signal to ``counts`` ({key: [signals, buys, sells]}) at every resolution"""
+        side = (position or '').upper()
+        for resolution in resolutions or cls.RESOLUTIONS:
+            key = (resolution, cls.bucket_start(resolution, timestamp), source_channel or '', symbol or '')
+            totals = counts.setdefault(key, [0, 0, 0])
+            totals[0] += amount
+            if side == 'BUY':
+                totals[1] += amount
+            elif side == 'SELL':
+                totals[2] += amount
+        return counts
+    
+    @classmethod
+    def apply(cls, session, counts):
+        """Add ``counts`` (from ``count``) to the stored buckets inside the caller's transaction"""
+        rows = [{'resolution': resolution, 'bucket': bucket, 'source_channel': source_channel, 'symbol': symbol,
+                 'signals': signals, 'buys': buys, 'sells': sells}
+                for (resolution, bucket, source_channel, symbol), (signals, buys, sells) in counts.items()
+                if signals or buys or sells]
+        if not rows:
+            return
+        
+        dialect = session.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            # One upsert for the whole batch
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            statement = insert(cls)
+            session.execute(statement.on_conflict_do_update(
+                index_elements=['resolution', 'bucket', 'source_channel', 'symbol'],
+                set_={'signals': cls.signals + statement.excluded.signals,
+                      'buys': cls.buys + statement.excluded.buys,
+                      'sells': cls.sells + statement.excluded.sells}
+            ), rows)
+            return
+        
+        # Elsewhere update, then insert what did not exist; only the writer
+        # thread calls this, so the two steps do not race
+        new_rows = []
+        for row in rows:
+            result = session.execute(
+                db.update(cls)
+                .where(cls.resolution == row['resolution'], cls.bucket == row['bucket'],
+                       cls.source_channel == row['source_channel'], cls.symbol == row['symbol'])
+                .values(signals=cls.signals + row['signals'], buys=cls.buys + row['buys'],
+                        sells=cls.sells + row['sells'])
+            )
+            if result.rowcount == 0:
+                new_rows.append(row)
+        if new_rows:
+            session.execute(db.insert(cls), new_rows)
+    
+    @classmethod
+    def prune(cls, session, now):
+        """Delete buckets past their resolution's retention"""
+        for resolution, (_, keep) in cls.RESOLUTIONS.items():
+            if keep is not None:
+                session.execute(db.delete(cls).where(cls.resolution == resolution, cls.bucket < now - keep))
+    
+    def __repr__(self):
+        return f'<SignalRollup {self.resolution} {self.bucket} {self.source_channel} {self.symbol}>'
+
+class ArchiveSegment(db.Model):
+    """One month of archived signals: a compressed, append-only file (see retention.py).
+    
+    ``size`` is the committed length of the file; bytes past it belong to
+    an archive run that did not commit and are ignored and overwritten.
+    """
+    month = db.Column(db.String(7), primary_key=True)  # YYYY-MM of the signal timestamps
+    filename = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False, default=0)
+    rows = db.Column(db.Integer, nullable=False, default=0)
+    first_timestamp = db.Column(db.DateTime)
+    last_timestamp = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ArchiveSegment {self.month} {self.rows} rows>'
+
+class ChannelCheckpoint(db.Model):
+    """Last processed message id per source channel, for catching up after restarts"""
+    channel = db.Column(db.String(100), primary_key=True)
+    last_message_id = db.Column(db.BigInteger, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ChannelCheckpoint {self.channel} @ {self.last_message_id}>'
+
+class SchemaMigration(db.Model):
+    """A one-off data migration that has completed (see migrate.py)"""
+    name = db.Column(db.String(100), primary_key=True)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SchemaMigration {self.name}>'
@@ -0,0 +1,454 @@
+"""Score stored signals against local OHLC price history.
+
+    python outcomes.py --prices data/ohlc -o outcomes.json
+    python outcomes.py --prices data/ohlc --channel -1001234567890 --max-bars 20160
+
+``--prices`` is a directory with one ``<SYMBOL>.csv`` or ``<SYMBOL>.parquet``
+file per symbol, holding ``time``, ``high``, ``low`` and ``close`` columns
+(``open`` and any other columns are ignored). ``time`` is the bar open time
+in UTC, as epoch seconds/milliseconds or ISO 8601.
+
+A signal is taken as filled at its entry price when posted and is followed
+bar by bar for at most ``max_bars`` bars, starting with the first bar that
+opens after it was posted. For each signal the evaluation reports which
+TPs were reached before the stop loss, the outcome (``tpN`` for the highest
+TP reached, ``sl``, ``open`` if neither was reached in the window,
+``no_data`` or ``invalid``), the time until that outcome and the realized R
+multiple. R assumes the position is closed in equal parts at each TP; parts
+whose TP was not reached are closed at the stop if it was hit, otherwise at
+the last close of the window. When a TP and the stop fall in the same bar,
+the stop is assumed to have been hit first.
+
+Nothing loops over signals or bars in Python: for every (signal, level)
+pair the first bar reaching the level is found at once for all pairs, by a
+binary descent over a sparse table of range maxima (O(log max_bars) numpy
+operations per symbol).
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+DEFAULT_MAX_BARS = 7 * 24 * 60  # a week of minute bars
+
+NO_HIT = np.iinfo(np.int64).max
+
+# Outcome codes of EvaluationResult.outcome_codes; 1..n are 'tp1'..'tpn'
+NO_DATA = -3
+INVALID = -2
+STOPPED = -1
+OPEN = 0
+
+_COLUMN_NAMES = {
+    'time': ('time', 'timestamp', 'datetime', 'date', 'open_time'),
+    'high': ('high', 'h'),
+    'low': ('low', 'l'),
+    'close': ('close', 'c'),
+}
+
+
+class Bars:
+    """OHLC bars of one symbol as numpy arrays, sorted by time"""
+
+    __slots__ = ('time', 'high', 'low', 'close')
+
+    def __init__(self, time, high, low, close):
+        order = np.argsort(time, kind='stable')
+        self.time = np.asarray(time, dtype=np.int64)[order]
+        self.high = np.asarray(high, dtype=np.float64)[order]
+        self.low = np.asarray(low, dtype=np.float64)[order]
+        self.close = np.asarray(close, dtype=np.float64)[order]
+
+    def __len__(self):
+        return len(self.time)
+
+
+def _to_epoch(values):
+    """Epoch seconds (int64) from epoch s/ms numbers, ISO strings or datetime64"""
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype('datetime64[s]').astype(np.int64)
+    try:
+        seconds = values.astype(np.float64)
+    except ValueError:
+        text = np.char.rstrip(values.astype(str), 'Z')
+        return text.astype('datetime64[s]').astype(np.int64)
+    if len(seconds) and np.nanmax(seconds) > 1e11:
+        seconds = seconds / 1000.0
+    return seconds.astype(np.int64)
+
+
+def _find_columns(header, path):
+    names = [name.strip().lower() for name in header]
+    columns = {}
+    for column, aliases in _COLUMN_NAMES.items():
+        for alias in aliases:
+            if alias in names:
+                columns[column] = names.index(alias)
+                break
+        else:
+            raise ValueError(f"{path}: no '{column}' column (expected one of {', '.join(aliases)})")
+    return columns
+
+
+def _read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        columns = _find_columns(next(csv.reader(f)), path)
+        usecols = [columns[name] for name in ('time', 'high', 'low', 'close')]
+        data = np.loadtxt(f, delimiter=',', dtype=str, usecols=usecols, ndmin=2)
+    return Bars(_to_epoch(data[:, 0]), data[:, 1].astype(np.float64),
+                data[:, 2].astype(np.float64), data[:, 3].astype(np.float64))
+
+
+def _read_parquet(path):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError(f"Reading {path} requires pyarrow (pip install pyarrow)")
+    table = pq.read_table(path)
+    columns = _find_columns(table.column_names, path)
+    data = [table.column(columns[name]).to_numpy() for name in ('time', 'high', 'low', 'close')]
+    return Bars(_to_epoch(data[0]), data[1], data[2], data[3])
+
+
+def load_bars(path):
+    """Read one symbol's bars from a .csv or .parquet file"""
+    if path.lower().endswith('.parquet'):
+        return _read_parquet(path)
+    return _read_csv(path)
+
+
+def price_files(directory):
+    """{SYMBOL: path} for the .csv/.parquet files in ``directory``"""
+    files = {}
+    for name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() in ('.csv', '.parquet'):
+            files.setdefault(stem.upper(), os.path.join(directory, name))
+    return files
+
+
+class SignalArrays:
+    """Stored signals as parallel arrays; ``tps`` is (signals x levels), NaN-padded"""
+
+    __slots__ = ('id', 'symbol', 'channel', 'side', 'entry', 'stop_loss', 'time', 'tps')
+
+    def __init__(self, id, symbol, channel, side, entry, stop_loss, time, tps):
+        self.id = id
+        self.symbol = symbol
+        self.channel = channel
+        self.side = side
+        self.entry = entry
+        self.stop_loss = stop_loss
+        self.time = time
+        self.tps = tps
+
+    def __len__(self):
+        return len(self.id)
+
+
+def load_signals(session, channels=None, symbols=None, since=None):
+    """Read signals and their TP levels from the database into SignalArrays"""
+    from app import db
+    from models import Signal, TakeProfit
+
+    query = db.select(Signal.id, Signal.symbol, Signal.source_channel, Signal.position,
+                       Signal.entry, Signal.stop_loss, Signal.timestamp).order_by(Signal.id)
+    if channels:
+        query = query.where(Signal.source_channel.in_(channels))
+    if symbols:
+        query = query.where(Signal.symbol.in_([symbol.upper() for symbol in symbols]))
+    if since is not None:
+        query = query.where(Signal.timestamp >= since)
+    rows = session.execute(query).all()
+
+    if not rows:
+        empty = np.empty(0)
+        return SignalArrays(np.empty(0, dtype=np.int64), np.empty(0, dtype=object), np.empty(0, dtype=object),
+                            np.empty(0, dtype=np.int8), empty, empty, np.empty(0, dtype=np.int64), np.empty((0, 0)))
+
+    ids, symbol, channel, position, entry, stop_loss, timestamp = zip(*rows)
+    ids = np.array(ids, dtype=np.int64)
+    side = np.where(np.char.upper(np.array(position, dtype=str)) == 'SELL', -1, 1).astype(np.int8)
+
+    query = db.select(TakeProfit.signal_id, TakeProfit.level, TakeProfit.price).where(
+        TakeProfit.signal_id.between(int(ids[0]), int(ids[-1])))
+    tp_rows = session.execute(query).all()
+    if tp_rows:
+        tp_ids, tp_levels, tp_prices = (np.array(column) for column in zip(*tp_rows))
+        rows_of = np.searchsorted(ids, tp_ids)
+        known = (rows_of < len(ids)) & (ids[np.minimum(rows_of, len(ids) - 1)] == tp_ids) & (tp_levels >= 1)
+        tps = np.full((len(ids), int(tp_levels[known].max()) if known.any() else 0), np.nan)
+        tps[rows_of[known], tp_levels[known].astype(np.int64) - 1] = tp_prices[known].astype(np.float64)
+    else:
+        tps = np.full((len(ids), 0), np.nan)
+
+    return SignalArrays(
+        ids,
+        np.array([value or '' for value in symbol], dtype=object),
+        np.array([value or '' for value in channel], dtype=object),
+        side,
+        np.array([np.nan if value is None else value for value in entry], dtype=np.float64),
+        np.array([np.nan if value is None else value for value in stop_loss], dtype=np.float64),
+        np.array(timestamp, dtype='datetime64[s]').astype(np.int64),
+        tps,
+    )
+
+
+class _FirstReach:
+    """First index at or after ``start`` (and before ``end``) where ``values >= level``.
+
+    ``tables[k][i]`` is the maximum of ``values[i:i + 2**k]``. A query skips
+    ahead by 2**k while that whole window stays below its level, trying the
+    largest windows first, which lands on the first reaching bar in
+    O(log horizon) steps; all queries take each step together.
+    """
+
+    def __init__(self, values, horizon):
+        self.tables = [values]
+        step = 1
+        while step * 2 <= horizon and step * 2 <= len(values):
+            previous = self.tables[-1]
+            self.tables.append(np.maximum(previous[:-step], previous[step:]))
+            step *= 2
+
+    def find(self, start, level, end):
+        values = self.tables[0]
+        position = start.copy()
+        for k in range(len(self.tables) - 1, -1, -1):
+            table = self.tables[k]
+            step = 1 << k
+            window_max = table[np.minimum(position, len(table) - 1)]
+            position += ((position + step <= end) & (window_max < level)) * step
+        reached = position < end
+        reached[reached] = values[position[reached]] >= level[reached]
+        return np.where(reached, position, NO_HIT)
+
+
+class EvaluationResult:
+    """Per-signal outcome arrays, aligned with the SignalArrays that were evaluated"""
+
+    def __init__(self, signals, outcome_codes, tp_hit, r_multiple, seconds_to_outcome):
+        self.signals = signals
+        self.outcome_codes = outcome_codes
+        self.tp_hit = tp_hit
+        self.r_multiple = r_multiple
+        self.seconds_to_outcome = seconds_to_outcome
+
+    def outcomes(self):
+        """Outcome label of every signal"""
+        labels = {NO_DATA: 'no_data', INVALID: 'invalid', STOPPED: 'sl', OPEN: 'open'}
+        codes = self.outcome_codes
+        names = np.array([labels.get(code, f'tp{code}') for code in range(NO_DATA, int(codes.max(initial=0)) + 1)])
+        return names[codes - NO_DATA]
+
+    def records(self):
+        """One dict per signal, for JSON output"""
+        outcomes = self.outcomes()
+        for i in range(len(self.signals)):
+            r = self.r_multiple[i]
+            seconds = self.seconds_to_outcome[i]
+            yield {
+                'id': int(self.signals.id[i]),
+                'symbol': self.signals.symbol[i],
+                'source_channel': self.signals.channel[i],
+                'outcome': str(outcomes[i]),
+                'tps_hit': [int(level) + 1 for level in np.flatnonzero(self.tp_hit[i])],
+                'r_multiple': None if np.isnan(r) else round(float(r), 4),
+                'seconds_to_outcome': None if seconds < 0 else int(seconds),
+            }
+
+    def summarize(self, by='channel'):
+        """Per-channel or per-symbol statistics, keyed by the group value"""
+        keys = self.signals.channel if by == 'channel' else self.signals.symbol
+        if not len(keys):
+            return {}
+        groups, group_of = np.unique(keys.astype(str), return_inverse=True)
+        count = len(groups)
+
+        def total(mask, weights=None):
+            return np.bincount(group_of[mask], weights=None if weights is None else weights[mask], minlength=count)
+
+        codes = self.outcome_codes
+        evaluated = codes >= STOPPED
+        decided = (codes == STOPPED) | (codes > OPEN)
+        r = self.r_multiple
+        has_r = evaluated & ~np.isnan(r)
+        timed = decided & (self.seconds_to_outcome >= 0)
+
+        signals = total(np.ones(len(codes), dtype=bool))
+        evaluated_count = total(evaluated)
+        wins = total(codes > OPEN)
+        losses = total(codes == STOPPED)
+        still_open = total(codes == OPEN)
+        r_count = total(has_r)
+        r_sum = total(has_r, r)
+        timed_count = total(timed)
+        seconds_sum = total(timed, self.seconds_to_outcome.astype(np.float64))
+        tp_levels = self.tp_hit.shape[1]
+        tp_counts = [total(self.tp_hit[:, level]) for level in range(tp_levels)]
+
+        summary = {}
+        for g, key in enumerate(groups):
+            closed = wins[g] + losses[g]
+            summary[key] = {
+                'signals': int(signals[g]),
+                'evaluated': int(evaluated_count[g]),
+                'wins': int(wins[g]),
+                'losses': int(losses[g]),
+                'open': int(still_open[g]),
+                'win_rate': round(float(wins[g] / closed), 4) if closed else None,
+                'total_r': round(float(r_sum[g]), 4),
+                'avg_r': round(float(r_sum[g] / r_count[g]), 4) if r_count[g] else None,
+                'avg_seconds_to_outcome': round(float(seconds_sum[g] / timed_count[g]), 1) if timed_count[g] else None,
+                'tp_hits': [int(tp_counts[level][g]) for level in range(tp_levels)],
+            }
+        return summary
+
+
+def evaluate(signals, bars_by_symbol, max_bars=DEFAULT_MAX_BARS):
+    """Evaluate every signal against ``bars_by_symbol`` ({SYMBOL: Bars})"""
+    n = len(signals)
+    levels = signals.tps.shape[1]
+    outcome_codes = np.full(n, NO_DATA, dtype=np.int64)
+    tp_hit = np.zeros((n, levels), dtype=bool)
+    r_multiple = np.full(n, np.nan)
+    seconds_to_outcome = np.full(n, -1, dtype=np.int64)
+
+    risk = np.abs(signals.entry - signals.stop_loss)
+    valid = np.isfinite(risk) & (risk > 0)
+    symbols = np.char.upper(signals.symbol.astype(str)) if n else np.empty(0, dtype=str)
+
+    for symbol in np.unique(symbols):
+        bars = bars_by_symbol.get(symbol)
+        if bars is None or not len(bars):
+            continue
+        rows = np.flatnonzero(symbols == symbol)
+        start = np.searchsorted(bars.time, signals.time[rows], side='right')
+        covered = start < len(bars)
+        outcome_codes[rows[covered & ~valid[rows]]] = INVALID
+        keep = covered & valid[rows]
+        rows, start = rows[keep], start[keep]
+        if not len(rows):
+            continue
+
+        end = np.minimum(start + max_bars, len(bars))
+        side = signals.side[rows].astype(np.float64)
+        entry = signals.entry[rows]
+        stop = signals.stop_loss[rows]
+        tps = signals.tps[rows]
+
+        # A long reaches a price when the high gets to it, a short when the
+        # low does; negating lows turns both into "max >= level" searches
+        rising = _FirstReach(bars.high, max_bars)
+        falling = _FirstReach(-bars.low, max_bars)
+
+        def first_reach(use_rising, start, level, end):
+            found = np.full(len(start), NO_HIT, dtype=np.int64)
+            for table, mask in ((rising, use_rising), (falling, ~use_rising)):
+                if mask.any():
+                    found[mask] = table.find(start[mask], level[mask], end[mask])
+            return found
+
+        long = side > 0
+        stop_bar = first_reach(~long, start, -side * stop, end)
+
+        tp_rows, tp_levels = np.nonzero(np.isfinite(tps))
+        tp_bar = np.full(tps.shape, NO_HIT, dtype=np.int64)
+        if len(tp_rows):
+            tp_bar[tp_rows, tp_levels] = first_reach(long[tp_rows], start[tp_rows],
+                                                     side[tp_rows] * tps[tp_rows, tp_levels], end[tp_rows])
+
+        # Ties go to the stop: a TP only counts if reached in an earlier bar
+        hit = tp_bar < stop_bar[:, None]
+        stopped = stop_bar != NO_HIT
+        reached = hit.any(axis=1)
+        best = np.where(reached, levels - np.argmax(hit[:, ::-1], axis=1), 0)
+        codes = np.where(reached, best, np.where(stopped, STOPPED, OPEN))
+
+        decided_bar = np.where(reached, tp_bar[np.arange(len(rows)), np.maximum(best - 1, 0)], stop_bar)
+        decided = decided_bar != NO_HIT
+        seconds = np.full(len(rows), -1, dtype=np.int64)
+        seconds[decided] = bars.time[decided_bar[decided]] - signals.time[rows[decided]]
+
+        rest_price = np.where(stopped, stop, bars.close[end - 1])
+        rest_r = side * (rest_price - entry) / risk[rows]
+        tp_r = side[:, None] * (tps - entry[:, None]) / risk[rows, None]
+        has_tp = np.isfinite(tps)
+        parts = has_tp.sum(axis=1)
+        part_r = np.where(hit, tp_r, rest_r[:, None])
+        r = np.where(parts > 0, np.where(has_tp, part_r, 0.0).sum(axis=1) / np.maximum(parts, 1), rest_r)
+
+        outcome_codes[rows] = codes
+        tp_hit[rows] = hit
+        r_multiple[rows] = r
+        seconds_to_outcome[rows] = seconds
+
+    outcome_codes[~valid & (outcome_codes != NO_DATA)] = INVALID
+    return EvaluationResult(signals, outcome_codes, tp_hit, r_multiple, seconds_to_outcome)
+
+
+def load_price_data(directory, symbols):
+    """Bars for each of ``symbols`` that has a price file in ``directory``"""
+    files = price_files(directory)
+    return {symbol: load_bars(files[symbol]) for symbol in symbols if symbol in files}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Evaluate stored signals against local OHLC data')
+    parser.add_argument('--prices', required=True, help='directory of <SYMBOL>.csv / <SYMBOL>.parquet bar files')
+    parser.add_argument('--channel', action='append', help='only signals from this source channel (repeatable)')
+    parser.add_argument('--symbol', action='append', help='only signals for this symbol (repeatable)')
+    parser.add_argument('--max-bars', type=int, default=DEFAULT_MAX_BARS,
+                        help=f'bars to follow each signal for (default: {DEFAULT_MAX_BARS})')
+    parser.add_argument('-o', '--output', help='write the summary JSON here (default: stdout)')
+    parser.add_argument('--per-signal', help='also write one NDJSON outcome per signal to this file')
+    args = parser.parse_args(argv)
+
+    from app import app, db
+
+    with app.app_context():
+        started = time.perf_counter()
+        signals = load_signals(db.session, channels=args.channel, symbols=args.symbol)
+        loaded_signals = time.perf_counter()
+
+    symbols = set(np.char.upper(signals.symbol.astype(str)).tolist()) if len(signals) else set()
+    bars = load_price_data(args.prices, symbols)
+    loaded_bars = time.perf_counter()
+
+    result = evaluate(signals, bars, max_bars=args.max_bars)
+    evaluated = time.perf_counter()
+
+    summary = {
+        'signals': len(signals),
+        'symbols_with_data': sorted(bars),
+        'symbols_without_data': sorted(symbols - set(bars)),
+        'timings': {
+            'load_signals_seconds': round(loaded_signals - started, 3),
+            'load_bars_seconds': round(loaded_bars - loaded_signals, 3),
+            'evaluate_seconds': round(evaluated - loaded_bars, 3),
+        },
+        'by_channel': result.summarize('channel'),
+        'by_symbol': result.summarize('symbol'),
+    }
+
+    if args.per_signal:
+        with open(args.per_signal, 'w', encoding='utf-8') as f:
+            for record in result.records():
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    text = json.dumps(summary, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,22 @@
+"""Price conversions shared by the parser, the models and the web tier.
+
+Kept apart from signal_parser so the web app can format prices without
+compiling the parser's pattern tables.
+"""
+
+
+def parse_price(value):
+    """Convert an extracted price string to a number (None if empty or invalid)"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def format_price(value):
+    """Render a numeric price without trailing zeros"""
+    if value is None:
+        return ''
+    return format(value, '.8f').rstrip('0').rstrip('.')
@@ -0,0 +1,120 @@
+"""On-demand diagnostics for the running bot.
+
+``SamplingProfiler`` periodically snapshots the Python stacks of selected
+threads and counts identical stacks. The result is in the collapsed format
+that flamegraph.pl and speedscope read. ``pattern_breakdown`` times every
+entry of the parser's regex tables separately against a sample of
+messages. Neither does anything unless called, so there is no cost while
+profiling is off.
+"""
+import os
+import re
+import sys
+import time
+from collections import Counter
+from threading import get_ident
+
+from signal_parser import (NON_SIGNAL_PATTERNS, PRICE_PATTERNS, RISK_REWARD_PATTERNS, STRUCTURE_ENTRY_PATTERNS,
+                           STRUCTURE_SL_PATTERNS, STRUCTURE_SYMBOL_PATTERNS, STRUCTURE_TP_PATTERNS, SYMBOL_PATTERNS,
+                           symbol_words)
+
+# Parser tables and the text each is matched against in SignalLexer;
+# 'word' subjects are fullmatched one token at a time, like extract_symbol
+PATTERN_TABLES = (
+    ('non_signal', NON_SIGNAL_PATTERNS, 'message'),
+    ('structure_symbol', STRUCTURE_SYMBOL_PATTERNS, 'line_upper'),
+    ('structure_entry', STRUCTURE_ENTRY_PATTERNS, 'line_lower'),
+    ('structure_sl', STRUCTURE_SL_PATTERNS, 'line_lower'),
+    ('structure_tp', STRUCTURE_TP_PATTERNS, 'line_lower'),
+    ('symbol', SYMBOL_PATTERNS, 'word'),
+    ('price', PRICE_PATTERNS, 'line_lower'),
+    ('risk_reward', RISK_REWARD_PATTERNS, 'line'),
+)
+
+
+def _frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """Counts the stacks of chosen threads every ``interval`` seconds"""
+
+    def __init__(self, interval=0.005, max_depth=128):
+        self.interval = interval
+        self.max_depth = max_depth
+
+    def sample(self, seconds, thread_ids=None):
+        """Sample for ``seconds`` (blocking) and return (Counter of stacks, sample count).
+
+        ``thread_ids`` limits sampling to those threads; by default every
+        thread except the calling one is sampled.
+        """
+        own = get_ident()
+        stacks = Counter()
+        samples = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or (thread_ids is not None and thread_id not in thread_ids):
+                    continue
+                labels = []
+                while frame is not None and len(labels) < self.max_depth:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                labels.reverse()
+                stacks[';'.join(labels)] += 1
+            samples += 1
+            time.sleep(self.interval)
+        return stacks, samples
+
+
+def collapse(stacks):
+    """Collapsed-stack text: one 'frame;frame;frame count' line per stack"""
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def _subjects(text, kind):
+    if kind == 'message':
+        return [text.strip().lower()]
+    subjects = []
+    for line in text.splitlines():
+        line = line.strip()
+        if len(line) < 3:
+            continue
+        if kind == 'word':
+            subjects.extend(symbol_words(line))
+        elif kind == 'line_upper':
+            subjects.append(line.upper())
+        elif kind == 'line_lower':
+            subjects.append(line.lower())
+        else:
+            subjects.append(line)
+    return subjects
+
+
+def pattern_breakdown(texts):
+    """Hits and match time of every parser pattern over ``texts``, slowest first"""
+    results = []
+    clock = time.perf_counter
+    for table, patterns, kind in PATTERN_TABLES:
+        subjects = [subject for text in texts for subject in _subjects(text, kind)]
+        for index, pattern in enumerate(patterns):
+            compiled = re.compile(pattern)
+            search = compiled.fullmatch if kind == 'word' else compiled.search
+            hits = 0
+            start = clock()
+            for subject in subjects:
+                if search(subject) is not None:
+                    hits += 1
+            elapsed = clock() - start
+            results.append({
+                'table': table,
+                'index': index,
+                'pattern': pattern,
+                'calls': len(subjects),
+                'hits': hits,
+                'total_us': round(elapsed * 1e6, 1),
+                'us_per_call': round(elapsed * 1e6 / len(subjects), 3) if subjects else 0.0,
+            })
+    results.sort(key=lambda result: result['total_us'], reverse=True)
+    return results
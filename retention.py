@@ -0,0 +1,331 @@
+"""Retention: move old signals to compressed monthly archive segments, and clear history in bulk.
+
+    python retention.py --days 180
+    python retention.py --days 30 --archive-dir /data/archive --batch-size 5000
+
+Signals posted before the cutoff are written, with their TP levels and
+follow-up updates, to ``<ARCHIVE_DIR>/signals-YYYY-MM.ndjson.gz`` (one JSON
+record per line, by the month of the signal timestamp) and deleted from the
+database, one batch per transaction. A batch is appended to its month's
+file as a new gzip member before the transaction commits, and the
+``ArchiveSegment`` row stores the file's committed length in that same
+transaction. A run that dies in between leaves bytes past that length,
+which readers ignore and the next run overwrites, so every signal ends up
+in exactly one place.
+
+Archiving leaves the stats rollups alone, so they keep counting archived
+signals; ``clear_history`` empties them along with the signals (the archive
+itself is kept). Export (export.py) and ``/api/search?archive=1`` read the
+segments. With RETENTION_DAYS set, the
+bot worker archives every RETENTION_INTERVAL_HOURS (default 6).
+"""
+import argparse
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+
+from prices import format_price
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 2000
+
+# Tables cleared with the signal history, children first; the rollups go too,
+# so the activity stats start from zero
+HISTORY_TABLES = ('signal_duplicate', 'signal_update', 'forwarded_message', 'take_profit', 'signal_rollup')
+
+
+def archive_directory():
+    return os.environ.get('ARCHIVE_DIR', 'archive')
+
+
+def retention_days():
+    """RETENTION_DAYS as a number, None when retention is off"""
+    value = os.environ.get('RETENTION_DAYS')
+    return float(value) if value else None
+
+
+def retention_interval():
+    """Seconds between automatic archive runs"""
+    return float(os.environ.get('RETENTION_INTERVAL_HOURS', 6)) * 3600
+
+
+def segment_filename(month):
+    return f'signals-{month}.ndjson.gz'
+
+
+def _format_time(value):
+    return value.isoformat(sep=' ') if value else None
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _archive_records(session, rows):
+    """Archive records for a batch of signal rows, with their TPs and updates"""
+    from app import db
+    from models import SignalUpdate, TakeProfit
+
+    ids = [row.id for row in rows]
+    take_profits = {}
+    for signal_id, price in session.execute(
+            db.select(TakeProfit.signal_id, TakeProfit.price).where(TakeProfit.signal_id.in_(ids))
+            .order_by(TakeProfit.signal_id, TakeProfit.level)):
+        take_profits.setdefault(signal_id, []).append(price)
+    updates = {}
+    for update in session.execute(db.select(SignalUpdate).where(SignalUpdate.signal_id.in_(ids))
+                                  .order_by(SignalUpdate.id)).scalars():
+        updates.setdefault(update.signal_id, []).append({
+            'kind': update.kind,
+            'level': update.level,
+            'price': update.price,
+            'status': update.status,
+            'source_channel': update.source_channel,
+            'source_message_id': update.source_message_id,
+            'timestamp': _format_time(update.timestamp),
+        })
+
+    return [{
+        'id': row.id,
+        'timestamp': _format_time(row.timestamp),
+        'symbol': row.symbol,
+        'position': row.position,
+        'entry': row.entry,
+        'stop_loss': row.stop_loss,
+        'take_profits': take_profits.get(row.id, []),
+        'risk_reward': row.risk_reward,
+        'source_channel': row.source_channel,
+        'source_message_id': row.source_message_id,
+        'status': row.status or 'open',
+        'status_updated_at': _format_time(row.status_updated_at),
+        'original_message': row.original_message,
+        'formatted_signal': row.formatted_signal,
+        'updates': updates.get(row.id, []),
+    } for row in rows]
+
+
+def _append_segment(directory, segment, records):
+    """Append ``records`` as one gzip member after the committed part of the segment file"""
+    path = os.path.join(directory, segment.filename)
+    payload = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+    with open(path, 'ab') as f:
+        if f.seek(0, os.SEEK_END) < segment.size:
+            raise RuntimeError(f"Archive segment {path} is shorter than its recorded size {segment.size}")
+        # Drop what an earlier, uncommitted run appended
+        f.truncate(segment.size)
+        f.write(gzip.compress(payload.encode('utf-8')))
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+
+def archive_signals(session, older_than, directory=None, batch_size=DEFAULT_BATCH_SIZE, on_archived=None):
+    """Archive and delete every signal posted before ``older_than``; returns the number archived.
+
+    ``on_archived(ids)`` is called with the ids of each committed batch.
+    """
+    from app import db
+    from models import (ArchiveSegment, ForwardedMessage, Signal, SignalCounter, SignalDuplicate, SignalUpdate,
+                        TakeProfit)
+
+    directory = directory or archive_directory()
+    os.makedirs(directory, exist_ok=True)
+    archived = 0
+    while True:
+        rows = session.execute(
+            db.select(Signal).where(Signal.timestamp < older_than).order_by(Signal.timestamp, Signal.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not rows:
+            break
+
+        try:
+            by_month = {}
+            for record, row in zip(_archive_records(session, rows), rows):
+                by_month.setdefault(row.timestamp.strftime('%Y-%m'), []).append((record, row.timestamp))
+
+            for month, entries in by_month.items():
+                segment = session.get(ArchiveSegment, month)
+                if segment is None:
+                    segment = ArchiveSegment(month=month, filename=segment_filename(month), size=0, rows=0)
+                    session.add(segment)
+                segment.size = _append_segment(directory, segment, [record for record, _ in entries])
+                segment.rows += len(entries)
+                first, last = entries[0][1], entries[-1][1]
+                segment.first_timestamp = min(segment.first_timestamp or first, first)
+                segment.last_timestamp = max(segment.last_timestamp or last, last)
+
+            ids = [row.id for row in rows]
+            for model in (SignalDuplicate, SignalUpdate, ForwardedMessage, TakeProfit):
+                session.execute(db.delete(model).where(model.signal_id.in_(ids)))
+            session.execute(db.delete(Signal).where(Signal.id.in_(ids)))
+            SignalCounter.increment(session, SignalCounter.TOTAL_SIGNALS, -len(ids))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        # The deleted rows' objects are not needed again
+        session.expunge_all()
+        archived += len(ids)
+        if on_archived is not None:
+            on_archived(ids)
+        logger.info(f"Archived {archived} signals older than {older_than:%Y-%m-%d %H:%M}")
+    return archived
+
+
+def clear_history(session):
+    """Delete every stored signal and its stats rollups with bulk statements, leaving the archive in place"""
+    from app import db
+    from models import Signal, SignalCounter
+    from search import bulk_delete
+
+    try:
+        if session.get_bind().dialect.name == 'postgresql':
+            session.execute(db.text(f"TRUNCATE TABLE {', '.join(HISTORY_TABLES)}, signal"))
+        else:
+            for table in HISTORY_TABLES:
+                session.execute(db.text(f"DELETE FROM {table}"))
+            # After the deletes above, so SQLite runs the trigger change
+            # inside the same transaction
+            with bulk_delete(session):
+                session.execute(db.delete(Signal))
+        SignalCounter.reset(session, SignalCounter.TOTAL_SIGNALS)
+        # New signals may reuse the ids, so pages cached before the clear must not match
+        SignalCounter.increment(session, SignalCounter.SIGNAL_REVISION)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+
+class _Prefix(io.RawIOBase):
+    """The first ``size`` bytes of a file"""
+
+    def __init__(self, f, size):
+        self._file = f
+        self._remaining = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = min(len(buffer), self._remaining)
+        if count <= 0:
+            return 0
+        data = self._file.read(count)
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+
+def iter_archived(session, since=None, until=None, directory=None, newest_first=False):
+    """Yield archived records (dicts as written) posted in ``since``..``until``, segment by segment"""
+    from app import db
+    from models import ArchiveSegment
+
+    directory = directory or archive_directory()
+    order = ArchiveSegment.month.desc() if newest_first else ArchiveSegment.month
+    segments = session.execute(
+        db.select(ArchiveSegment.filename, ArchiveSegment.size, ArchiveSegment.first_timestamp,
+                  ArchiveSegment.last_timestamp).order_by(order)
+    ).all()
+    since_text = _format_time(since)
+    until_text = _format_time(until)
+    for filename, size, first, last in segments:
+        if (since is not None and last is not None and last < since) or \
+                (until is not None and first is not None and first >= until):
+            continue
+        path = os.path.join(directory, filename)
+        if not os.path.exists(path):
+            logger.warning(f"Archive segment {path} is missing")
+            continue
+        with open(path, 'rb') as f, gzip.open(io.BufferedReader(_Prefix(f, size)), 'rt', encoding='utf-8') as lines:
+            for line in lines:
+                record = json.loads(line)
+                # Same format on both sides, so the text compares in time order
+                if since_text is not None and record['timestamp'] < since_text:
+                    continue
+                if until_text is not None and record['timestamp'] >= until_text:
+                    continue
+                yield record
+
+
+def iter_archived_chunks(session, since=None, until=None, symbols=None, channels=None, chunk_size=5000,
+                         directory=None):
+    """Archived signals as export records (see export.py), in lists of ``chunk_size``"""
+    from export import FIELDS
+
+    symbols = {symbol.upper() for symbol in symbols} if symbols else None
+    channels = set(channels) if channels else None
+    chunk = []
+    for record in iter_archived(session, since=since, until=until, directory=directory):
+        if symbols is not None and record['symbol'] not in symbols:
+            continue
+        if channels is not None and record['source_channel'] not in channels:
+            continue
+        record = {field: record.get(field) for field in FIELDS}
+        record['timestamp'] = _parse_time(record['timestamp'])
+        record['status_updated_at'] = _parse_time(record['status_updated_at'])
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def archived_signal_dict(record):
+    """``Signal.to_dict`` shape for an archived record"""
+    return {
+        'id': record['id'],
+        'symbol': record['symbol'],
+        'position': record['position'],
+        'entry': format_price(record['entry']),
+        'stop_loss': format_price(record['stop_loss']),
+        'take_profits': [format_price(price) for price in record['take_profits']],
+        'risk_reward': record['risk_reward'],
+        'source_channel': record['source_channel'],
+        'status': record['status'],
+        'timestamp': _parse_time(record['timestamp']).strftime('%Y-%m-%d %H:%M:%S'),
+        'formatted_signal': record['formatted_signal'],
+        'archived': True,
+    }
+
+
+def run_retention(days, directory=None, batch_size=DEFAULT_BATCH_SIZE, on_archived=None):
+    """Archive signals older than ``days`` days; returns the number archived"""
+    from app import app, db
+
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    with app.app_context():
+        return archive_signals(db.session, cutoff, directory=directory, batch_size=batch_size,
+                               on_archived=on_archived)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Archive old signals to compressed monthly segments')
+    parser.add_argument('--days', type=float, default=retention_days(),
+                        help='archive signals older than this many days (default: RETENTION_DAYS)')
+    parser.add_argument('--archive-dir', default=archive_directory(), help='segment directory (default: ARCHIVE_DIR)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='signals per transaction')
+    args = parser.parse_args(argv)
+    if args.days is None:
+        parser.error('--days is required when RETENTION_DAYS is not set')
+
+    archived = run_retention(args.days, directory=args.archive_dir, batch_size=args.batch_size)
+    print(f"Archived {archived} signals to {args.archive_dir}")
+
+    # Web workers drop their cached recent signals
+    from bot_control import BotControl
+    if archived:
+        BotControl(autospawn=False).invalidate('signals')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
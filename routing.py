@@ -0,0 +1,120 @@
+import json
+from collections import OrderedDict
+
+
+def channel_key(channel):
+    """Normalize a channel reference so '-1001467736193', 1467736193 and '@Name' compare sanely"""
+    key = str(channel).strip().lstrip('@').lower()
+    if key.startswith('-100') and key[4:].isdigit():
+        key = key[4:]
+    return key
+
+
+def _destination(value):
+    """Numeric chat ids go to Telethon as ints, usernames as strings"""
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        return int(value.strip())
+    return value
+
+
+def _rule_set(values, normalize=str.upper):
+    """Frozen set of allowed values, or None for 'match anything'"""
+    if not values:
+        return None
+    if isinstance(values, str):
+        values = values.split(',')
+    allowed = frozenset(normalize(str(value).strip()) for value in values if str(value).strip())
+    return allowed or None
+
+
+class Route:
+    """One forwarding destination with optional filters"""
+
+    __slots__ = ('destination', 'symbols', 'positions', 'source_channels')
+
+    def __init__(self, destination, symbols=None, positions=None, source_channels=None):
+        if not destination:
+            raise ValueError("Route needs a destination")
+        self.destination = _destination(destination)
+        self.symbols = _rule_set(symbols)
+        self.positions = _rule_set(positions)
+        self.source_channels = _rule_set(source_channels, normalize=channel_key)
+
+    def matches(self, position, source):
+        return ((self.positions is None or position in self.positions)
+                and (self.source_channels is None or source in self.source_channels))
+
+    def to_dict(self):
+        return {
+            'destination': self.destination,
+            'symbols': sorted(self.symbols) if self.symbols else [],
+            'positions': sorted(self.positions) if self.positions else [],
+            'source_channels': sorted(self.source_channels) if self.source_channels else [],
+        }
+
+
+class RouteTable:
+    """Dispatch table mapping a signal to the destinations it should go to.
+
+    Routes are indexed by symbol up front (plus a list of routes without a
+    symbol filter), so a lookup only checks the few routes that can apply.
+    Results are memoised per (symbol, position, source) in a bounded cache,
+    since the same handful of keys repeats all day.
+    """
+
+    def __init__(self, routes, cache_size=1024):
+        self.routes = list(routes)
+        self.cache_size = cache_size
+        self._by_symbol = {}
+        self._any_symbol = []
+        for order, route in enumerate(self.routes):
+            if route.symbols is None:
+                self._any_symbol.append((order, route))
+            else:
+                for symbol in route.symbols:
+                    self._by_symbol.setdefault(symbol, []).append((order, route))
+        self._cache = OrderedDict()
+
+    @classmethod
+    def from_config(cls, routes_json=None, default_destination=None):
+        """Build from the JSON rules stored on Config, falling back to to_channel"""
+        rules = json.loads(routes_json) if routes_json else []
+        if not isinstance(rules, list):
+            raise ValueError("Routes must be a JSON list")
+        routes = [Route(rule.get('destination'), rule.get('symbols'), rule.get('positions'),
+                        rule.get('source_channels')) for rule in rules]
+        if not routes and default_destination:
+            routes.append(Route(default_destination))
+        return cls(routes)
+
+    def destinations(self, signal_data):
+        """Destinations for a parsed signal, in route order, without repeats"""
+        symbol = signal_data['symbol'].upper()
+        position = signal_data['position'].upper()
+        source = channel_key(signal_data['source_channel'])
+        key = (symbol, position, source)
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return cached
+
+        candidates = self._by_symbol.get(symbol, [])
+        if self._any_symbol:
+            candidates = sorted(candidates + self._any_symbol, key=lambda entry: entry[0])
+        result = []
+        for _, route in candidates:
+            if route.matches(position, source) and route.destination not in result:
+                result.append(route.destination)
+        result = tuple(result)
+
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    def all_destinations(self):
+        return list(OrderedDict.fromkeys(route.destination for route in self.routes))
+
+    def __len__(self):
+        return len(self.routes)
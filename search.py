@@ -0,0 +1,260 @@
+"""Full-text search over the original text of stored signals.
+
+SQLite gets an FTS5 index (``signal_fts``, external content on the signal
+table, kept in sync by triggers on insert, edit and delete); PostgreSQL a
+generated ``tsvector`` column with a GIN index. Both are created by the
+schema step (``migrate.upgrade_all``), which also indexes existing rows.
+
+Queries are plain text: every word must appear, "quoted words" must appear
+together, and on SQLite ``word*`` matches a prefix. Results are ranked
+(BM25 on SQLite, ``ts_rank`` on PostgreSQL) and come with a snippet in
+which matches are wrapped in ``<mark>``.
+"""
+import html
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import inspect, text
+
+SEARCH_TABLE = 'signal_fts'
+SEARCH_COLUMN = 'search_vector'
+
+# Snippet match markers, replaced by <mark> after HTML escaping
+_START, _STOP = '\x02', '\x03'
+SNIPPET_TOKENS = 16
+FALLBACK_SNIPPET_CHARS = 160
+
+_INSERT_TRIGGER = f"""
+    CREATE TRIGGER IF NOT EXISTS signal_fts_insert AFTER INSERT ON signal BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, original_message) VALUES (new.id, new.original_message);
+    END"""
+_DELETE_TRIGGER = f"""
+    CREATE TRIGGER IF NOT EXISTS signal_fts_delete AFTER DELETE ON signal BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, original_message)
+        VALUES ('delete', old.id, old.original_message);
+    END"""
+_UPDATE_TRIGGER = f"""
+    CREATE TRIGGER IF NOT EXISTS signal_fts_update AFTER UPDATE OF original_message ON signal BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, original_message)
+        VALUES ('delete', old.id, old.original_message);
+        INSERT INTO {SEARCH_TABLE}(rowid, original_message) VALUES (new.id, new.original_message);
+    END"""
+_SQLITE_TRIGGERS = (_INSERT_TRIGGER, _DELETE_TRIGGER, _UPDATE_TRIGGER)
+
+# engine url -> 'fts5', 'tsvector' or None, looked up once per process
+_backends = {}
+
+
+class SearchError(Exception):
+    """The search text could not be turned into a query"""
+
+
+def _ensure_sqlite_index(conn):
+    exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                          {'name': SEARCH_TABLE}).first()
+    if not exists:
+        conn.execute(text(f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+                          f"original_message, content='signal', content_rowid='id')"))
+    for sql in _SQLITE_TRIGGERS:
+        conn.execute(text(sql))
+    if not exists:
+        # Index the rows stored before the table existed
+        conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+    return not exists
+
+
+def _ensure_postgres_index(conn, columns):
+    created = SEARCH_COLUMN not in columns
+    if created:
+        # Filling the generated column indexes every existing row
+        conn.execute(text(f"ALTER TABLE signal ADD COLUMN {SEARCH_COLUMN} tsvector GENERATED ALWAYS AS "
+                          f"(to_tsvector('simple', coalesce(original_message, ''))) STORED"))
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_signal_{SEARCH_COLUMN} ON signal USING GIN ({SEARCH_COLUMN})"))
+    return created
+
+
+def ensure_search_index(db):
+    """Create the full-text index for the current database if missing; returns True if created"""
+    engine = db.engine
+    inspector = inspect(engine)
+    if 'signal' not in inspector.get_table_names():
+        return False
+
+    _backends.pop(str(engine.url), None)
+    with engine.begin() as conn:
+        if engine.dialect.name == 'sqlite':
+            return _ensure_sqlite_index(conn)
+        if engine.dialect.name == 'postgresql':
+            columns = {column['name'] for column in inspector.get_columns('signal')}
+            return _ensure_postgres_index(conn, columns)
+    return False
+
+
+def search_backend(engine):
+    """'fts5', 'tsvector' or None (no index; searches fall back to LIKE)"""
+    key = str(engine.url)
+    if key not in _backends:
+        inspector = inspect(engine)
+        backend = None
+        if engine.dialect.name == 'sqlite' and SEARCH_TABLE in inspector.get_table_names():
+            backend = 'fts5'
+        elif engine.dialect.name == 'postgresql' and 'signal' in inspector.get_table_names():
+            if SEARCH_COLUMN in {column['name'] for column in inspector.get_columns('signal')}:
+                backend = 'tsvector'
+        _backends[key] = backend
+    return _backends[key]
+
+
+@contextmanager
+def bulk_delete(session):
+    """Wrap a delete of every signal row: the FTS5 index is emptied in one
+    step instead of row by row, which also lets SQLite truncate the table"""
+    # Looked up on the session's own connection, which may already hold
+    # the write lock
+    if session.get_bind().dialect.name != 'sqlite' or session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': SEARCH_TABLE}).first() is None:
+        yield
+        return
+    session.execute(text("DROP TRIGGER IF EXISTS signal_fts_delete"))
+    yield
+    session.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('delete-all')"))
+    session.execute(text(_DELETE_TRIGGER))
+
+
+def fts5_query(query):
+    """FTS5 MATCH expression for plain search text: quoted terms ANDed, ``term*`` kept as a prefix"""
+    terms = []
+    for match in re.finditer(r'"([^"]*)"|(\S+)', query):
+        phrase, word = match.groups()
+        term = phrase if phrase is not None else word
+        prefix = phrase is None and term.endswith('*')
+        term = term.rstrip('*') if prefix else term
+        if not term.strip():
+            continue
+        # Quoting makes punctuation (BTC/USDT, -100..., AND) plain text
+        terms.append('"' + term.replace('"', '""') + '"' + ('*' if prefix else ''))
+    if not terms:
+        raise SearchError("Search text has no words")
+    return ' '.join(terms)
+
+
+def _snippet_html(snippet):
+    """HTML-escape a snippet and turn its match markers into <mark> tags"""
+    return html.escape(snippet or '').replace(_START, '<mark>').replace(_STOP, '</mark>')
+
+
+def _ranked_ids(session, backend, query, channel, limit, offset):
+    """(signal id, score, snippet) rows of one page, best first"""
+    params = {'limit': limit, 'offset': offset, 'start': _START, 'stop': _STOP}
+    channel_filter = ''
+    if channel:
+        channel_filter = 'AND s.source_channel = :channel'
+        params['channel'] = channel
+
+    if backend == 'fts5':
+        params['query'] = fts5_query(query)
+        params['tokens'] = SNIPPET_TOKENS
+        sql = (f"SELECT {SEARCH_TABLE}.rowid, -{SEARCH_TABLE}.rank, "
+               f"snippet({SEARCH_TABLE}, 0, :start, :stop, '…', :tokens) "
+               f"FROM {SEARCH_TABLE} JOIN signal s ON s.id = {SEARCH_TABLE}.rowid "
+               f"WHERE {SEARCH_TABLE} MATCH :query {channel_filter} "
+               f"ORDER BY {SEARCH_TABLE}.rank LIMIT :limit OFFSET :offset")
+    elif backend == 'tsvector':
+        params['query'] = query
+        params['options'] = f'StartSel={_START}, StopSel={_STOP}, MaxWords={SNIPPET_TOKENS * 2}, MinWords=5'
+        sql = (f"SELECT s.id, ts_rank(s.{SEARCH_COLUMN}, q), ts_headline('simple', s.original_message, q, :options) "
+               f"FROM signal s, websearch_to_tsquery('simple', :query) q "
+               f"WHERE s.{SEARCH_COLUMN} @@ q {channel_filter} "
+               f"ORDER BY 2 DESC, s.id DESC LIMIT :limit OFFSET :offset")
+    else:
+        params['pattern'] = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        sql = (f"SELECT s.id, 0, substr(s.original_message, 1, {FALLBACK_SNIPPET_CHARS}) FROM signal s "
+               f"WHERE s.original_message LIKE :pattern ESCAPE '\\' {channel_filter} "
+               f"ORDER BY s.id DESC LIMIT :limit OFFSET :offset")
+    return session.execute(text(sql), params).all()
+
+
+def search_signals(session, query, channel=None, limit=20, page=1):
+    """One page of ranked matches: (list of ``Signal.to_dict`` plus ``score``
+    and ``snippet``, whether more pages follow)"""
+    from models import Signal
+
+    query = (query or '').strip()
+    if not query:
+        raise SearchError("Search text is empty")
+    page = max(page, 1)
+
+    rows = _ranked_ids(session, search_backend(session.get_bind()), query, channel, limit + 1, (page - 1) * limit)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    signals = {signal.id: signal for signal in
+               Signal.query.filter(Signal.id.in_([row[0] for row in rows])).all()} if rows else {}
+    results = []
+    for signal_id, score, snippet in rows:
+        signal = signals.get(signal_id)
+        if signal is None:
+            continue
+        data = signal.to_dict()
+        data['score'] = round(float(score or 0), 4)
+        data['snippet'] = _snippet_html(snippet)
+        results.append(data)
+    return results, has_more
+
+
+def _archive_terms(query):
+    """Lowercased words and "quoted phrases" of plain search text (``*`` dropped)"""
+    terms = []
+    for match in re.finditer(r'"([^"]*)"|(\S+)', query):
+        phrase, word = match.groups()
+        term = (phrase if phrase is not None else word.rstrip('*')).strip().lower()
+        if term:
+            terms.append(term)
+    if not terms:
+        raise SearchError("Search text has no words")
+    return terms
+
+
+def _archive_snippet(message, terms):
+    """Text around the first match with every term wrapped in <mark>, as HTML"""
+    lowered = message.lower()
+    first = min(lowered.find(term) for term in terms)
+    start = max(first - FALLBACK_SNIPPET_CHARS // 4, 0)
+    stop = start + FALLBACK_SNIPPET_CHARS
+    pattern = re.compile('|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    snippet = pattern.sub(lambda match: _START + match.group(0) + _STOP, message[start:stop])
+    return ('…' if start else '') + _snippet_html(snippet) + ('…' if stop < len(message) else '')
+
+
+def search_archive(session, query, channel=None, limit=20, page=1):
+    """Like ``search_signals`` for archived signals: every term must appear
+    (case-insensitive), newest segment first, unranked. Archives have no
+    index, so each page scans the segments up to its last match."""
+    from retention import archived_signal_dict, iter_archived
+
+    query = (query or '').strip()
+    if not query:
+        raise SearchError("Search text is empty")
+    terms = _archive_terms(query)
+    page = max(page, 1)
+    skip = (page - 1) * limit
+
+    results = []
+    for record in iter_archived(session, newest_first=True):
+        message = record.get('original_message') or ''
+        if channel and record['source_channel'] != channel:
+            continue
+        lowered = message.lower()
+        if not all(term in lowered for term in terms):
+            continue
+        if skip:
+            skip -= 1
+            continue
+        if len(results) == limit:
+            return results, True
+        data = archived_signal_dict(record)
+        data['score'] = 0
+        data['snippet'] = _archive_snippet(message, terms)
+        results.append(data)
+    return results, False
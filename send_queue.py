@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import time
+
+
+class TokenBucket:
+    """Token bucket rate limiter for asyncio code"""
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def penalize(self, seconds):
+        """Empty the bucket so nothing is sent for ``seconds`` (after a FloodWait)"""
+        self._refill()
+        self.tokens = -seconds * self.rate
+
+
+class _Outgoing:
+    __slots__ = ('text', 'enqueued_at', 'attempts', 'on_sent', 'edit_id')
+
+    def __init__(self, text, enqueued_at, on_sent=None, edit_id=None):
+        self.text = text
+        self.enqueued_at = enqueued_at
+        self.attempts = 0
+        self.on_sent = on_sent
+        self.edit_id = edit_id
+
+
+class DestinationStats:
+    """Counters for one destination"""
+
+    __slots__ = ('sent', 'edited', 'failed', 'dropped', 'retries', 'flood_waits',
+                 'flood_wait_seconds', 'latency_total', 'latency_max')
+
+    def __init__(self):
+        self.sent = 0
+        self.edited = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retries = 0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def to_dict(self, depth):
+        return {
+            'queue_depth': depth,
+            'sent': self.sent,
+            'edited': self.edited,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'retries': self.retries,
+            'flood_waits': self.flood_waits,
+            'flood_wait_seconds': self.flood_wait_seconds,
+            'avg_latency_ms': round(self.latency_total / self.sent * 1000, 1) if self.sent else 0.0,
+            'max_latency_ms': round(self.latency_max * 1000, 1),
+        }
+
+
+class OutboundSender:
+    """Rate-limited, ordered send queues, one per destination.
+
+    ``send(destination, text)`` is the coroutine that actually delivers a
+    message (``TelegramClient.send_message`` in the bot). Each destination
+    gets its own bounded queue, token bucket and worker task, so messages to
+    one chat keep their order and a FloodWait on one chat does not hold up
+    the others. Errors listed in ``flood_wait_errors`` must carry a
+    ``seconds`` attribute; the worker sleeps that long and retries the same
+    message. Other errors are retried with exponential back-off up to
+    ``max_retries`` times. ``edit(destination, message_id, text)`` replaces
+    the text of an already sent message; edits share the destination's queue
+    and rate limit with sends.
+    """
+
+    def __init__(self, send, rate=1.0, burst=5, max_queue=1000, max_retries=5,
+                 flood_wait_errors=(), logger=None, clock=time.monotonic, edit=None):
+        self.send = send
+        self.edit = edit
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.flood_wait_errors = tuple(flood_wait_errors)
+        self.logger = logger or logging.getLogger(__name__)
+        self.clock = clock
+        self._queues = {}
+        self._buckets = {}
+        self._workers = {}
+        self._stats = {}
+
+    def enqueue(self, destination, text, on_sent=None):
+        """Queue a message without waiting; returns False if the buffer is full.
+
+        ``on_sent(message)`` is called with the sent Telegram message.
+        Must be called from the event loop thread.
+        """
+        return self._put(destination, _Outgoing(text, self.clock(), on_sent))
+
+    def enqueue_edit(self, destination, message_id, text):
+        """Queue an edit of message ``message_id`` in ``destination``, like ``enqueue``"""
+        if self.edit is None:
+            raise ValueError("OutboundSender was created without an edit function")
+        return self._put(destination, _Outgoing(text, self.clock(), edit_id=message_id))
+
+    def _put(self, destination, item):
+        queue = self._queues.get(destination)
+        if queue is None:
+            queue = self._start_destination(destination)
+
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self._stats[destination].dropped += 1
+            self.logger.error(f"Send queue for {destination} is full, dropping message")
+            return False
+        return True
+
+    def _start_destination(self, destination):
+        queue = asyncio.Queue(maxsize=self.max_queue)
+        self._queues[destination] = queue
+        self._buckets[destination] = TokenBucket(self.rate, self.burst, clock=self.clock)
+        self._stats[destination] = DestinationStats()
+        self._workers[destination] = asyncio.get_running_loop().create_task(self._worker(destination))
+        return queue
+
+    async def _worker(self, destination):
+        queue = self._queues[destination]
+        bucket = self._buckets[destination]
+        stats = self._stats[destination]
+
+        while True:
+            item = await queue.get()
+            try:
+                await self._deliver(destination, item, bucket, stats)
+            finally:
+                queue.task_done()
+
+    async def _deliver(self, destination, item, bucket, stats):
+        while True:
+            await bucket.acquire()
+            item.attempts += 1
+            try:
+                if item.edit_id is None:
+                    sent = await self.send(destination, item.text)
+                else:
+                    sent = await self.edit(destination, item.edit_id, item.text)
+            except self.flood_wait_errors as e:
+                wait = getattr(e, 'seconds', 1) or 1
+                stats.flood_waits += 1
+                stats.flood_wait_seconds += wait
+                self.logger.warning(f"Flood wait of {wait}s sending to {destination}, retrying")
+                bucket.penalize(wait)
+                continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if item.attempts > self.max_retries:
+                    stats.failed += 1
+                    self.logger.error(f"Giving up sending to {destination} after "
+                                      f"{item.attempts} attempts: {str(e)}")
+                    return
+                stats.retries += 1
+                delay = min(60, 2 ** (item.attempts - 1))
+                self.logger.warning(f"Error sending to {destination} ({str(e)}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+                continue
+
+            latency = self.clock() - item.enqueued_at
+            stats.sent += 1
+            stats.latency_total += latency
+            stats.latency_max = max(stats.latency_max, latency)
+            if item.edit_id is None:
+                self.logger.info("Signal forwarded to %s", destination,
+                                 extra={'destination': str(destination), 'stage': 'send'})
+            else:
+                stats.edited += 1
+                self.logger.info("Forwarded signal %s edited in %s", item.edit_id, destination,
+                                 extra={'destination': str(destination), 'stage': 'edit'})
+            if item.on_sent:
+                try:
+                    item.on_sent(sent)
+                except Exception as e:
+                    self.logger.error(f"Error in send callback: {str(e)}")
+            return
+
+    async def drain(self, timeout=None):
+        """Wait until every queued message has been sent or given up on"""
+        waits = [queue.join() for queue in self._queues.values()]
+        if waits:
+            await asyncio.wait_for(asyncio.gather(*waits), timeout)
+
+    async def close(self, timeout=10):
+        """Drain (up to ``timeout`` seconds) and stop all workers"""
+        try:
+            if timeout != 0:
+                await self.drain(timeout)
+            elif self.queue_depth():
+                raise asyncio.TimeoutError()
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Send queue not drained, {self.queue_depth()} messages undelivered")
+        for worker in self._workers.values():
+            worker.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        self._workers.clear()
+        self._queues.clear()
+        self._buckets.clear()
+
+    def queue_depth(self):
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    def stats(self):
+        """Per-destination queue depth, outcome counters and send latency"""
+        return {
+            str(destination): stats.to_dict(self._queues[destination].qsize() if destination in self._queues else 0)
+            for destination, stats in self._stats.items()
+        }
@@ -1,491 +1,548 @@
 from telethon import TelegramClient, events
-import re
+from telethon.errors import FloodWaitError
+from telethon.utils import get_peer_id
 import asyncio
+import inspect
 import logging
-from threading import Thread
-import json
-from datetime import datetime
+import time
+from datetime import timezone
+from functools import partial
+from threading import get_ident
+from db_writer import SignalWriter
+from dedup import SignalDeduplicator
+from metrics import MetricsRegistry
+from routing import RouteTable
+from send_queue import OutboundSender
+from signal_index import OpenSignal, OpenSignalIndex, PostedSignal, PostedSignals
+from signal_parser import (SignalLexer, build_signal, has_signal_keyword, is_non_signal, parse_many, parse_text,
+                           parse_update, signal_changes)
 
 class SignalBot:
     """Telegram signal bot with web interface integration"""
     
-    def __init__(self, api_id, api_hash, session_name, from_channels, to_channel):
+    def __init__(self, api_id, api_hash, session_name, from_channels, to_channel,
+                 dedup_window=60, dedup_max_entries=4096, send_rate=1.0, send_burst=5,
+                 routes=None, catchup_limit=1000, client_factory=TelegramClient, open_signal_limit=10000,
+                 edit_forwarded=True):
         self.api_id = api_id
         self.api_hash = api_hash
         self.session_name = session_name
         self.from_channels = from_channels
         self.to_channel = to_channel
+        # Forwarding rules; without explicit routes everything goes to to_channel
+        self.routes = routes if routes is not None else RouteTable.from_config(None, to_channel)
+        # Called like TelegramClient; fake_telegram.FakeTelegramClient runs the bot offline
+        self.client_factory = client_factory
         self.client = None
+        self.sender = None
+        self.send_rate = send_rate
+        self.send_burst = send_burst
         self.running = False
         
-        # Setup logging
-        logging.basicConfig(level=logging.INFO)
+        # Messages missed while offline are fetched on start, at most
+        # catchup_limit per channel
+        self.catchup_limit = catchup_limit
+        self._catching_up = False
+        self._catch_up_task = None
+        self._claimed = set()
+        
+        # Cross-channel duplicate suppression
+        self.deduplicator = SignalDeduplicator(window=dedup_window, max_entries=dedup_max_entries)
+        
+        # Signals that can still receive follow-ups (TP hit, SL moved, ...)
+        self.open_signals = OpenSignalIndex(max_entries=open_signal_limit)
+        
+        # Recently stored signals by source post, for applying edits; with
+        # edit_forwarded the forwarded copies are edited too, otherwise the
+        # corrected signal is sent as a new message
+        self.posted = PostedSignals(max_entries=open_signal_limit)
+        self.edit_forwarded = edit_forwarded
+        
+        # Logging is configured by the process entry point (log_config.setup_logging)
         self.logger = logging.getLogger(__name__)
+        
+        # Batched database writes off the event loop
+        self.writer = SignalWriter(logger=self.logger)
+        
+        # Callbacks receiving 'running' / 'stopped' on status changes
+        self.status_listeners = []
+        self._last_status = None
+        
+        self._setup_metrics()
+        
+        # Set to a deque by the profiler to collect message texts for the
+        # per-pattern breakdown; None (the normal case) records nothing
+        self.profile_sample = None
+        self.loop_thread_id = None
+        self.loop = None
+    
+    def _setup_metrics(self):
+        """Per-stage latency and per-channel outcome metrics (rendered on /metrics)"""
+        self.metrics = MetricsRegistry()
+        self.messages_total = self.metrics.counter(
+            'signal_messages_total', 'Messages handled by source channel and outcome', ('channel', 'outcome'))
+        self.stage_seconds = self.metrics.histogram(
+            'signal_stage_seconds', 'Time spent in each message handling stage', ('stage', 'channel'))
+        self.send_seconds = self.metrics.histogram(
+            'signal_send_seconds', 'send_message round trip per destination', ('destination',))
+        self.commit_seconds = self.metrics.histogram(
+            'signal_db_commit_seconds', 'Time to write and commit one database batch')
+        self.metrics.gauge('signal_writer_queue_depth', 'Rows waiting for the database writer',
+                           self.writer.queue_depth)
+        self.metrics.gauge('signal_send_queue_depth', 'Messages waiting in the outbound send queues',
+                           lambda: self.sender.queue_depth() if self.sender else 0)
+        self.metrics.gauge('signal_dedup_cache_size', 'Fingerprints held by the duplicate cache',
+                           lambda: self.deduplicator.stats()['size'])
+        self.writer.add_flush_listener(lambda rows, seconds: self.commit_seconds.observe(seconds))
     
     def parse_signal(self, message):
         """Advanced signal parsing with multiple format support"""
-        text = message.message.strip()
-        
-        # Pre-validation: Must contain trading keywords
-        signal_keywords = ['entry', 'tp', 'sl', 'target', 'stop', 'buy', 'sell', 'long', 'short']
-        if not any(keyword in text.lower() for keyword in signal_keywords):
-            return None
-            
-        # Enhanced validation: Check signal structure
-        if not self._is_valid_signal_structure(text):
-            return None
-            
-        return self._extract_signal_data(text, message)
+        return parse_text(message.message, message.chat_id)
     
-    def _is_valid_signal_structure(self, text):
-        """Validate if message has proper signal structure"""
-        lines = text.splitlines()
-        text_lower = text.lower()
+    def _parse_staged(self, text, channel):
+        """``parse_text`` split into timed stages; returns (signal_data, outcome)"""
+        observe = self.stage_seconds.observe
+        clock = time.perf_counter
         
-        # Filter out common non-signal patterns first
-        non_signal_patterns = [
-            r'close.*profit',
-            r'move sl',
-            r'change tp',
-            r'\+\d+.*pips',
-            r'sl reached',
-            r'tp reached',
-            r'break.*even',
-            r'entry.*break.*even',
-            r'position.*update',
-            r'trade.*update',
-            r'close.*position',
-            r'delete',
-            r'remove.*order',
-            r'cancel',
-            r'activated',
-            r'didn.*t.*activate',
-            r'subscription',
-            r'upgrade',
-            r'contact.*@',
-            r'website',
-            r'calculator',
-            r'economic.*calendar',
-            r'risk.*management',
-            r'lot.*size',
-            r'weekend',
-            r'market.*close',
-            r'analyze?',
-            r'tradingview',
-            r'screenshot',
-            r'profit.*screenshot',
-            r'important.*update',
-            r'note.*from',
-            r'apologize',
-            r'transparency',
-            r'support.*on',
-            r'favor',
-            r'energy.*flowing'
-        ]
+        start = clock()
+        text = text.strip()
+        text_lower = text.lower()
+        outcome = None
+        if not has_signal_keyword(text_lower):
+            outcome = 'no_keyword'
+        elif is_non_signal(text_lower):
+            outcome = 'non_signal'
+        prefiltered = clock()
+        observe(prefiltered - start, 'prefilter', channel)
+        if outcome:
+            return None, outcome
         
-        for pattern in non_signal_patterns:
-            if re.search(pattern, text_lower):
-                return False
+        # The lexer checks the structure and extracts the fields in the same
+        # pass, so both are one stage
+        lexer = SignalLexer(text)
+        if not lexer.valid:
+            observe(clock() - prefiltered, 'structure', channel)
+            return None, 'invalid_structure'
         
-        # Must have minimum length for valid signals
-        if len(text) < 20:
+        signal_data = lexer.to_signal(text, channel)
+        observe(clock() - prefiltered, 'structure', channel)
+        if signal_data is None:
+            return None, 'incomplete'
+        return signal_data, 'signal'
+    
+    def parse_many(self, items, workers=None):
+        """Parse (text, channel) pairs in bulk, yielding results in input order"""
+        return parse_many(items, workers=workers)
+    
+    def _is_valid_signal_structure(self, text):
+        """Validate if message has proper signal structure"""
+        if is_non_signal(text.lower()):
             return False
-            
-        # Count signal components
-        has_symbol = False
-        has_position = False
-        has_entry = False
-        has_sl = False
-        has_tp = False
-        price_count = 0
-        
-        for line in lines:
-            line_clean = line.strip()
-            line_lower = line_clean.lower()
-            
-            # Skip empty lines and non-relevant lines
-            if not line_clean or len(line_clean) < 3:
-                continue
-                
-            # Symbol patterns (enhanced)
-            symbol_patterns = [
-                r'[A-Z]{3,8}USD[T]?',
-                r'[A-Z]{3,8}BTC',
-                r'[A-Z]{3,8}ETH', 
-                r'XAU[A-Z]*',
-                r'GOLD',
-                r'[A-Z]{6}',  # Like EURAUD, GBPUSD
-                r'#[A-Z]{3,8}'
-            ]
-            
-            for pattern in symbol_patterns:
-                if re.search(pattern, line_clean.upper()):
-                    has_symbol = True
-                    break
-                    
-            # Position patterns (enhanced)
-            position_indicators = ['buy', 'sell', 'long', 'short']
-            if any(pos in line_lower for pos in position_indicators):
-                if not any(exclude in line_lower for exclude in ['close', 'profit', 'update']):
-                    has_position = True
-                    
-            # Entry patterns (enhanced)
-            entry_patterns = [
-                r'entry.*price.*:?\s*([\d.]+)',
-                r'e:\s*([\d.]+)',
-                r'entry.*:?\s*([\d.]+)',
-                r'enter.*:?\s*([\d.]+)',
-                # Simple format: "GOLD BUY 3373.33" or "USDCAD SELL 1.37480"
-                r'(?:buy|sell)\s+([\d.]+)',
-                r'(?:buy|sell)\s+(?:limit\s+)?([\d]+)'
-            ]
-            
-            for pattern in entry_patterns:
-                if re.search(pattern, line_lower):
-                    has_entry = True
-                    price_count += 1
-                    break
-                    
-            # Stop loss patterns (enhanced)
-            sl_patterns = [
-                r'stop.*loss.*:?\s*([\d.]+)',
-                r'sl.*:?\s*([\d.]+)',
-                r'stop.*:?\s*([\d.]+)'
-            ]
-            
-            for pattern in sl_patterns:
-                if re.search(pattern, line_lower):
-                    has_sl = True
-                    price_count += 1
-                    break
-                    
-            # Take profit patterns (enhanced)
-            tp_patterns = [
-                r'tp\d*.*:?\s*([\d.]+)',
-                r'take.*profit.*:?\s*([\d.]+)',
-                r'target.*:?\s*([\d.]+)',
-                r'✔️.*tp\d*.*:?\s*([\d.]+)'
-            ]
-            
-            for pattern in tp_patterns:
-                if re.search(pattern, line_lower):
-                    has_tp = True
-                    price_count += 1
-                    break
-        
-        # Enhanced validation:
-        # 1. Must have symbol
-        # 2. Must have entry price
-        # 3. Must have either SL or TP
-        # 4. Must have at least 2 prices (entry + sl/tp)
-        return (has_symbol and has_entry and (has_sl or has_tp) and price_count >= 2)
+        return SignalLexer(text).valid
     
     def _extract_signal_data(self, text, message):
         """Extract signal data with enhanced parsing"""
-        lines = text.splitlines()
-        
-        symbol = ""
-        position = ""
-        entry = ""
-        sl = ""
-        r_r = ""
-        tps = []
-        
-        for line in lines:
-            line_clean = line.strip()
-            line_lower = line_clean.lower()
+        lexer = SignalLexer(text)
+        return build_signal(lexer.symbol, lexer.position, lexer.entry, lexer.stop_loss,
+                            lexer.take_profits, lexer.risk_reward, text, str(message.chat_id))
+    
+    def save_signal_to_db(self, signal_data, seen=None, timestamp=None):
+        """Queue parsed signal for the background database writer"""
+        self.writer.submit_signal(signal_data, seen=seen, timestamp=timestamp)
+    
+    def save_duplicate_to_db(self, original, signal_data):
+        """Queue a repeated signal as a reference to the first occurrence"""
+        self.writer.submit_duplicate(original, signal_data)
+    
+    async def signal_handler(self, event):
+        """Handle new messages from monitored channels"""
+        await self.process_message(event.message)
+    
+    async def process_message(self, message, timestamp=None):
+        """Parse, store and forward one channel message (live or caught up)"""
+        clock = time.perf_counter
+        started = clock()
+        try:
+            text = message.message or ''
+            channel = str(message.chat_id)
             
-            # Skip empty lines and irrelevant lines
-            if not line_clean or len(line_clean) < 3:
-                continue
+            # While catching up, the same message can arrive from both the
+            # history fetch and the live handler
+            if self._catching_up:
+                key = (channel, message.id)
+                if key in self._claimed:
+                    return
+                self._claimed.add(key)
+            
+            # Hot-path lines use lazy %-formatting and a sampled category;
+            # the text is only sliced and formatted if the record is kept
+            self.logger.info("New message received from channel %s: %.100s...", channel, text,
+                             extra={'category': 'message_received', 'channel': channel, 'message_id': message.id})
+            if self.profile_sample is not None:
+                self.profile_sample.append(text)
+            
+            signal_data, outcome = self._parse_staged(text, channel) if text else (None, 'empty')
+            if signal_data:
+                self.logger.info("Signal parsed successfully: %s %s", signal_data['symbol'], signal_data['position'],
+                                 extra={'channel': channel, 'symbol': signal_data['symbol'], 'stage': 'parse'})
+                signal_data['source_message_id'] = message.id
                 
-            # Enhanced symbol detection
-            if not symbol:
-                symbol = self._extract_symbol(line_clean)
+                # Signals another channel already posted within the window are
+                # duplicates
+                stage_start = clock()
+                seen, is_duplicate = self.deduplicator.check(signal_data)
+                self.stage_seconds.observe(clock() - stage_start, 'dedup', channel)
+                # Follow-ups may reply to either post, so both are indexed
+                self.open_signals.add(OpenSignal(channel, message.id, signal_data['symbol'],
+                                                 len(signal_data['take_profits']), seen=seen))
                 
-            # Enhanced position detection  
-            if not position:
-                position = self._extract_position(line_lower)
+                # Routes can filter on the source channel, so they are resolved
+                # for every post; a duplicate only goes to the destinations
+                # the signal has not reached yet
+                stage_start = clock()
+                destinations = self.routes.destinations(signal_data)
+                if is_duplicate:
+                    destinations = [destination for destination in destinations
+                                    if str(destination) not in seen.destinations]
+                route_seconds = clock() - stage_start
                 
-            # Enhanced entry detection with specific patterns
-            if not entry:
-                if any(keyword in line_lower for keyword in ['entry', 'e:']):
-                    entry = self._extract_price(line_clean)
-                elif symbol and not any(keyword in line_lower for keyword in ['tp', 'sl', 'stop', 'target']):
-                    # For format like "GOLD BUY 3373.33" or "USDCAD SELL 1.37480"
-                    if any(pos in line_lower for pos in ['buy', 'sell']):
-                        price = self._extract_price(line_clean)
-                        if price:
-                            entry = price
-                # Also try to extract entry from first line if symbol and position are found
-                elif symbol and position and line_clean == lines[0]:
-                    price = self._extract_price(line_clean)
-                    if price:
-                        entry = price
-                            
-            # Enhanced stop loss detection
-            if not sl:
-                if any(keyword in line_lower for keyword in ['sl', 'stop loss', 'stop']):
-                    if not any(exclude in line_lower for exclude in ['move', 'change', 'hit', 'reached']):
-                        sl = self._extract_price(line_clean)
-                        
-            # Enhanced take profit detection
-            if any(keyword in line_lower for keyword in ['tp', 'target', '✔️']):
-                if not any(exclude in line_lower for exclude in ['move', 'change', 'hit', 'reached', 'close']):
-                    tp_price = self._extract_price(line_clean)
-                    if tp_price and tp_price not in tps:
-                        tps.append(tp_price)
-                        
-            # Risk/Reward detection (enhanced)
-            if not r_r:
-                if any(keyword in line_lower for keyword in ['r/r', 'risk-reward', 'risk/reward']):
-                    r_r = self._extract_risk_reward(line_clean)
+                if is_duplicate:
+                    self.save_duplicate_to_db(seen, signal_data)
+                    if not destinations:
+                        self.messages_total.inc(channel, 'duplicate')
+                        self.logger.info("Duplicate signal from %s (first seen in %s)", channel,
+                                         seen.source_channel,
+                                         extra={'channel': channel, 'symbol': signal_data['symbol'], 'stage': 'dedup'})
+                        return
+                    self.messages_total.inc(channel, 'duplicate_routed')
+                    self.logger.info("Duplicate signal from %s (first seen in %s) routed to %d more destinations",
+                                     channel, seen.source_channel, len(destinations),
+                                     extra={'channel': channel, 'symbol': signal_data['symbol'], 'stage': 'dedup'})
+                    # Edits of a repost do not touch the stored signal, so it is
+                    # not remembered as posted
+                    posted = PostedSignal(channel, message.id, signal_data, seen=seen)
+                else:
+                    self.messages_total.inc(channel, outcome)
+                    
+                    # Save to database (queued, never blocks forwarding)
+                    stage_start = clock()
+                    self.save_signal_to_db(signal_data, seen=seen, timestamp=timestamp)
+                    self.stage_seconds.observe(clock() - stage_start, 'save', channel)
+                    posted = self.posted.add(PostedSignal(channel, message.id, signal_data, seen=seen))
                 
-        # Enhanced final validation
-        if not symbol:
-            return None
-            
-        # Must have entry price
-        if not entry:
-            return None
-            
-        # Must have either stop loss or take profit
-        if not sl and not tps:
-            return None
-            
-        # Set default position if not found (try to infer from context)
-        if not position:
-            # Try to infer from symbol patterns or default to BUY
-            position = "BUY"
-            
-        # Format signal message
-        signal_text = f"📊 #{symbol}\n"
-        signal_text += f"📉 Position: {position}\n"
-        if r_r:
-            signal_text += f"❗️ R/R : {r_r}\n"
-        signal_text += f"💲 Entry Price : {entry}\n"
-        for idx, tp in enumerate(tps):
-            signal_text += f"✔️ TP{idx+1} : {tp}\n"
-        if sl:
-            signal_text += f"🚫 Stop Loss : {sl}"
-            
-        return {
-            'symbol': symbol,
-            'position': position,
-            'entry': entry,
-            'stop_loss': sl,
-            'take_profits': tps,
-            'risk_reward': r_r,
-            'formatted_signal': signal_text,
-            'original_message': text,
-            'source_channel': str(message.chat_id)
-        }
+                # Fan out to every matching destination; each destination has
+                # its own send queue, so deliveries run concurrently
+                stage_start = clock()
+                for destination in destinations:
+                    self.sender.enqueue(destination, signal_data['formatted_signal'],
+                                        on_sent=partial(self._record_forward, posted, destination))
+                seen.destinations.update(str(destination) for destination in destinations)
+                self.stage_seconds.observe(route_seconds + clock() - stage_start, 'route', channel)
+                if not destinations:
+                    if len(self.routes):
+                        self.logger.info("No route matched %s %s", signal_data['symbol'], signal_data['position'],
+                                         extra={'channel': channel, 'symbol': signal_data['symbol'], 'stage': 'route'})
+                    else:
+                        self.logger.warning("No destination channel configured")
+            elif text and self._handle_update(message, text, channel, timestamp):
+                return
+            else:
+                self.messages_total.inc(channel, outcome)
+                self.logger.debug("Message did not match signal pattern from channel %s: %.100s...", channel, text,
+                                  extra={'category': 'no_match', 'channel': channel, 'outcome': outcome})
+                # Still advance the channel checkpoint past this message
+                self.writer.mark_processed(channel, message.id)
+                    
+        except Exception as e:
+            self.messages_total.inc(str(getattr(message, 'chat_id', '')), 'error')
+            self.logger.error(f"Error handling signal: {str(e)}")
+        finally:
+            self.stage_seconds.observe(clock() - started, 'total', str(getattr(message, 'chat_id', '')))
     
-    def _extract_symbol(self, line):
-        """Extract trading symbol from line with enhanced patterns"""
-        line_upper = line.upper().strip()
+    def _handle_update(self, message, text, channel, timestamp=None):
+        """Apply a follow-up to the open signal it refers to; False if it is not one"""
+        start = time.perf_counter()
+        update = parse_update(text, channel)
+        if update is None:
+            return False
         
-        # Remove common prefixes and emojis
-        line_clean = re.sub(r'[📊🔥✅❌#$]', '', line_upper).strip()
+        entry = self.open_signals.match(channel, getattr(message, 'reply_to_msg_id', None), update['symbol'])
+        self.stage_seconds.observe(time.perf_counter() - start, 'update', channel)
+        if entry is None:
+            self.messages_total.inc(channel, 'update_unmatched')
+            self.writer.mark_processed(channel, message.id)
+            return True
         
-        # Enhanced patterns for different formats
-        patterns = [
-            # Forex pairs
-            r'\b(EUR[A-Z]{3})\b',
-            r'\b(GBP[A-Z]{3})\b', 
-            r'\b(USD[A-Z]{3})\b',
-            r'\b(AUD[A-Z]{3})\b',
-            r'\b(NZD[A-Z]{3})\b',
-            r'\b(CAD[A-Z]{3})\b',
-            r'\b(CHF[A-Z]{3})\b',
-            r'\b(JPY[A-Z]{3})\b',
-            r'\b([A-Z]{3}USD)\b',
-            r'\b([A-Z]{3}CAD)\b',
-            r'\b([A-Z]{3}AUD)\b',
-            r'\b([A-Z]{3}GBP)\b',
-            r'\b([A-Z]{3}EUR)\b',
-            r'\b([A-Z]{3}CHF)\b',
-            r'\b([A-Z]{3}JPY)\b',
+        update['status'] = self.open_signals.apply(entry, update)
+        self.writer.submit_update(entry, update, message.id, timestamp=timestamp)
+        self.messages_total.inc(channel, 'update')
+        self.logger.info("Signal update %s for %s: now %s", update['kind'], entry.symbol, update['status'],
+                         extra={'channel': channel, 'symbol': entry.symbol, 'stage': 'update'})
+        return True
+    
+    async def edit_handler(self, event):
+        """Handle edits of messages in monitored channels"""
+        await self.process_edit(event.message)
+    
+    async def process_edit(self, message):
+        """Re-parse an edited post and bring its stored and forwarded signal up to date"""
+        started = time.perf_counter()
+        channel = str(message.chat_id)
+        try:
+            text = message.message or ''
+            posted = self.posted.get(channel, message.id)
+            if posted is None:
+                # Older than the in-memory map (or from before a restart)
+                row = await asyncio.get_running_loop().run_in_executor(
+                    None, self.writer.load_posted, channel, message.id)
+                if row is not None:
+                    signal_id, signal_data, forwarded = row
+                    posted = self.posted.add(PostedSignal(channel, message.id, signal_data,
+                                                          signal_id=signal_id, forwarded=forwarded))
             
-            # Crypto patterns
-            r'\b([A-Z]{3,8}USDT?)\b',
-            r'\b([A-Z]{3,8}BTC)\b',
-            r'\b([A-Z]{3,8}ETH)\b',
+            signal_data, outcome = self._parse_staged(text, channel) if text else (None, 'empty')
+            if posted is None:
+                if not signal_data:
+                    self.messages_total.inc(channel, 'edit_ignored')
+                elif (self.open_signals.get(channel, message.id) is not None
+                      or await asyncio.get_running_loop().run_in_executor(
+                          None, self.writer.is_duplicate_post, channel, message.id)):
+                    # A repost recorded as a duplicate; the original's own
+                    # post is the one whose edits count
+                    self.messages_total.inc(channel, 'edit_duplicate')
+                    self.logger.info("Edited post %s in %s is a duplicate signal, ignoring the edit",
+                                     message.id, channel, extra={'channel': channel, 'stage': 'edit'})
+                else:
+                    # Edited into a signal: handle it like a new post
+                    self.messages_total.inc(channel, 'edit_new_signal')
+                    await self.process_message(message)
+                return
+            if signal_data is None:
+                self.messages_total.inc(channel, 'edit_unparsed')
+                self.logger.info("Edited signal post %s in %s no longer parses (%s), keeping stored values",
+                                 message.id, channel, outcome, extra={'channel': channel, 'stage': 'edit'})
+                return
             
-            # Gold patterns
-            r'\b(XAUUSD)\b',
-            r'\b(GOLD)\b',
-            r'\b(XAU[A-Z]*)\b',
+            changes = signal_changes(posted.signal_data, signal_data)
+            if not changes:
+                self.messages_total.inc(channel, 'edit_unchanged')
+                return
             
-            # General 6-letter pairs
-            r'\b([A-Z]{6})\b',
+            signal_data['source_message_id'] = message.id
+            self.writer.submit_edit(posted, signal_data)
+            self._reindex_edited(channel, message.id, signal_data)
+            posted.signal_data = signal_data
+            self.messages_total.inc(channel, 'edited')
+            self.logger.info("Signal %s edited in %s: %s", signal_data['symbol'], channel, ', '.join(changes),
+                             extra={'channel': channel, 'symbol': signal_data['symbol'], 'stage': 'edit'})
             
-            # Fallback patterns
-            r'\b([A-Z]{3,8})\b'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, line_clean)
-            if match:
-                symbol = match.group(1)
-                # Validate symbol length and format
-                if 3 <= len(symbol) <= 8:
-                    return symbol
-        
-        return ""
+            for destination in self.routes.destinations(signal_data):
+                forwarded_id = posted.forwarded.get(str(destination)) if self.edit_forwarded else None
+                if forwarded_id is not None:
+                    self.sender.enqueue_edit(destination, forwarded_id, signal_data['formatted_signal'])
+                else:
+                    self.sender.enqueue(destination, signal_data['formatted_signal'],
+                                        on_sent=partial(self._record_forward, posted, destination))
+        except Exception as e:
+            self.messages_total.inc(channel, 'error')
+            self.logger.error(f"Error handling edited message: {str(e)}")
+        finally:
+            self.stage_seconds.observe(time.perf_counter() - started, 'edit', channel)
     
-    def _extract_position(self, line_lower):
-        """Extract position type from line with enhanced detection"""
-        # Skip lines that contain update keywords
-        if any(word in line_lower for word in ['close', 'profit', 'update', 'move', 'change']):
-            return ""
-            
-        # Buy patterns
-        buy_patterns = ['buy', 'long', 'buy limit', 'buy!']
-        for pattern in buy_patterns:
-            if pattern in line_lower:
-                return "BUY"
-                
-        # Sell patterns  
-        sell_patterns = ['sell', 'short', 'sell limit', 'sell!']
-        for pattern in sell_patterns:
-            if pattern in line_lower:
-                return "SELL"
-                
-        return ""
+    def _reindex_edited(self, channel, message_id, signal_data):
+        """Move an open signal to its new symbol / TP count after an edit"""
+        entry = self.open_signals.get(channel, message_id)
+        if entry is None:
+            return
+        self.open_signals.remove(entry)
+        entry.symbol = signal_data['symbol']
+        entry.tp_count = len(signal_data['take_profits'])
+        self.open_signals.add(entry)
     
-    def _extract_price(self, line):
-        """Extract price from line with enhanced patterns for different formats"""
-        # Enhanced patterns for different price formats
-        price_patterns = [
-            # Format: "E: 1.78250" or "Entry: 1.78250"
-            r'(?:entry|e)\s*:?\s*(\d+\.\d+)',
-            # Format: "TP: 1.76850" or "Tp: 1.76850"
-            r'(?:tp\d*|target)\s*:?\s*(\d+\.\d+)',
-            # Format: "SL: 1.78700" or "Sl: 1.78700" 
-            r'(?:sl|stop)\s*:?\s*(\d+\.\d+)',
-            # Format: "Entry Price : 3355.00"
-            r'entry\s*price\s*:?\s*(\d+\.?\d*)',
-            # Format: "Stop Loss : 3360.00"
-            r'stop\s*loss\s*:?\s*(\d+\.?\d*)',
-            # Format: "USDCAD SELL 1.37480" or "GOLD BUY 3373.33"
-            r'(?:buy|sell)\s+(\d+\.\d+)',
-            # Format: "GOLD BUY LIMIT 3350" or just "GOLD BUY 3350"
-            r'(?:buy|sell)\s+(?:limit\s+)?(\d+\.?\d*)',
-            # Simple format after symbol and position: "SYMBOL BUY/SELL PRICE"
-            r'[A-Z]{3,8}\s+(?:buy|sell)\s+(\d+\.?\d*)',
-            # General decimal pattern
-            r'(\d+\.\d{2,8})',
-            # Large integer (like 3350 for gold)
-            r'\b(\d{4,})\b'
-        ]
-        
-        line_lower = line.lower()
-        
-        for pattern in price_patterns:
-            match = re.search(pattern, line_lower)
-            if match:
-                price_str = match.group(1)
-                try:
-                    price = float(price_str)
-                    # Reasonable price ranges for different markets
-                    if 0.000001 <= price <= 50000:  # Extended range for gold
-                        return price_str
-                except ValueError:
-                    continue
-        
-        return ""
+    def _record_forward(self, posted, destination, sent):
+        """Remember (and store) the message a signal was forwarded as"""
+        posted.forwarded[str(destination)] = sent.id
+        self.writer.submit_forwarded(posted, destination, sent.id)
     
-    def _extract_risk_reward(self, line):
-        """Extract risk/reward ratio"""
-        patterns = [
-            r'r/r[:\s]*(\d+[:\s/]\d+)',
-            r'risk[:\s/]*(\d+[:\s/]\d+)',
-            r'(\d+[:\s/]\d+)',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, line.lower())
-            if match:
-                return match.group(1)
-        return ""
+    def call_in_loop(self, callback, *args):
+        """Run ``callback(*args)`` on the bot's event loop, which owns the
+        in-memory indexes; runs it directly when the loop is not running"""
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(callback, *args)
+                return
+            except RuntimeError:
+                # The loop closed in the meantime
+                pass
+        callback(*args)
     
-    def save_signal_to_db(self, signal_data):
-        """Save parsed signal to database"""
+    def clear_caches(self):
+        """Forget every remembered signal (the stored history was deleted)"""
+        self.deduplicator.clear()
+        self.open_signals.clear()
+        self.posted.clear()
+    
+    def forget_signals(self, signal_ids):
+        """Drop stored signals that left the database (archived) from the indexes"""
+        removed = self.open_signals.remove_signals(signal_ids)
+        self.posted.remove_signals(signal_ids)
+        if removed:
+            self.logger.info(f"Dropped {removed} archived signals from the open-signal index")
+    
+    def rebuild_open_signals(self):
+        """Load the open-signal index from the database (run before handling messages)"""
+        rows = self.writer.load_open_signals(self.open_signals.max_entries)
+        self.open_signals.clear()
+        for signal_id, channel, message_id, symbol, tp_count, status in rows:
+            if message_id is None:
+                continue
+            self.open_signals.add(OpenSignal(channel, message_id, symbol, tp_count,
+                                             status=status or 'open', signal_id=signal_id))
+        self.logger.info(f"Loaded {len(self.open_signals)} open signals")
+    
+    async def _send(self, destination, text):
+        """``client.send_message`` timed per destination"""
+        start = time.perf_counter()
         try:
-            from app import app, db
-            from models import Signal
-            
-            with app.app_context():
-                signal = Signal(
-                    symbol=signal_data['symbol'],
-                    position=signal_data['position'],
-                    entry=signal_data['entry'],
-                    stop_loss=signal_data['stop_loss'],
-                    take_profits=json.dumps(signal_data['take_profits']),
-                    risk_reward=signal_data['risk_reward'],
-                    source_channel=signal_data['source_channel'],
-                    formatted_signal=signal_data['formatted_signal'],
-                    original_message=signal_data['original_message'],
-                    timestamp=datetime.utcnow()
-                )
-                
-                db.session.add(signal)
-                db.session.commit()
-                self.logger.info(f"Signal saved: {signal_data['symbol']} {signal_data['position']}")
-                
+            return await self.client.send_message(destination, text)
+        finally:
+            self.send_seconds.observe(time.perf_counter() - start, str(destination))
+    
+    async def _edit(self, destination, message_id, text):
+        """``client.edit_message`` timed per destination"""
+        start = time.perf_counter()
+        try:
+            return await self.client.edit_message(destination, message_id, text)
+        finally:
+            self.send_seconds.observe(time.perf_counter() - start, str(destination))
+    
+    async def catch_up(self):
+        """Process messages posted since each channel's stored checkpoint.
+        
+        Channels without a checkpoint (first run) start from live messages
+        only. Channels are fetched concurrently, each oldest-first. A
+        channel's checkpoint is held (see ``SignalWriter.hold_checkpoints``)
+        until its backlog is queued; if fetching it fails, it stays held, so
+        the next start fetches the same messages again.
+        """
+        self._catching_up = True
+        try:
+            loop = asyncio.get_running_loop()
+            checkpoints = await loop.run_in_executor(None, self.writer.load_checkpoints)
+            if not checkpoints:
+                self.writer.release_checkpoints()
+                return
+            await asyncio.gather(*(self._catch_up_channel(channel, checkpoints)
+                                   for channel in self.from_channels))
         except Exception as e:
-            self.logger.error(f"Error saving signal to database: {str(e)}")
+            self.logger.error(f"Error catching up on missed messages: {str(e)}")
+        finally:
+            self._catching_up = False
+            self._claimed.clear()
     
-    async def signal_handler(self, event):
-        """Handle new messages from monitored channels"""
+    async def _catch_up_channel(self, channel, checkpoints):
         try:
-            self.logger.info(f"New message received from channel {event.chat_id}: {event.message.message[:100]}...")
+            entity = await self.client.get_input_entity(channel)
+            chat_id = str(get_peer_id(entity))
+            last_id = checkpoints.get(chat_id)
+            if last_id is None:
+                self.writer.release_checkpoints(chat_id)
+                return
             
-            signal_data = self.parse_signal(event.message)
-            if signal_data:
-                self.logger.info(f"Signal parsed successfully: {signal_data['symbol']} {signal_data['position']}")
-                
-                # Save to database
-                self.save_signal_to_db(signal_data)
-                
-                # Forward to destination channel
-                if self.to_channel:
-                    await self.client.send_message(
-                        self.to_channel, 
-                        signal_data['formatted_signal']
-                    )
-                    self.logger.info(f"Signal forwarded to {self.to_channel}")
-                else:
-                    self.logger.warning("No destination channel configured")
-            else:
-                self.logger.debug(f"Message did not match signal pattern from channel {event.chat_id}: {event.message.message[:100]}...")
-                    
+            # Bound the fetch at the newest message now; anything after it
+            # arrives through the live handler
+            latest = await self.client.get_messages(entity, limit=1)
+            if not latest or latest[0].id <= last_id:
+                self.writer.release_checkpoints(chat_id)
+                return
+            newest = latest[0].id
+            
+            count = 0
+            last_seen = last_id
+            async for message in self.client.iter_messages(entity, min_id=last_id, max_id=newest + 1,
+                                                           reverse=True, limit=self.catchup_limit):
+                timestamp = message.date.astimezone(timezone.utc).replace(tzinfo=None) if message.date else None
+                await self.process_message(message, timestamp=timestamp)
+                count += 1
+                last_seen = message.id
+            # Every caught-up message is queued, so the checkpoint can follow
+            # once they are saved
+            self.writer.release_checkpoints(chat_id)
+            if count:
+                self.logger.info(f"Caught up {count} missed messages from {channel}")
+            if count >= self.catchup_limit and last_seen < newest:
+                self.logger.warning(f"Catch-up of {channel} stopped at catchup_limit ({self.catchup_limit}): "
+                                    f"messages {last_seen + 1} to {newest} were skipped")
         except Exception as e:
-            self.logger.error(f"Error handling signal: {str(e)}")
+            self.logger.error(f"Error catching up channel {channel}, its checkpoint stays at the last "
+                              f"caught-up message until the next start: {str(e)}")
+    
+    def _notify_status(self, status):
+        """Tell status listeners about a change ('running' or 'stopped')"""
+        if status == self._last_status:
+            return
+        self._last_status = status
+        for listener in self.status_listeners:
+            try:
+                listener(status)
+            except Exception as e:
+                self.logger.error(f"Error in status listener: {str(e)}")
     
     def start(self):
-        """Start the Telegram bot"""
+        """Start the Telegram bot; blocks until it stops, then flushes the writer"""
         try:
             self.running = True
+            self.loop_thread_id = get_ident()
+            self.writer.start()
             asyncio.run(self._run_bot())
         except Exception as e:
             self.logger.error(f"Error starting bot: {str(e)}")
             self.running = False
+        finally:
+            self.writer.stop()
     
     async def _run_bot(self):
         """Internal method to run the bot"""
         try:
-            self.client = TelegramClient(self.session_name, self.api_id, self.api_hash)
+            # FloodWait errors are handled by the send queue instead of
+            # Telethon sleeping inside send_message
+            self.loop = asyncio.get_running_loop()
+            self.client = self.client_factory(self.session_name, self.api_id, self.api_hash,
+                                              flood_sleep_threshold=0)
+            # Index open signals before any message can reference them
+            await asyncio.get_running_loop().run_in_executor(None, self.rebuild_open_signals)
+            
+            self.sender = OutboundSender(
+                self._send,
+                rate=self.send_rate,
+                burst=self.send_burst,
+                flood_wait_errors=(FloodWaitError,),
+                logger=self.logger,
+                edit=self._edit
+            )
             
             # Register event handler
             @self.client.on(events.NewMessage(chats=self.from_channels))
             async def handler(event):
                 await self.signal_handler(event)
             
+            @self.client.on(events.MessageEdited(chats=self.from_channels))
+            async def edit_handler(event):
+                await self.edit_handler(event)
+            
+            # Hold checkpoints until catch-up has queued each channel's
+            # backlog, so live messages cannot move them past it
+            self.writer.hold_checkpoints()
+            
             # Start client
             await self.client.start()
             self.logger.info("Telegram bot started successfully")
+            self._notify_status("running")
+            
+            # Fetch whatever was posted while the bot was offline; the loop
+            # only keeps a weak reference to tasks, so hold on to it
+            self._catch_up_task = asyncio.get_running_loop().create_task(self.catch_up())
             
             # Keep running
             await self.client.run_until_disconnected()
@@ -493,18 +550,44 @@ class SignalBot:
         except Exception as e:
             self.logger.error(f"Bot error: {str(e)}")
         finally:
+            if self._catch_up_task is not None:
+                self._catch_up_task.cancel()
+                await asyncio.gather(self._catch_up_task, return_exceptions=True)
+                self._catch_up_task = None
+            if self.sender:
+                await self.sender.close(timeout=0)
+            self.loop = None
             self.running = False
+            self._notify_status("stopped")
     
-    def stop(self):
-        """Stop the Telegram bot"""
+    def stop(self, timeout=10):
+        """Stop the Telegram bot; called from other threads (the worker's control connection).
+        
+        The client is disconnected on the bot's event loop, which ends
+        ``run_until_disconnected``; the send queue and the writer are shut
+        down by ``_run_bot`` and ``start`` once the loop has finished, so
+        nothing the loop still submits is lost.
+        """
         try:
+            loop = self.loop
             if self.client and self.client.is_connected():
-                self.client.disconnect()
+                if loop is not None and loop.is_running():
+                    future = asyncio.run_coroutine_threadsafe(self._disconnect(), loop)
+                    future.result(timeout)
+                else:
+                    self.client.disconnect()
             self.running = False
+            self._notify_status("stopped")
             self.logger.info("Bot stopped successfully")
         except Exception as e:
             self.logger.error(f"Error stopping bot: {str(e)}")
     
+    async def _disconnect(self):
+        # On a running loop Telethon's disconnect() returns an awaitable
+        result = self.client.disconnect()
+        if inspect.isawaitable(result):
+            await result
+    
     def is_running(self):
         """Check if bot is currently running"""
         return self.running and self.client and self.client.is_connected()
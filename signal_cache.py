@@ -0,0 +1,208 @@
+"""In-memory copies of what the dashboard and /api/signals read on every request.
+
+``RecentSignals`` is a bounded ring buffer of the newest signals (as
+``to_dict`` payloads) plus the total count; ``ConfigCache`` holds the stored
+``Config``. Each web worker keeps its own copies, filled from the database on
+first use and then kept current by the bot worker's events (see
+``EventRelay``): new signals are appended, and 'signal_changed' and
+'invalidate' events drop the copy so the next request reloads it.
+
+Events are the only way a web worker hears about writes made elsewhere, so
+the caches are only used while the relay is connected. Until then, and
+after it loses the worker, every read goes to the database.
+"""
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime
+from threading import Lock
+
+from prices import parse_price
+
+
+class SignalSnapshot:
+    """Read-only stand-in for a ``Signal`` row built from its ``to_dict`` payload.
+
+    Has the attributes and methods the templates use, so cached and
+    freshly queried signals render the same.
+    """
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __getattr__(self, name):
+        try:
+            return self.data[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    @property
+    def entry(self):
+        return parse_price(self.data['entry'])
+
+    @property
+    def stop_loss(self):
+        return parse_price(self.data['stop_loss'])
+
+    @property
+    def timestamp(self):
+        return datetime.strptime(self.data['timestamp'], '%Y-%m-%d %H:%M:%S')
+
+    def get_take_profits_list(self):
+        return self.data['take_profits']
+
+    def to_dict(self):
+        return self.data
+
+    def __repr__(self):
+        return f"<SignalSnapshot {self.data['id']} {self.data['symbol']} {self.data['position']}>"
+
+
+class _Cached(ABC):
+    """Load-once value that any event can invalidate.
+
+    ``_generation`` moves on every change notification, so a load that was
+    running while one arrived is not kept (it may have read the database
+    just before the change committed).
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._loaded = False
+        self._generation = 0
+        self.enabled = False
+        self.hits = 0
+        self.misses = 0
+
+    def enable(self):
+        """Start caching; called once the relay is receiving events"""
+        with self._lock:
+            self._reset()
+            self.enabled = True
+
+    def disable(self):
+        """Stop caching; called when the relay loses the bot worker"""
+        with self._lock:
+            self._reset()
+            self.enabled = False
+
+    def invalidate(self):
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self._generation += 1
+        self._loaded = False
+
+    def _load(self, loader):
+        """Run ``loader()`` outside the lock and keep its result if nothing changed meanwhile"""
+        with self._lock:
+            generation = self._generation
+        self.misses += 1
+        value = loader()
+        with self._lock:
+            if self.enabled and generation == self._generation:
+                self._store(value)
+                self._loaded = True
+        return value
+
+    @abstractmethod
+    def _store(self, value):
+        """Keep a freshly loaded value; called with the lock held"""
+
+
+class RecentSignals(_Cached):
+    """The newest ``size`` signals, newest first, the total signal count and
+    the signal revision (``SignalCounter.SIGNAL_REVISION``).
+
+    The writer bumps the stored revision once per committed batch that
+    changes signals and publishes one 'signal_changed' event for it, so
+    counting those events keeps the revision in step without a query.
+    """
+
+    def __init__(self, size=100):
+        super().__init__()
+        self.size = size
+        self._signals = deque(maxlen=size)
+        self._total = 0
+        self._revision = 0
+
+    def get(self, loader):
+        """(newest first list of ``SignalSnapshot``, total, revision) from memory, or from
+        ``loader(size)`` -> (list of ``to_dict`` payloads, total, revision) on a miss"""
+        with self._lock:
+            if self.enabled and self._loaded:
+                self.hits += 1
+                return list(self._signals), self._total, self._revision
+
+        def load():
+            payloads, total, revision = loader(self.size)
+            return [SignalSnapshot(data) for data in payloads], total, revision
+
+        return self._load(load)
+
+    def _store(self, value):
+        signals, total, revision = value
+        self._signals = deque(signals, maxlen=self.size)
+        self._total = total
+        self._revision = revision
+
+    def add(self, data):
+        """A new signal was committed (``signal`` event payload)"""
+        with self._lock:
+            self._generation += 1
+            if not self._loaded:
+                return
+            if self._signals and data['id'] <= self._signals[0].id:
+                # Out of order (or already loaded); the next load sorts it out
+                self._reset()
+                return
+            self._signals.appendleft(SignalSnapshot(data))
+            self._total += 1
+
+    def changed(self, signal_ids):
+        """Stored signals were updated or edited; drop the buffer if it holds any of them"""
+        with self._lock:
+            self._generation += 1
+            if self._loaded and self._signals and max(signal_ids) >= self._signals[-1].id:
+                self._reset()
+            self._revision += 1
+
+    def select(self, signals, limit, before_id=None, since_id=None):
+        """One /api/signals page cut from ``signals`` (a ``get`` result), or None
+        when the page reaches past the oldest buffered signal"""
+        page = [signal for signal in signals
+                if (before_id is None or signal.id < before_id) and (since_id is None or signal.id > since_id)]
+        # The buffer always holds the newest signals without gaps, so it can
+        # answer when it fills the page, holds every signal, or holds
+        # everything newer than since_id
+        if (len(page) >= limit or len(signals) < self.size
+                or (since_id is not None and since_id >= signals[-1].id)):
+            return page[:limit]
+        return None
+
+    def stats(self):
+        return {'enabled': self.enabled, 'loaded': self._loaded, 'size': len(self._signals),
+                'capacity': self.size, 'hits': self.hits, 'misses': self.misses}
+
+
+class ConfigCache(_Cached):
+    """The stored ``Config``, detached from any session"""
+
+    def __init__(self):
+        super().__init__()
+        self._config = None
+
+    def get(self, loader):
+        with self._lock:
+            if self.enabled and self._loaded:
+                self.hits += 1
+                return self._config
+        return self._load(loader)
+
+    def _store(self, value):
+        self._config = value
+
+    def stats(self):
+        return {'enabled': self.enabled, 'loaded': self._loaded, 'hits': self.hits, 'misses': self.misses}
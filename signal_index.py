@@ -0,0 +1,202 @@
+from collections import OrderedDict
+
+# Signal.status for each update kind; None keeps the current status
+UPDATE_STATUS = {
+    'activated': 'active',
+    'tp_hit': None,  # 'tp<level>', see status_after
+    'move_sl': 'sl_moved',
+    'break_even': 'break_even',
+    'partial_close': 'partially_closed',
+    'sl_hit': 'stopped',
+    'cancelled': 'cancelled',
+    'closed': 'closed',
+}
+
+# Statuses after which a signal takes no more updates
+TERMINAL_STATUSES = frozenset(('stopped', 'cancelled', 'closed', 'tp_final'))
+
+
+def status_after(update, tp_count):
+    """New Signal.status once ``update`` applies to a signal with ``tp_count`` TPs"""
+    if update['kind'] == 'tp_hit':
+        level = update['level']
+        if level is None:
+            return 'tp'
+        if tp_count and level >= tp_count:
+            return 'tp_final'
+        return f'tp{level}'
+    return UPDATE_STATUS.get(update['kind'])
+
+
+class OpenSignal:
+    """Index entry for a signal that can still receive updates.
+
+    A live signal's id is only known once the writer commits it; until then
+    it is read from the ``SeenSignal`` the writer fills in.
+    """
+
+    __slots__ = ('channel', 'message_id', 'symbol', 'tp_count', 'status', '_signal_id', 'seen')
+
+    def __init__(self, channel, message_id, symbol, tp_count, status='open', signal_id=None, seen=None):
+        self.channel = channel
+        self.message_id = message_id
+        self.symbol = symbol
+        self.tp_count = tp_count
+        self.status = status
+        self._signal_id = signal_id
+        self.seen = seen
+
+    @property
+    def signal_id(self):
+        if self._signal_id is None and self.seen is not None:
+            self._signal_id = self.seen.signal_id
+        return self._signal_id
+
+
+class OpenSignalIndex:
+    """Bounded in-memory index of open signals for matching follow-ups.
+
+    An update is matched by the message it replies to, (channel, reply-to
+    id), or else to the newest open signal for (channel, symbol). Both
+    lookups are dict operations. At most ``max_entries`` signals are kept;
+    the oldest is evicted first.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._by_message = OrderedDict()
+        self._by_symbol = {}
+        self.matched = 0
+        self.unmatched = 0
+        self.evictions = 0
+
+    def add(self, entry):
+        key = (entry.channel, entry.message_id)
+        self._by_message[key] = entry
+        self._by_symbol.setdefault((entry.channel, entry.symbol), OrderedDict())[entry.message_id] = entry
+        while len(self._by_message) > self.max_entries:
+            _, evicted = self._by_message.popitem(last=False)
+            self._forget(evicted)
+            self.evictions += 1
+        return entry
+
+    def _forget(self, entry):
+        by_symbol = self._by_symbol.get((entry.channel, entry.symbol))
+        if by_symbol is not None:
+            by_symbol.pop(entry.message_id, None)
+            if not by_symbol:
+                del self._by_symbol[(entry.channel, entry.symbol)]
+
+    def get(self, channel, message_id):
+        """Entry of the signal posted as ``message_id`` in ``channel``, or None"""
+        return self._by_message.get((channel, message_id))
+
+    def remove(self, entry):
+        self._by_message.pop((entry.channel, entry.message_id), None)
+        self._forget(entry)
+
+    def remove_signals(self, signal_ids):
+        """Drop the entries of the stored signals ``signal_ids``; returns how many were dropped"""
+        entries = [entry for entry in self._by_message.values() if entry.signal_id in signal_ids]
+        for entry in entries:
+            self.remove(entry)
+        return len(entries)
+
+    def match(self, channel, reply_to=None, symbol=''):
+        """Open signal an update in ``channel`` refers to, or None"""
+        entry = None
+        if reply_to is not None:
+            entry = self._by_message.get((channel, reply_to))
+        if entry is None and symbol:
+            by_symbol = self._by_symbol.get((channel, symbol))
+            if by_symbol:
+                entry = by_symbol[next(reversed(by_symbol))]
+        if entry is None:
+            self.unmatched += 1
+        else:
+            self.matched += 1
+        return entry
+
+    def apply(self, entry, update):
+        """Record ``update`` on ``entry``; closed signals leave the index. Returns the new status."""
+        status = status_after(update, entry.tp_count) or entry.status
+        entry.status = status
+        if status in TERMINAL_STATUSES:
+            self.remove(entry)
+        return status
+
+    def clear(self):
+        self._by_message.clear()
+        self._by_symbol.clear()
+
+    def __len__(self):
+        return len(self._by_message)
+
+    def stats(self):
+        return {
+            'size': len(self._by_message),
+            'max_entries': self.max_entries,
+            'matched': self.matched,
+            'unmatched': self.unmatched,
+            'evictions': self.evictions,
+        }
+
+
+class PostedSignal:
+    """A stored signal and where it was forwarded, keyed by its source post.
+
+    ``forwarded`` maps destination (as a string) to the forwarded message id,
+    so an edit of the source post can edit those messages.
+    """
+
+    __slots__ = ('channel', 'message_id', 'signal_data', 'forwarded', '_signal_id', 'seen')
+
+    def __init__(self, channel, message_id, signal_data, signal_id=None, seen=None, forwarded=None):
+        self.channel = channel
+        self.message_id = message_id
+        self.signal_data = signal_data
+        self.forwarded = forwarded if forwarded is not None else {}
+        self._signal_id = signal_id
+        self.seen = seen
+
+    @property
+    def signal_id(self):
+        if self._signal_id is None and self.seen is not None:
+            self._signal_id = self.seen.signal_id
+        return self._signal_id
+
+
+class PostedSignals:
+    """Bounded map of (channel, source message id) to PostedSignal, least recently used evicted.
+
+    Older posts are looked up in the database instead (see
+    ``SignalWriter.load_posted``).
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def add(self, entry):
+        self._entries[(entry.channel, entry.message_id)] = entry
+        self._entries.move_to_end((entry.channel, entry.message_id))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def get(self, channel, message_id):
+        entry = self._entries.get((channel, message_id))
+        if entry is not None:
+            self._entries.move_to_end((channel, message_id))
+        return entry
+
+    def remove_signals(self, signal_ids):
+        """Drop the entries of the stored signals ``signal_ids``"""
+        for key in [key for key, entry in self._entries.items() if entry.signal_id in signal_ids]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,561 @@
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+
+from prices import parse_price
+
+# Pre-validation: Must contain at least one trading keyword
+SIGNAL_KEYWORDS = ('entry', 'tp', 'sl', 'target', 'stop', 'buy', 'sell', 'long', 'short')
+
+# Common non-signal patterns (updates, promotions, announcements)
+NON_SIGNAL_PATTERNS = [
+    r'close.*profit',
+    r'move sl',
+    r'change tp',
+    r'\+\d+.*pips',
+    r'sl reached',
+    r'tp reached',
+    r'break.*even',
+    r'entry.*break.*even',
+    r'position.*update',
+    r'trade.*update',
+    r'close.*position',
+    r'delete',
+    r'remove.*order',
+    r'cancel',
+    r'activated',
+    r'didn.*t.*activate',
+    r'subscription',
+    r'upgrade',
+    r'contact.*@',
+    r'website',
+    r'calculator',
+    r'economic.*calendar',
+    r'risk.*management',
+    r'lot.*size',
+    r'weekend',
+    r'market.*close',
+    r'analyze?',
+    r'tradingview',
+    r'screenshot',
+    r'profit.*screenshot',
+    r'important.*update',
+    r'note.*from',
+    r'apologize',
+    r'transparency',
+    r'support.*on',
+    r'favor',
+    r'energy.*flowing'
+]
+
+# Structure validation patterns, one table per signal component
+STRUCTURE_SYMBOL_PATTERNS = [
+    r'[A-Z]{3,8}USD[T]?',
+    r'[A-Z]{3,8}BTC',
+    r'[A-Z]{3,8}ETH',
+    r'XAU[A-Z]*',
+    r'GOLD',
+    r'[A-Z]{6}',  # Like EURAUD, GBPUSD
+    r'#[A-Z]{3,8}'
+]
+
+STRUCTURE_ENTRY_PATTERNS = [
+    r'entry.*price.*:?\s*([\d.]+)',
+    r'e:\s*([\d.]+)',
+    r'entry.*:?\s*([\d.]+)',
+    r'enter.*:?\s*([\d.]+)',
+    # Simple format: "GOLD BUY 3373.33" or "USDCAD SELL 1.37480"
+    r'(?:buy|sell)\s+([\d.]+)',
+    r'(?:buy|sell)\s+(?:limit\s+)?([\d]+)'
+]
+
+STRUCTURE_SL_PATTERNS = [
+    r'stop.*loss.*:?\s*([\d.]+)',
+    r'sl.*:?\s*([\d.]+)',
+    r'stop.*:?\s*([\d.]+)'
+]
+
+STRUCTURE_TP_PATTERNS = [
+    r'tp\d*.*:?\s*([\d.]+)',
+    r'take.*profit.*:?\s*([\d.]+)',
+    r'target.*:?\s*([\d.]+)',
+    r'✔️.*tp\d*.*:?\s*([\d.]+)'
+]
+
+# Symbol extraction patterns, tried in priority order
+SYMBOL_PATTERNS = [
+    # Forex pairs
+    r'EUR[A-Z]{3}',
+    r'GBP[A-Z]{3}',
+    r'USD[A-Z]{3}',
+    r'AUD[A-Z]{3}',
+    r'NZD[A-Z]{3}',
+    r'CAD[A-Z]{3}',
+    r'CHF[A-Z]{3}',
+    r'JPY[A-Z]{3}',
+    r'[A-Z]{3}USD',
+    r'[A-Z]{3}CAD',
+    r'[A-Z]{3}AUD',
+    r'[A-Z]{3}GBP',
+    r'[A-Z]{3}EUR',
+    r'[A-Z]{3}CHF',
+    r'[A-Z]{3}JPY',
+
+    # Crypto patterns
+    r'[A-Z]{3,8}USDT?',
+    r'[A-Z]{3,8}BTC',
+    r'[A-Z]{3,8}ETH',
+
+    # Gold patterns
+    r'XAUUSD',
+    r'GOLD',
+    r'XAU[A-Z]*',
+
+    # General 6-letter pairs
+    r'[A-Z]{6}',
+
+    # Fallback patterns
+    r'[A-Z]{3,8}'
+]
+
+# Price extraction patterns, tried in priority order
+PRICE_PATTERNS = [
+    # Format: "E: 1.78250" or "Entry: 1.78250"
+    r'(?:entry|e)\s*:?\s*(\d+\.\d+)',
+    # Format: "TP: 1.76850" or "Tp: 1.76850"
+    r'(?:tp\d*|target)\s*:?\s*(\d+\.\d+)',
+    # Format: "SL: 1.78700" or "Sl: 1.78700"
+    r'(?:sl|stop)\s*:?\s*(\d+\.\d+)',
+    # Format: "Entry Price : 3355.00"
+    r'entry\s*price\s*:?\s*(\d+\.?\d*)',
+    # Format: "Stop Loss : 3360.00"
+    r'stop\s*loss\s*:?\s*(\d+\.?\d*)',
+    # Format: "USDCAD SELL 1.37480" or "GOLD BUY 3373.33"
+    r'(?:buy|sell)\s+(\d+\.\d+)',
+    # Format: "GOLD BUY LIMIT 3350" or just "GOLD BUY 3350"
+    r'(?:buy|sell)\s+(?:limit\s+)?(\d+\.?\d*)',
+    # Simple format after symbol and position: "SYMBOL BUY/SELL PRICE"
+    r'[A-Z]{3,8}\s+(?:buy|sell)\s+(\d+\.?\d*)',
+    # General decimal pattern
+    r'(\d+\.\d{2,8})',
+    # Large integer (like 3350 for gold)
+    r'\b(\d{4,})\b'
+]
+
+RISK_REWARD_PATTERNS = [
+    r'r/r[:\s]*(\d+[:\s/]\d+)',
+    r'risk[:\s/]*(\d+[:\s/]\d+)',
+    r'(\d+[:\s/]\d+)',
+]
+
+# Follow-up messages about an earlier signal, tried in order; the first
+# matching kind wins ("move sl to break even" is a break_even update)
+UPDATE_PATTERNS = [
+    ('sl_hit', r'\b(?:sl|stop\s*loss)\s*(?:is\s*|was\s*|has\s*been\s*)?(?:hit|reached|triggered)|stopped\s*out'),
+    ('tp_hit', r'\b(?:tp|take\s*profit|target)\s*(\d)?\s*(?:is\s*|was\s*|has\s*been\s*)?(?:hit|reached|done|achieved|smashed)'),
+    ('cancelled', r'cancel|delete|remove.*order|didn.*t.*activate|not\s*activated'),
+    ('break_even', r'break\s*-?\s*even|sl\s*(?:to|at)\s*entry'),
+    ('move_sl', r'move\s*(?:sl|stop(?:\s*loss)?)(?:\D*?(\d+\.?\d*))?'),
+    ('partial_close', r'close\s*(?:half|partial|part|\d+\s*%)'),
+    ('closed', r'close.*(?:profit|position|trade|now|all)'),
+    ('activated', r'\bactivated\b'),
+]
+
+
+def _any_of(patterns):
+    """Compile a pattern table into one alternation that matches if any entry does"""
+    return re.compile('|'.join(f'(?:{p})' for p in patterns))
+
+
+# Existence checks only need to know whether any pattern of a table matches,
+# so each table collapses into a single alternation scanned once per line.
+_NON_SIGNAL_RE = _any_of(NON_SIGNAL_PATTERNS)
+_STRUCTURE_SYMBOL_RE = _any_of(STRUCTURE_SYMBOL_PATTERNS)
+_STRUCTURE_ENTRY_RE = _any_of(STRUCTURE_ENTRY_PATTERNS)
+_STRUCTURE_SL_RE = _any_of(STRUCTURE_SL_PATTERNS)
+_STRUCTURE_TP_RE = _any_of(STRUCTURE_TP_PATTERNS)
+
+# Extraction tables are priority ordered, so they stay as ordered lists.
+# Symbol patterns are anchored to whole words, which lets them run as
+# fullmatch checks against the uppercase word tokens of a line.
+_SYMBOL_RES = [re.compile(p) for p in SYMBOL_PATTERNS]
+_SYMBOL_STRIP_RE = re.compile(r'[📊🔥✅❌#$]')
+_WORD_RE = re.compile(r'\w+')
+_UPPER_WORD_RE = re.compile(r'[A-Z]+')
+_PRICE_RES = [re.compile(p) for p in PRICE_PATTERNS]
+_RISK_REWARD_RES = [re.compile(p) for p in RISK_REWARD_PATTERNS]
+_UPDATE_RE = _any_of(pattern for _, pattern in UPDATE_PATTERNS)
+_UPDATE_RES = [(kind, re.compile(pattern)) for kind, pattern in UPDATE_PATTERNS]
+# Update messages rarely spell out a pair, so the generic fallbacks of
+# SYMBOL_PATTERNS (which would match words like "HIT") are left out
+_UPDATE_SYMBOL_RE = re.compile('|'.join(f'(?:{p})' for p in SYMBOL_PATTERNS[:-2]))
+_DIGIT_RE = re.compile(r'\d')
+
+_POSITION_EXCLUDES = ('close', 'profit', 'update', 'move', 'change')
+_UPDATE_EXCLUDES = ('move', 'change', 'hit', 'reached')
+_TP_EXCLUDES = ('move', 'change', 'hit', 'reached', 'close')
+
+
+def has_signal_keyword(text_lower):
+    """Cheap keyword prefilter run before the lexer"""
+    return any(keyword in text_lower for keyword in SIGNAL_KEYWORDS)
+
+
+def is_non_signal(text_lower):
+    """Check whether text matches any of the non-signal patterns"""
+    return _NON_SIGNAL_RE.search(text_lower) is not None
+
+
+def symbol_words(line):
+    """Candidate symbol tokens of a line: its upper-cased words made only of A-Z letters.
+
+    Every symbol pattern is bounded by \b on both sides, so a match is
+    always one of these words.
+    """
+    line_clean = _SYMBOL_STRIP_RE.sub('', line.upper().strip()).strip()
+    return [w for w in _WORD_RE.findall(line_clean) if _UPPER_WORD_RE.fullmatch(w)]
+
+
+def extract_symbol(line):
+    """Extract trading symbol from line with enhanced patterns"""
+    words = symbol_words(line)
+    if not words:
+        return ""
+
+    for pattern in _SYMBOL_RES:
+        for word in words:
+            if pattern.fullmatch(word):
+                # Validate symbol length and format
+                if 3 <= len(word) <= 8:
+                    return word
+                break
+
+    return ""
+
+
+def extract_position(line_lower):
+    """Extract position type from line with enhanced detection"""
+    # Skip lines that contain update keywords
+    if any(word in line_lower for word in _POSITION_EXCLUDES):
+        return ""
+
+    # 'buy limit' and 'buy!' are covered by 'buy'
+    if 'buy' in line_lower or 'long' in line_lower:
+        return "BUY"
+
+    if 'sell' in line_lower or 'short' in line_lower:
+        return "SELL"
+
+    return ""
+
+
+def extract_price(line):
+    """Extract price from line with enhanced patterns for different formats"""
+    line_lower = line.lower()
+
+    # Every price pattern needs at least one digit
+    if not _DIGIT_RE.search(line_lower):
+        return ""
+
+    for pattern in _PRICE_RES:
+        match = pattern.search(line_lower)
+        if match:
+            price_str = match.group(1)
+            try:
+                price = float(price_str)
+                # Reasonable price ranges for different markets
+                if 0.000001 <= price <= 50000:  # Extended range for gold
+                    return price_str
+            except ValueError:
+                continue
+
+    return ""
+
+
+def extract_risk_reward(line):
+    """Extract risk/reward ratio"""
+    line_lower = line.lower()
+    for pattern in _RISK_REWARD_RES:
+        match = pattern.search(line_lower)
+        if match:
+            return match.group(1)
+    return ""
+
+
+class SignalLexer:
+    """Single pass over a message that classifies each line once.
+
+    The same walk produces the structure verdict (``valid``) and the
+    extracted fields, so a message is no longer scanned twice.
+    """
+
+    __slots__ = ('valid', 'symbol', 'position', 'entry', 'stop_loss',
+                 'take_profits', 'risk_reward')
+
+    def __init__(self, text):
+        self.valid = False
+        self.symbol = ""
+        self.position = ""
+        self.entry = ""
+        self.stop_loss = ""
+        self.take_profits = []
+        self.risk_reward = ""
+        self._scan(text)
+
+    def _scan(self, text):
+        lines = text.splitlines()
+        first_line = lines[0] if lines else None
+
+        has_symbol = False
+        has_entry = False
+        has_sl = False
+        has_tp = False
+        price_count = 0
+
+        symbol = ""
+        position = ""
+        entry = ""
+        sl = ""
+        r_r = ""
+        tps = self.take_profits
+
+        for line in lines:
+            line_clean = line.strip()
+
+            # Skip empty lines and non-relevant lines
+            if len(line_clean) < 3:
+                continue
+
+            line_lower = line_clean.lower()
+
+            # Structure classification
+            if not has_symbol and _STRUCTURE_SYMBOL_RE.search(line_clean.upper()):
+                has_symbol = True
+            if _STRUCTURE_ENTRY_RE.search(line_lower):
+                has_entry = True
+                price_count += 1
+            if _STRUCTURE_SL_RE.search(line_lower):
+                has_sl = True
+                price_count += 1
+            if _STRUCTURE_TP_RE.search(line_lower):
+                has_tp = True
+                price_count += 1
+
+            # Field extraction
+            if not symbol:
+                symbol = extract_symbol(line_clean)
+
+            if not position:
+                position = extract_position(line_lower)
+
+            if not entry:
+                if 'entry' in line_lower or 'e:' in line_lower:
+                    entry = extract_price(line_clean)
+                elif symbol and not ('tp' in line_lower or 'sl' in line_lower
+                                     or 'stop' in line_lower or 'target' in line_lower):
+                    # For format like "GOLD BUY 3373.33" or "USDCAD SELL 1.37480"
+                    if 'buy' in line_lower or 'sell' in line_lower:
+                        price = extract_price(line_clean)
+                        if price:
+                            entry = price
+                # Also try to extract entry from first line if symbol and position are found
+                elif symbol and position and line_clean == first_line:
+                    price = extract_price(line_clean)
+                    if price:
+                        entry = price
+
+            if not sl:
+                if 'sl' in line_lower or 'stop' in line_lower:
+                    if not any(exclude in line_lower for exclude in _UPDATE_EXCLUDES):
+                        sl = extract_price(line_clean)
+
+            if 'tp' in line_lower or 'target' in line_lower or '✔️' in line_lower:
+                if not any(exclude in line_lower for exclude in _TP_EXCLUDES):
+                    tp_price = extract_price(line_clean)
+                    if tp_price and tp_price not in tps:
+                        tps.append(tp_price)
+
+            if not r_r:
+                if 'r/r' in line_lower or 'risk-reward' in line_lower or 'risk/reward' in line_lower:
+                    r_r = extract_risk_reward(line_clean)
+
+        # Structure validation:
+        # 0. Must have minimum length for valid signals
+        # 1. Must have symbol
+        # 2. Must have entry price
+        # 3. Must have either SL or TP
+        # 4. Must have at least 2 prices (entry + sl/tp)
+        self.valid = (len(text) >= 20 and has_symbol and has_entry and (has_sl or has_tp)
+                      and price_count >= 2)
+
+        self.symbol = symbol
+        self.position = position
+        self.entry = entry
+        self.stop_loss = sl
+        self.risk_reward = r_r
+
+    def to_signal(self, text, source_channel):
+        """Build the signal dict, or None if required fields are missing"""
+        if not self.valid:
+            return None
+
+        return build_signal(self.symbol, self.position, self.entry, self.stop_loss,
+                            self.take_profits, self.risk_reward, text, source_channel)
+
+
+# Fields of a parse result that an edit of the source post can change
+SIGNAL_FIELDS = ('symbol', 'position', 'entry', 'stop_loss', 'take_profits', 'risk_reward')
+
+
+def _comparable(field, value):
+    if field == 'take_profits':
+        return tuple(parse_price(tp) for tp in value or ())
+    if field in ('entry', 'stop_loss'):
+        return parse_price(value)
+    return value or ''
+
+
+def signal_changes(old, new):
+    """Names of the SIGNAL_FIELDS that differ between two parse results (prices compared as numbers)"""
+    return [field for field in SIGNAL_FIELDS
+            if _comparable(field, old.get(field)) != _comparable(field, new.get(field))]
+
+
+def build_signal(symbol, position, entry, sl, tps, r_r, text, source_channel):
+    """Validate extracted fields and format the outgoing signal"""
+    if not symbol:
+        return None
+
+    # Must have entry price
+    if not entry:
+        return None
+
+    # Must have either stop loss or take profit
+    if not sl and not tps:
+        return None
+
+    # Set default position if not found
+    if not position:
+        position = "BUY"
+
+    # Format signal message
+    signal_text = f"📊 #{symbol}\n"
+    signal_text += f"📉 Position: {position}\n"
+    if r_r:
+        signal_text += f"❗️ R/R : {r_r}\n"
+    signal_text += f"💲 Entry Price : {entry}\n"
+    for idx, tp in enumerate(tps):
+        signal_text += f"✔️ TP{idx+1} : {tp}\n"
+    if sl:
+        signal_text += f"🚫 Stop Loss : {sl}"
+
+    return {
+        'symbol': symbol,
+        'position': position,
+        'entry': entry,
+        'stop_loss': sl,
+        'take_profits': tps,
+        'risk_reward': r_r,
+        'formatted_signal': signal_text,
+        'original_message': text,
+        'source_channel': source_channel
+    }
+
+
+def parse_text(text, source_channel):
+    """Parse raw message text into a signal dict (or None)"""
+    text = text.strip()
+    text_lower = text.lower()
+
+    if not has_signal_keyword(text_lower):
+        return None
+
+    if is_non_signal(text_lower):
+        return None
+
+    return SignalLexer(text).to_signal(text, str(source_channel))
+
+
+def parse_update(text, source_channel):
+    """Parse a follow-up ("TP1 reached", "move SL to 1.2", "cancel") into an update dict (or None).
+
+    ``kind`` is one of sl_hit, tp_hit, cancelled, break_even, move_sl,
+    partial_close, closed or activated. ``level`` is the TP number and ``price`` the new
+    stop for move_sl, when the message gives them; ``symbol`` is '' unless
+    the message names a pair.
+    """
+    text_lower = text.lower()
+    if _UPDATE_RE.search(text_lower) is None:
+        return None
+
+    for kind, pattern in _UPDATE_RES:
+        match = pattern.search(text_lower)
+        if match:
+            break
+
+    level = None
+    price = ''
+    if kind == 'tp_hit' and match.group(1):
+        level = int(match.group(1))
+    elif kind == 'move_sl' and match.group(1):
+        price = match.group(1)
+
+    symbol = ''
+    for word in _WORD_RE.findall(_SYMBOL_STRIP_RE.sub('', text.upper())):
+        if 3 <= len(word) <= 8 and _UPPER_WORD_RE.fullmatch(word) and _UPDATE_SYMBOL_RE.fullmatch(word):
+            symbol = word
+            break
+
+    return {
+        'kind': kind,
+        'level': level,
+        'price': price,
+        'symbol': symbol,
+        'source_channel': str(source_channel),
+    }
+
+
+def _parse_chunk(chunk):
+    """Worker entry point: parse a list of (text, channel) pairs"""
+    return [parse_text(text, channel) for text, channel in chunk]
+
+
+def _chunked(items, size):
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_many(items, workers=None, chunk_size=256, parallel_threshold=2048):
+    """Parse an iterable of (text, channel) pairs, yielding results in input order.
+
+    Batches smaller than ``parallel_threshold`` are parsed inline. Larger ones
+    fan out across a process pool in chunks of ``chunk_size``, with at most
+    two chunks per worker in flight so memory stays flat however long the
+    input is. ``workers`` defaults to the CPU count; 0 or 1 forces inline.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    iterator = iter(items)
+    head = list(islice(iterator, parallel_threshold))
+
+    if workers <= 1 or len(head) < parallel_threshold:
+        for text, channel in chain(head, iterator):
+            yield parse_text(text, channel)
+        return
+
+    max_pending = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in _chunked(chain(head, iterator), chunk_size):
+            pending.append(pool.submit(_parse_chunk, chunk))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
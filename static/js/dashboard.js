@@ -2,26 +2,94 @@ class SignalDashboard {
     constructor() {
         this.autoUpdate = true;
         this.updateInterval = null;
-        this.lastSignalCount = 0;
+        this.reconnectTimeout = null;
+        this.eventSource = null;
+        this.streamConnected = false;
+        this.maxSignals = 50;
+        this.signals = [];
+        this.signalsById = new Map();
         this.knownSignals = new Set();
+        this.totalSignals = 0;
         
         this.init();
     }
     
     init() {
-        this.startAutoUpdate();
         this.loadSignals();
+        this.connectStream();
+    }
+    
+    // Live updates arrive over Server-Sent Events; polling is only a fallback
+    // while the stream is down.
+    connectStream() {
+        if (!window.EventSource) {
+            this.startAutoUpdate();
+            return;
+        }
+        
+        this.closeStream();
+        this.eventSource = new EventSource('/api/stream');
+        
+        this.eventSource.onopen = () => {
+            this.streamConnected = true;
+            this.stopAutoUpdate();
+        };
+        
+        this.eventSource.addEventListener('signal', (event) => {
+            this.addSignal(JSON.parse(event.data));
+            this.updateLastUpdateTime();
+        });
+        
+        // Status updates and edits of signals already shown
+        this.eventSource.addEventListener('signal_changed', (event) => {
+            this.refreshSignals(JSON.parse(event.data).ids);
+        });
+        
+        this.eventSource.addEventListener('status', (event) => {
+            this.updateBotStatus(JSON.parse(event.data).bot_status);
+            this.updateLastUpdateTime();
+        });
+        
+        this.eventSource.onerror = () => {
+            this.streamConnected = false;
+            this.startAutoUpdate();
+            
+            // The browser retries on its own unless the stream was closed for good
+            if (this.eventSource.readyState === EventSource.CLOSED) {
+                this.reconnectTimeout = setTimeout(() => {
+                    this.loadSignals();
+                    this.connectStream();
+                }, 10000);
+            }
+        };
+    }
+    
+    closeStream() {
+        if (this.reconnectTimeout) {
+            clearTimeout(this.reconnectTimeout);
+            this.reconnectTimeout = null;
+        }
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+        this.streamConnected = false;
     }
     
     startAutoUpdate() {
-        if (this.updateInterval) {
-            clearInterval(this.updateInterval);
+        if (this.updateInterval || !this.autoUpdate) {
+            return;
         }
         
-        if (this.autoUpdate) {
-            this.updateInterval = setInterval(() => {
-                this.loadSignals();
-            }, 3000); // Update every 3 seconds
+        this.updateInterval = setInterval(() => {
+            this.loadSignals();
+        }, 3000); // Poll every 3 seconds while the stream is down
+    }
+    
+    stopAutoUpdate() {
+        if (this.updateInterval) {
+            clearInterval(this.updateInterval);
+            this.updateInterval = null;
         }
     }
     
@@ -31,8 +99,11 @@ class SignalDashboard {
             if (!response.ok) throw new Error('Failed to fetch signals');
             
             const data = await response.json();
+            this.totalSignals = data.total_signals || 0;
+            // Oldest first so the newest ends up on top
+            data.signals.slice().reverse().forEach(signal => this.addSignal(signal, false));
             this.updateStatistics(data);
-            this.updateSignalFeed(data.signals);
+            this.renderSignalFeed();
             this.updateLastUpdateTime();
             
         } catch (error) {
@@ -41,17 +112,76 @@ class SignalDashboard {
         }
     }
     
+    addSignal(signal, live = true) {
+        if (this.knownSignals.has(signal.id)) {
+            // A poll may carry a newer copy (status update or edit)
+            this.replaceSignal(signal);
+            return;
+        }
+        
+        this.knownSignals.add(signal.id);
+        this.signalsById.set(signal.id, signal);
+        this.signals.unshift(signal);
+        this.signals.sort((a, b) => b.id - a.id);
+        
+        while (this.signals.length > this.maxSignals) {
+            const dropped = this.signals.pop();
+            this.signalsById.delete(dropped.id);
+        }
+        
+        if (live) {
+            this.totalSignals += 1;
+            this.updateStatistics({total_signals: this.totalSignals});
+            this.renderSignalFeed([signal.id]);
+        }
+    }
+    
+    replaceSignal(signal) {
+        if (!this.signalsById.has(signal.id)) {
+            return false;
+        }
+        
+        this.signalsById.set(signal.id, signal);
+        const index = this.signals.findIndex(s => s.id === signal.id);
+        if (index !== -1) {
+            this.signals[index] = signal;
+        }
+        return true;
+    }
+    
+    async refreshSignals(ids) {
+        const shown = ids.filter(id => this.signalsById.has(id));
+        if (shown.length === 0) {
+            return;
+        }
+        
+        try {
+            const signals = await Promise.all(shown.map(async (id) => {
+                const response = await fetch(`/api/signals/${id}`);
+                if (!response.ok) throw new Error(`Failed to fetch signal ${id}`);
+                return response.json();
+            }));
+            signals.forEach(signal => this.replaceSignal(signal));
+            this.updateStatistics({total_signals: this.totalSignals});
+            this.renderSignalFeed();
+            this.updateLastUpdateTime();
+        } catch (error) {
+            console.error('Error refreshing signals:', error);
+        }
+    }
+    
     updateStatistics(data) {
         const totalSignals = data.total_signals || 0;
-        const buySignals = data.signals.filter(s => s.position === 'BUY').length;
-        const sellSignals = data.signals.filter(s => s.position === 'SELL').length;
-        const botStatus = data.bot_status || 'stopped';
+        const buySignals = this.signals.filter(s => s.position === 'BUY').length;
+        const sellSignals = this.signals.filter(s => s.position === 'SELL').length;
         
         document.getElementById('totalSignals').textContent = totalSignals;
         document.getElementById('buySignals').textContent = buySignals;
         document.getElementById('sellSignals').textContent = sellSignals;
         
-        this.updateBotStatus(botStatus);
+        if (data.bot_status) {
+            this.updateBotStatus(data.bot_status);
+        }
     }
     
     updateBotStatus(status) {
@@ -76,27 +206,20 @@ class SignalDashboard {
         }
     }
     
-    updateSignalFeed(signals) {
-        const feedElement = document.getElementById('signalFeed');
+    renderSignalFeed(newSignalIds = []) {
         const emptyState = document.getElementById('emptyState');
         
-        if (signals.length === 0) {
-            emptyState.style.display = 'block';
+        if (this.signals.length === 0) {
+            if (emptyState) {
+                emptyState.style.display = 'block';
+            }
             return;
         }
         
-        emptyState.style.display = 'none';
-        
-        // Check for new signals
-        const newSignals = signals.filter(signal => !this.knownSignals.has(signal.id));
-        
-        // Add new signals to known set
-        newSignals.forEach(signal => this.knownSignals.add(signal.id));
-        
-        // If there are new signals, rebuild the feed to show them at the top
-        if (newSignals.length > 0) {
-            this.buildSignalFeed(signals, newSignals.map(s => s.id));
+        if (emptyState) {
+            emptyState.style.display = 'none';
         }
+        this.buildSignalFeed(this.signals, newSignalIds);
     }
     
     buildSignalFeed(signals, newSignalIds = []) {
@@ -104,7 +227,7 @@ class SignalDashboard {
         
         const signalHTML = signals.map(signal => {
             const isNew = newSignalIds.includes(signal.id);
-            const takeProfit = JSON.parse(signal.take_profits || '[]');
+            const takeProfit = signal.take_profits || [];
             
             return `
                 <div class="signal-item p-3 border-bottom ${isNew ? 'new-signal' : ''}" 
@@ -117,6 +240,7 @@ class SignalDashboard {
                                     ${signal.position}
                                 </span>
                                 ${isNew ? '<span class="badge bg-warning ms-1">NEW</span>' : ''}
+                                ${signal.status && signal.status !== 'open' ? `<span class="badge bg-secondary ms-1">${signal.status}</span>` : ''}
                             </h6>
                             <div class="row small text-muted">
                                 <div class="col-md-6">
@@ -178,12 +302,14 @@ function toggleAutoUpdate() {
         updateText.textContent = 'Auto Update: ON';
         updateIcon.classList.remove('fa-play');
         updateIcon.classList.add('fa-sync-alt');
-        dashboard.startAutoUpdate();
+        dashboard.loadSignals();
+        dashboard.connectStream();
     } else {
         updateText.textContent = 'Auto Update: OFF';
         updateIcon.classList.remove('fa-sync-alt');
         updateIcon.classList.add('fa-play');
-        clearInterval(dashboard.updateInterval);
+        dashboard.closeStream();
+        dashboard.stopAutoUpdate();
     }
 }
 
@@ -192,27 +318,126 @@ function clearSignalFeed() {
     const emptyState = document.getElementById('emptyState');
     
     feedElement.innerHTML = '';
-    emptyState.style.display = 'block';
-    dashboard.knownSignals.clear();
+    if (emptyState) {
+        emptyState.style.display = 'block';
+    }
+    dashboard.signals = [];
+    dashboard.signalsById.clear();
 }
 
-function showSignalDetails(signalId) {
-    // Find the signal data
-    fetch('/api/signals')
+// Per-channel and per-symbol activity from the stats rollups (/api/stats)
+const ACTIVITY_ROWS = 10;
+let activityWindow = '24h';
+let activityInterval = null;
+
+function renderActivityRows(elementId, groups) {
+    const rows = groups.slice(0, ACTIVITY_ROWS).map(group => `
+        <tr>
+            <td>${group.key || '-'}</td>
+            <td class="text-end">${group.signals}</td>
+            <td class="text-end"><span class="text-success">${group.buys}</span> / <span class="text-danger">${group.sells}</span></td>
+        </tr>
+    `).join('');
+    document.getElementById(elementId).innerHTML = rows || '<tr><td colspan="3" class="text-muted">No signals</td></tr>';
+}
+
+function loadActivity(span = activityWindow) {
+    activityWindow = span;
+    document.querySelectorAll('#activityWindows button').forEach(button => {
+        button.classList.toggle('active', button.dataset.window === span);
+    });
+    
+    ['channel', 'symbol'].forEach(group => {
+        fetch(`/api/stats?window=${span}&group=${group}`)
+            .then(response => response.json())
+            .then(data => {
+                if (data.error) throw new Error(data.error);
+                renderActivityRows(group === 'channel' ? 'activityChannels' : 'activitySymbols', data.groups);
+            })
+            .catch(error => console.error('Error loading activity:', error));
+    });
+    
+    if (!activityInterval) {
+        activityInterval = setInterval(() => loadActivity(), 30000);
+    }
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    loadActivity();
+});
+
+// Full-text search over original messages (/api/search)
+let searchPage = 1;
+
+function searchSignals(page = 1) {
+    const query = document.getElementById('searchQuery').value.trim();
+    const panel = document.getElementById('searchPanel');
+    if (!query) {
+        panel.style.display = 'none';
+        return;
+    }
+    
+    const archive = document.getElementById('searchArchive').checked ? '&archive=1' : '';
+    fetch(`/api/search?q=${encodeURIComponent(query)}&page=${page}${archive}`)
         .then(response => response.json())
         .then(data => {
-            const signal = data.signals.find(s => s.id === signalId);
-            if (signal) {
+            panel.style.display = 'block';
+            if (data.error) {
+                const results = document.getElementById('searchResults');
+                results.innerHTML = '<div class="p-3 text-danger small"></div>';
+                results.firstChild.textContent = data.error;
+                document.getElementById('searchInfo').textContent = '';
+                return;
+            }
+            
+            searchPage = data.page;
+            data.results.forEach(signal => dashboard.signalsById.set(signal.id, signal));
+            document.getElementById('searchResults').innerHTML = data.results.length ? data.results.map(signal => `
+                <div class="signal-item p-3 border-bottom" onclick="showSignalDetails(${signal.id})" style="cursor: pointer;">
+                    <div class="d-flex justify-content-between">
+                        <h6 class="mb-1">
+                            <i class="fas fa-coins me-2"></i>${signal.symbol}
+                            <span class="badge ms-2 ${signal.position === 'BUY' ? 'bg-success' : 'bg-danger'}">${signal.position}</span>
+                        </h6>
+                        <small class="text-muted">
+                            ${signal.timestamp}<br>
+                            <i class="fas fa-broadcast-tower me-1"></i>${signal.source_channel}
+                        </small>
+                    </div>
+                    <div class="small text-muted" style="white-space: pre-wrap;">${signal.snippet}</div>
+                </div>
+            `).join('') : '<div class="p-3 text-muted small">No matching messages</div>';
+            
+            document.getElementById('searchInfo').textContent = `Page ${data.page}`;
+            document.getElementById('searchPrev').disabled = data.page <= 1;
+            document.getElementById('searchNext').disabled = !data.next_page;
+        })
+        .catch(error => console.error('Error searching signals:', error));
+}
+
+function showSignalDetails(signalId) {
+    // The detail request adds status updates; the feed copy is the fallback
+    const cached = dashboard.signalsById.get(signalId);
+    
+    fetch(`/api/signals/${signalId}`)
+        .then(response => response.json())
+        .then(signal => {
+            if (signal && !signal.error) {
                 displaySignalModal(signal);
+            } else if (cached) {
+                displaySignalModal(cached);
             }
         })
         .catch(error => {
             console.error('Error fetching signal details:', error);
+            if (cached) {
+                displaySignalModal(cached);
+            }
         });
 }
 
 function displaySignalModal(signal) {
-    const takeProfit = JSON.parse(signal.take_profits || '[]');
+    const takeProfit = signal.take_profits || [];
     
     const modalContent = `
         <div class="row">
@@ -251,6 +476,16 @@ function displaySignalModal(signal) {
                         <td><strong>Timestamp:</strong></td>
                         <td>${signal.timestamp}</td>
                     </tr>
+                    <tr>
+                        <td><strong>Status:</strong></td>
+                        <td>${signal.status || 'open'}</td>
+                    </tr>
+                    ${(signal.updates || []).length ? `
+                    <tr>
+                        <td><strong>Updates:</strong></td>
+                        <td>${signal.updates.map(update => `${update.timestamp}: ${update.kind}${update.level ? ' ' + update.level : ''}${update.price ? ' ' + update.price : ''}`).join('<br>')}</td>
+                    </tr>
+                    ` : ''}
                 </table>
             </div>
             <div class="col-md-6">
@@ -0,0 +1,146 @@
+"""Signal activity stats read from the incrementally kept ``SignalRollup`` buckets.
+
+    GET /api/stats?window=24h
+    GET /api/stats?window=7d&group=symbol&channel=-1001234567890
+    GET /api/stats?since=2024-01-01&until=2024-02-01&resolution=day
+
+Every query reads only the buckets of the window (grouped in SQL), never
+the signal table, so its cost grows with the number of buckets and
+(channel, symbol) pairs, not with the number of signals. Windows are
+aligned to bucket boundaries: ``window=24h`` at hour resolution covers the
+current hour and the 23 before it.
+"""
+import re
+from datetime import datetime, timedelta
+
+# Finest resolution used by default for windows up to this length
+DEFAULT_RESOLUTIONS = (
+    (timedelta(hours=2), 'minute'),
+    (timedelta(days=7), 'hour'),
+)
+
+_WINDOW_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+
+class StatsError(Exception):
+    """Invalid stats request (bad window, resolution or range)"""
+
+
+def parse_window(value):
+    """timedelta from '90m', '24h', '7d' or '4w'"""
+    match = re.fullmatch(r'\s*(\d+)\s*([mhdw])\s*', value or '')
+    if not match or int(match.group(1)) <= 0:
+        raise StatsError(f"Invalid window: {value!r} (expected e.g. 90m, 24h, 7d, 4w)")
+    return timedelta(**{_WINDOW_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def default_resolution(span):
+    for limit, resolution in DEFAULT_RESOLUTIONS:
+        if span <= limit:
+            return resolution
+    return 'day'
+
+
+def query_stats(session, since=None, until=None, window=None, resolution=None, group='channel',
+                channels=None, symbols=None, now=None):
+    """Totals, one row per channel or symbol (``group``) and the bucket series of a window.
+
+    The window is ``since``..``until`` (``until`` defaults to now) or the
+    last ``window`` (a timedelta) before now.
+    """
+    from app import db
+    from models import SignalRollup
+
+    now = now or datetime.utcnow()
+    until = until or now
+    if since is None:
+        since = until - (window or timedelta(days=1))
+    if since >= until:
+        raise StatsError("since must be before until")
+    resolution = resolution or default_resolution(until - since)
+    if resolution not in SignalRollup.RESOLUTIONS:
+        raise StatsError(f"Unknown resolution: {resolution} (expected one of {', '.join(SignalRollup.RESOLUTIONS)})")
+    if group not in ('channel', 'symbol'):
+        raise StatsError(f"Unknown group: {group} (expected channel or symbol)")
+
+    length, keep = SignalRollup.RESOLUTIONS[resolution]
+    # First bucket starting at or after since
+    start = SignalRollup.bucket_start(resolution, since)
+    if start < since:
+        start += length
+    if keep is not None and start < SignalRollup.bucket_start(resolution, now - keep):
+        raise StatsError(f"{resolution} buckets are only kept for {keep.days} days; use a coarser resolution")
+
+    filters = [SignalRollup.resolution == resolution, SignalRollup.bucket >= start, SignalRollup.bucket < until]
+    if channels:
+        filters.append(SignalRollup.source_channel.in_(channels))
+    if symbols:
+        filters.append(SignalRollup.symbol.in_([symbol.upper() for symbol in symbols]))
+    sums = (db.func.sum(SignalRollup.signals), db.func.sum(SignalRollup.buys), db.func.sum(SignalRollup.sells))
+
+    def counts(row):
+        return {'signals': int(row[-3] or 0), 'buys': int(row[-2] or 0), 'sells': int(row[-1] or 0)}
+
+    totals = session.execute(db.select(*sums).where(*filters)).one()
+    key = SignalRollup.source_channel if group == 'channel' else SignalRollup.symbol
+    grouped = session.execute(
+        db.select(key, *sums).where(*filters).group_by(key).order_by(db.func.sum(SignalRollup.signals).desc(), key)
+    ).all()
+    series = session.execute(
+        db.select(SignalRollup.bucket, *sums).where(*filters).group_by(SignalRollup.bucket).order_by(SignalRollup.bucket)
+    ).all()
+
+    return {
+        'resolution': resolution,
+        'since': start.strftime('%Y-%m-%d %H:%M:%S'),
+        'until': until.strftime('%Y-%m-%d %H:%M:%S'),
+        'totals': counts(totals),
+        'group': group,
+        'groups': [dict(counts(row), key=row[0]) for row in grouped],
+        'series': [dict(counts(row), bucket=row[0].strftime('%Y-%m-%d %H:%M:%S')) for row in series],
+    }
+
+
+def rebuild_rollups(session, batch_size=5000):
+    """Recompute every bucket from the signal table (one streamed pass); returns signals counted"""
+    from app import db
+    from models import Signal, SignalRollup
+
+    session.execute(db.delete(SignalRollup))
+    now = datetime.utcnow()
+    # Buckets past their retention are skipped; they would only be pruned again
+    cutoffs = [(resolution, now - keep if keep is not None else datetime.min)
+               for resolution, (_, keep) in SignalRollup.RESOLUTIONS.items()]
+    counts = {}
+    counted = 0
+    result = session.execute(
+        db.select(Signal.timestamp, Signal.source_channel, Signal.symbol, Signal.position).order_by(Signal.id),
+        execution_options={'yield_per': batch_size}
+    )
+    for timestamp, source_channel, symbol, position in result:
+        if timestamp is None:
+            continue
+        resolutions = [resolution for resolution, cutoff in cutoffs if timestamp >= cutoff]
+        SignalRollup.count(counts, timestamp, source_channel, symbol, position, resolutions=resolutions)
+        counted += 1
+
+    rows = [{'resolution': resolution, 'bucket': bucket, 'source_channel': source_channel, 'symbol': symbol,
+             'signals': signals, 'buys': buys, 'sells': sells}
+            for (resolution, bucket, source_channel, symbol), (signals, buys, sells) in counts.items()]
+    for start in range(0, len(rows), batch_size):
+        session.execute(db.insert(SignalRollup), rows[start:start + batch_size])
+    return counted
+
+
+def ensure_rollups(session):
+    """Build the buckets once for signals stored before rollups existed; returns True if built"""
+    from app import db
+    from models import Signal, SignalRollup
+
+    if session.execute(db.select(SignalRollup.resolution).limit(1)).first() is not None:
+        return False
+    if session.execute(db.select(Signal.id).limit(1)).first() is None:
+        return False
+    rebuild_rollups(session)
+    session.commit()
+    return True
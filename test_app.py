@@ -0,0 +1,74 @@
+from dedup import SeenSignal
+from db_writer import SignalWriter
+from signal_index import OpenSignal
+from test_db_writer import make_signal, run_writer
+
+
+def test_signal_etag_changes_with_status_update(database):
+    from app import app
+
+    seen = SeenSignal('-1001', 0)
+    writer = SignalWriter(flush_interval=0.05)
+    writer.submit_signal(make_signal('-1001', 1), seen=seen)
+    run_writer(writer)
+
+    client = app.test_client()
+    first = client.get('/api/signals')
+    etag = first.headers['ETag']
+    assert client.get('/api/signals', headers={'If-None-Match': etag}).status_code == 304
+
+    entry = OpenSignal('-1001', 1, 'BTCUSDT', 2, seen=seen)
+    writer.submit_update(entry, {'kind': 'sl_hit', 'level': None, 'price': '90', 'status': 'stopped',
+                                 'source_channel': '-1001'}, 2)
+    run_writer(writer)
+
+    response = client.get('/api/signals', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['signals'][0]['status'] == 'stopped'
+
+
+def test_signal_etag_changes_with_edit(database):
+    from app import app
+    from signal_index import PostedSignal
+
+    seen = SeenSignal('-1001', 0)
+    writer = SignalWriter(flush_interval=0.05)
+    writer.submit_signal(make_signal('-1001', 1), seen=seen)
+    run_writer(writer)
+
+    client = app.test_client()
+    etag = client.get('/api/signals').headers['ETag']
+
+    writer.submit_edit(PostedSignal('-1001', 1, None, seen=seen), make_signal('-1001', 1, entry='105'))
+    run_writer(writer)
+
+    response = client.get('/api/signals', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['signals'][0]['entry'] == '105'
+
+
+def test_admin_routes_are_closed_without_token(database, monkeypatch):
+    import app as app_module
+
+    client = app_module.app.test_client()
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', None)
+    assert client.get('/admin/profile', headers={'X-Admin-Token': ''}).status_code == 403
+
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', 'secret')
+    assert client.get('/admin/profile?token=secret').status_code == 403
+    assert client.get('/admin/profile', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    # Past the token check; no bot worker runs in the tests
+    assert client.get('/admin/profile', headers={'X-Admin-Token': 'secret'}).status_code == 503
+
+
+def test_export_requires_admin_token(database, monkeypatch):
+    import app as app_module
+
+    client = app_module.app.test_client()
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', None)
+    assert client.get('/api/export?format=ndjson').status_code == 403
+
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', 'secret')
+    assert client.get('/api/export?format=ndjson&token=secret').status_code == 403
+    response = client.get('/api/export?format=ndjson&archive=0', headers={'X-Admin-Token': 'secret'})
+    assert response.status_code == 200
@@ -0,0 +1,23 @@
+import os
+
+import bot_control
+
+
+def test_generated_key_is_private_and_shared(tmp_path, monkeypatch):
+    monkeypatch.delenv('BOT_CONTROL_KEY', raising=False)
+    monkeypatch.delenv('SESSION_SECRET', raising=False)
+    path = tmp_path / 'bot_control.key'
+    monkeypatch.setenv('BOT_CONTROL_KEY_FILE', str(path))
+
+    key = bot_control.control_authkey()
+    assert len(key) == 64
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    # The other process reads the same key
+    assert bot_control.control_authkey() == key
+
+
+def test_configured_key_wins(tmp_path, monkeypatch):
+    monkeypatch.setenv('BOT_CONTROL_KEY', 'from-env')
+    monkeypatch.setenv('BOT_CONTROL_KEY_FILE', str(tmp_path / 'bot_control.key'))
+    assert bot_control.control_authkey() == b'from-env'
+    assert not (tmp_path / 'bot_control.key').exists()
@@ -0,0 +1,143 @@
+from db_writer import SignalWriter
+from signal_parser import build_signal
+
+
+def make_signal(channel, message_id, symbol='BTCUSDT', entry='100'):
+    signal_data = build_signal(symbol, 'BUY', entry, '90', ['110', '120'], '1:2', f'{symbol} buy {entry}', channel)
+    signal_data['source_message_id'] = message_id
+    return signal_data
+
+
+def run_writer(writer):
+    """Let the writer thread drain its queue"""
+    writer.start()
+    writer.stop()
+
+
+def checkpoints(db):
+    from models import ChannelCheckpoint
+
+    db.session.expire_all()
+    return {checkpoint.channel: checkpoint.last_message_id for checkpoint in ChannelCheckpoint.query.all()}
+
+
+def stored(db):
+    from models import Signal
+
+    db.session.expire_all()
+    return sorted((signal.source_channel, signal.source_message_id) for signal in Signal.query.all())
+
+
+def test_batches_signals_and_advances_checkpoints(database):
+    writer = SignalWriter(batch_size=2, flush_interval=0.05)
+    for message_id in (1, 2, 3):
+        writer.submit_signal(make_signal('-1001', message_id, entry=str(100 + message_id)))
+    writer.mark_processed('-1002', 7)
+    run_writer(writer)
+
+    assert stored(database) == [('-1001', 1), ('-1001', 2), ('-1001', 3)]
+    assert writer.rows_written == 3
+    assert writer.batches_written == 2
+    assert checkpoints(database) == {'-1001': 3, '-1002': 7}
+
+
+def test_take_profits_are_stored_in_order(database):
+    from models import Signal
+
+    writer = SignalWriter(flush_interval=0.05)
+    writer.submit_signal(make_signal('-1001', 1))
+    run_writer(writer)
+
+    signal = Signal.query.one()
+    assert signal.entry == 100
+    assert signal.get_take_profits_list() == ['110', '120']
+
+
+def test_held_checkpoint_waits_for_release(database):
+    from models import ChannelCheckpoint
+
+    database.session.add(ChannelCheckpoint(channel='-1001', last_message_id=10))
+    database.session.commit()
+
+    writer = SignalWriter(flush_interval=0.05)
+    writer.hold_checkpoints()
+    # A live message saved before the backlog (11, 12) has been fetched
+    writer.submit_signal(make_signal('-1001', 50))
+    run_writer(writer)
+    assert ('-1001', 50) in stored(database)
+    assert checkpoints(database) == {'-1001': 10}
+
+    writer.mark_processed('-1001', 11)
+    writer.submit_signal(make_signal('-1001', 12, entry='101'))
+    writer.release_checkpoints('-1001')
+    run_writer(writer)
+    assert checkpoints(database) == {'-1001': 50}
+
+
+def test_release_is_per_channel(database):
+    writer = SignalWriter(flush_interval=0.05)
+    writer.hold_checkpoints()
+    writer.mark_processed('-1001', 5)
+    writer.mark_processed('-1002', 8)
+    writer.release_checkpoints('-1002')
+    writer.mark_processed('-1002', 9)
+    run_writer(writer)
+    assert checkpoints(database) == {'-1002': 9}
+
+    writer.release_checkpoints()
+    run_writer(writer)
+    assert checkpoints(database) == {'-1001': 5, '-1002': 9}
+
+
+def test_skips_signals_whose_source_message_is_stored(database):
+    writer = SignalWriter(flush_interval=0.05)
+    writer.submit_signal(make_signal('-1001', 1))
+    run_writer(writer)
+
+    writer.submit_signal(make_signal('-1001', 1))
+    run_writer(writer)
+    assert stored(database) == [('-1001', 1)]
+
+
+def test_same_message_id_in_another_channel_is_not_skipped(database):
+    writer = SignalWriter(flush_interval=0.05)
+    writer.submit_signal(make_signal('-1001', 1))
+    run_writer(writer)
+
+    writer.submit_signal(make_signal('-1002', 1, symbol='ETHUSDT'))
+    run_writer(writer)
+    assert stored(database) == [('-1001', 1), ('-1002', 1)]
+
+
+def test_failed_commit_leaves_signal_id_unset(database, monkeypatch):
+    from sqlalchemy.orm import Session
+
+    from dedup import SeenSignal
+
+    def fail(session):
+        raise RuntimeError('database is locked')
+
+    monkeypatch.setattr(Session, 'commit', fail)
+    seen = SeenSignal('-1001', 0)
+    writer = SignalWriter(flush_interval=0.05)
+    writer.submit_signal(make_signal('-1001', 1), seen=seen)
+    writer.submit_duplicate(seen, make_signal('-1002', 5))
+    run_writer(writer)
+
+    assert seen.signal_id is None
+    assert writer.failed_rows == 2
+
+
+def test_duplicate_in_same_batch_refers_to_new_signal(database):
+    from dedup import SeenSignal
+    from models import Signal, SignalDuplicate
+
+    seen = SeenSignal('-1001', 0)
+    writer = SignalWriter(flush_interval=0.05)
+    writer.submit_signal(make_signal('-1001', 1), seen=seen)
+    writer.submit_duplicate(seen, make_signal('-1002', 5))
+    run_writer(writer)
+
+    signal = Signal.query.one()
+    assert seen.signal_id == signal.id
+    assert SignalDuplicate.query.one().signal_id == signal.id
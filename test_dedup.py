@@ -0,0 +1,59 @@
+from dedup import SignalDeduplicator, signal_fingerprint
+
+
+def make_signal(channel='-1001', symbol='XAUUSD', entry='3350', take_profits=('3360', '3370')):
+    return {'symbol': symbol, 'position': 'BUY', 'entry': entry, 'stop_loss': '3340',
+            'take_profits': list(take_profits), 'source_channel': channel}
+
+
+def test_fingerprint_ignores_price_formatting_and_channel():
+    assert (signal_fingerprint(make_signal('-1001', 'xauusd', '3350', ('3360', '3370')))
+            == signal_fingerprint(make_signal('-1002', 'XAUUSD', '3350.00', ('3360.0', '3370'))))
+    assert signal_fingerprint(make_signal(entry='3351')) != signal_fingerprint(make_signal())
+
+
+def test_repeat_within_window_is_duplicate_of_first_post(clock):
+    dedup = SignalDeduplicator(window=60, clock=clock)
+    first, is_duplicate = dedup.check(make_signal('-1001'))
+    assert not is_duplicate
+
+    clock.now = 60
+    entry, is_duplicate = dedup.check(make_signal('-1002'))
+    assert is_duplicate
+    assert entry is first
+    assert entry.source_channel == '-1001'
+    assert entry.repeats == 1
+
+
+def test_entry_expires_after_window(clock):
+    dedup = SignalDeduplicator(window=60, clock=clock)
+    dedup.check(make_signal('-1001'))
+
+    clock.now = 61
+    entry, is_duplicate = dedup.check(make_signal('-1002'))
+    assert not is_duplicate
+    assert entry.source_channel == '-1002'
+    assert dedup.stats()['expirations'] == 1
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    dedup = SignalDeduplicator(max_entries=2, clock=clock)
+    dedup.check(make_signal(entry='1'))
+    dedup.check(make_signal(entry='2'))
+    # A hit makes entry 1 the most recently used
+    assert dedup.check(make_signal(entry='1'))[1]
+    dedup.check(make_signal(entry='3'))
+
+    assert not dedup.check(make_signal(entry='2'))[1]
+    stats = dedup.stats()
+    assert stats['size'] == 2
+    assert stats['evictions'] == 2
+    assert stats['hits'] == 1
+    assert stats['misses'] == 4
+
+
+def test_clear_forgets_every_signal(clock):
+    dedup = SignalDeduplicator(clock=clock)
+    dedup.check(make_signal())
+    dedup.clear()
+    assert not dedup.check(make_signal())[1]
@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+import migrate
+
+LEGACY_SCHEMA = """
+    CREATE TABLE signal (
+        id INTEGER PRIMARY KEY,
+        symbol VARCHAR(20),
+        position VARCHAR(10),
+        entry VARCHAR(20),
+        stop_loss VARCHAR(20),
+        take_profits TEXT,
+        risk_reward VARCHAR(20),
+        source_channel VARCHAR(100),
+        formatted_signal TEXT,
+        original_message TEXT,
+        timestamp DATETIME
+    )"""
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """Stand-in for ``db`` (only ``engine`` is used) on a database with the original string-typed schema"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(LEGACY_SCHEMA))
+        conn.execute(text(
+            "INSERT INTO signal (id, symbol, position, entry, stop_loss, take_profits, source_channel, timestamp) "
+            "VALUES (1, 'BTCUSDT', 'BUY', '65000.5', '64000', '[\"66000\", \"67000\"]', '-1001', '2024-01-01'), "
+            "(2, 'XAUUSD', 'SELL', '2350', 'n/a', NULL, '-1002', '2024-01-02')"))
+    yield SimpleNamespace(engine=engine)
+    engine.dispose()
+
+
+def prices(engine):
+    with engine.connect() as conn:
+        signals = conn.execute(text('SELECT id, entry_price, stop_loss_price FROM signal ORDER BY id')).all()
+        take_profits = conn.execute(text('SELECT signal_id, level, price FROM take_profit '
+                                         'ORDER BY signal_id, level')).all()
+    return [tuple(row) for row in signals], [tuple(row) for row in take_profits]
+
+
+def test_copies_legacy_prices(legacy_db):
+    assert migrate.upgrade_all(legacy_db)
+
+    assert prices(legacy_db.engine) == (
+        [(1, 65000.5, 64000), (2, 2350, None)],
+        [(1, 1, 66000), (1, 2, 67000)],
+    )
+    columns = {column['name'] for column in inspect(legacy_db.engine).get_columns('signal')}
+    assert not columns & set(migrate.LEGACY_SIGNAL_COLUMNS)
+    assert migrate.migration_applied(legacy_db.engine, migrate.TYPED_PRICES_MIGRATION)
+
+
+def test_failed_drop_does_not_rerun_over_new_rows(legacy_db, monkeypatch):
+    # Simulate a SQLite build that cannot drop columns
+    monkeypatch.setattr(migrate, 'drop_legacy_columns', lambda engine, columns: list(migrate.LEGACY_SIGNAL_COLUMNS))
+    assert migrate.upgrade_all(legacy_db)
+
+    # A row written by the current code leaves the legacy columns empty
+    with legacy_db.engine.begin() as conn:
+        conn.execute(text("INSERT INTO signal (id, symbol, position, entry_price, stop_loss_price, source_channel) "
+                          "VALUES (3, 'ETHUSDT', 'BUY', 3500, 3400, '-1001')"))
+        conn.execute(text("INSERT INTO take_profit (signal_id, level, price) VALUES (3, 1, 3600)"))
+    expected = prices(legacy_db.engine)
+
+    assert not migrate.upgrade_signal_schema(legacy_db)
+    assert prices(legacy_db.engine) == expected
+
+    # Even without the marker, only rows still missing their prices are copied
+    with legacy_db.engine.begin() as conn:
+        conn.execute(text('DELETE FROM schema_migration'))
+    assert migrate.upgrade_signal_schema(legacy_db)
+    assert prices(legacy_db.engine) == expected
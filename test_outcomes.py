@@ -0,0 +1,95 @@
+import numpy as np
+
+import outcomes
+from outcomes import Bars, SignalArrays, evaluate
+
+
+def make_signals(*rows):
+    """SignalArrays from (symbol, channel, side, entry, stop_loss, time, tps) tuples"""
+    levels = max(len(row[6]) for row in rows)
+    tps = np.full((len(rows), levels), np.nan)
+    for i, row in enumerate(rows):
+        tps[i, :len(row[6])] = row[6]
+    return SignalArrays(
+        np.arange(1, len(rows) + 1, dtype=np.int64),
+        np.array([row[0] for row in rows], dtype=object),
+        np.array([row[1] for row in rows], dtype=object),
+        np.array([row[2] for row in rows], dtype=np.int8),
+        np.array([row[3] for row in rows], dtype=np.float64),
+        np.array([row[4] for row in rows], dtype=np.float64),
+        np.array([row[5] for row in rows], dtype=np.int64),
+        tps,
+    )
+
+
+# Minute bars opening at 60, 120, 180 and 240
+BARS = {'XAUUSD': Bars([60, 120, 180, 240], high=[105, 112, 101, 103], low=[95, 100, 89, 99],
+                       close=[100, 108, 90, 102])}
+
+
+def test_first_reach_matches_a_scan():
+    rng = np.random.default_rng(7)
+    values = rng.normal(size=300).cumsum()
+    start = rng.integers(0, 300, size=200)
+    end = np.minimum(start + rng.integers(1, 64, size=200), 300)
+    level = values[start] + rng.normal(scale=3, size=200)
+
+    found = outcomes._FirstReach(values, 64).find(start, level, end)
+    for i in range(200):
+        hits = np.flatnonzero(values[start[i]:end[i]] >= level[i])
+        assert found[i] == (start[i] + hits[0] if len(hits) else outcomes.NO_HIT)
+
+
+def test_evaluate_outcomes():
+    signals = make_signals(
+        ('XAUUSD', 'a', 1, 100, 90, 0, [110, 120]),   # TP1 in bar 2, then stopped in bar 3
+        ('XAUUSD', 'a', -1, 100, 110, 0, [95]),       # short, TP1 in bar 1
+        ('XAUUSD', 'b', 1, 100, 95, 0, [105]),        # TP and stop in the same bar
+        ('XAUUSD', 'b', 1, 100, 50, 0, [200]),        # neither within the window
+        ('XAUUSD', 'b', 1, 100, 100, 0, [110]),       # no risk
+        ('BTCUSDT', 'b', 1, 100, 90, 0, [110]),       # no bars
+    )
+    result = evaluate(signals, BARS, max_bars=3)
+
+    assert list(result.outcomes()) == ['tp1', 'tp1', 'sl', 'open', 'invalid', 'no_data']
+    assert result.tp_hit.tolist() == [[True, False], [True, False], [False, False], [False, False],
+                                      [False, False], [False, False]]
+    assert list(result.seconds_to_outcome) == [120, 60, 60, -1, -1, -1]
+    # Half closed at TP1 (+1R), half at the stop (-1R)
+    assert result.r_multiple[:4].tolist() == [0.0, 0.5, -1.0, -0.2]
+    assert np.isnan(result.r_multiple[4:]).all()
+
+
+def test_evaluation_starts_after_the_signal_time():
+    signals = make_signals(('XAUUSD', 'a', 1, 100, 90, 60, [110]), ('XAUUSD', 'a', 1, 100, 90, 240, [110]))
+    result = evaluate(signals, BARS)
+    # The first bar opens at the signal time and is skipped; nothing opens after 240
+    assert list(result.outcomes()) == ['tp1', 'no_data']
+    assert result.seconds_to_outcome[0] == 60
+
+
+def test_summarize_by_channel():
+    signals = make_signals(
+        ('XAUUSD', 'a', 1, 100, 90, 0, [110, 120]),
+        ('XAUUSD', 'a', -1, 100, 110, 0, [95]),
+        ('XAUUSD', 'b', 1, 100, 95, 0, [105]),
+    )
+    summary = evaluate(signals, BARS, max_bars=3).summarize()
+
+    assert summary['a']['wins'] == 2
+    assert summary['a']['total_r'] == 0.5
+    assert summary['a']['tp_hits'] == [2, 0]
+    assert summary['b'] == {'signals': 1, 'evaluated': 1, 'wins': 0, 'losses': 1, 'open': 0, 'win_rate': 0.0,
+                            'total_r': -1.0, 'avg_r': -1.0, 'avg_seconds_to_outcome': 60.0, 'tp_hits': [0, 0]}
+
+
+def test_load_bars_from_csv(tmp_path):
+    path = tmp_path / 'xauusd.csv'
+    path.write_text('Timestamp,Open,High,Low,Close\n'
+                    '2024-01-01T00:01:00Z,1,3,0.5,2\n'
+                    '2024-01-01T00:00:00Z,1,2,0.5,1.5\n')
+    bars = outcomes.load_bars(str(path))
+
+    assert bars.time.tolist() == [1704067200, 1704067260]
+    assert bars.high.tolist() == [2, 3]
+    assert outcomes.price_files(str(tmp_path)) == {'XAUUSD': str(path)}
@@ -0,0 +1,13 @@
+from profiler import pattern_breakdown
+
+SIGNAL_TEXT = 'GOLD BUY 3373.33\nSL: 3360.00\nTP1: 3380\nTP2: 3390.50'
+
+
+def test_symbol_patterns_run_per_word_token():
+    results = {(result['table'], result['pattern']): result for result in pattern_breakdown([SIGNAL_TEXT])}
+    # Only the letter-only words of the lines are candidates: GOLD, BUY and SL
+    gold = results[('symbol', 'GOLD')]
+    assert gold['calls'] == 3
+    assert gold['hits'] == 1
+    # A fullmatch: 'SL' is too short for this pattern
+    assert results[('symbol', '[A-Z]{3,8}')]['hits'] == 2
@@ -0,0 +1,42 @@
+from routing import Route, RouteTable, channel_key
+
+
+def signal(symbol='BTCUSDT', position='BUY', source_channel='-1001'):
+    return {'symbol': symbol, 'position': position, 'source_channel': source_channel}
+
+
+def test_channel_key_normalizes_references():
+    assert channel_key('-1001467736193') == channel_key(1467736193) == '1467736193'
+    assert channel_key('@GoldSignals') == 'goldsignals'
+
+
+def test_destinations_follow_route_order_without_repeats():
+    table = RouteTable([
+        Route('@crypto', symbols='BTCUSDT,ETHUSDT'),
+        Route('@all'),
+        Route('@crypto', positions=['SELL']),
+        Route('-1009', symbols=['btcusdt'], positions='BUY'),
+    ])
+    assert table.destinations(signal()) == ('@crypto', '@all', -1009)
+    assert table.destinations(signal(position='SELL')) == ('@crypto', '@all')
+    assert table.destinations(signal(symbol='XAUUSD')) == ('@all',)
+
+
+def test_source_channel_filter():
+    table = RouteTable([Route('@vip', source_channels=['-1001467736193'])])
+    assert table.destinations(signal(source_channel='1467736193')) == ('@vip',)
+    assert table.destinations(signal(source_channel='-1002')) == ()
+
+
+def test_cache_is_bounded_and_keyed_on_source():
+    table = RouteTable([Route('@vip', source_channels='-1001'), Route('@all', symbols='ETHUSDT')], cache_size=2)
+    assert table.destinations(signal(source_channel='-1001')) == ('@vip',)
+    assert table.destinations(signal(source_channel='-1002')) == ()
+    assert table.destinations(signal(symbol='ETHUSDT', source_channel='-1002')) == ('@all',)
+    assert len(table._cache) == 2
+
+
+def test_from_config_falls_back_to_default_destination():
+    assert RouteTable.from_config(None, '-1005').destinations(signal()) == (-1005,)
+    table = RouteTable.from_config('[{"destination": "@sells", "positions": ["SELL"]}]', '-1005')
+    assert table.destinations(signal()) == ()
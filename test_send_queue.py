@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from send_queue import OutboundSender, TokenBucket
+
+
+class FloodWait(Exception):
+    def __init__(self, seconds):
+        super().__init__(f'wait {seconds}s')
+        self.seconds = seconds
+
+
+class Destination:
+    """Records delivered texts; raises the queued errors first"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.sent = []
+
+    async def send(self, destination, text):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((destination, text))
+        return len(self.sent)
+
+
+def test_bucket_allows_burst_then_refills_at_rate(clock):
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+
+    async def take(count):
+        for _ in range(count):
+            await bucket.acquire()
+
+    asyncio.run(take(3))
+    assert bucket.tokens == 0
+
+    clock.now = 1
+    bucket._refill()
+    assert bucket.tokens == 2
+    clock.now = 10
+    bucket._refill()
+    assert bucket.tokens == 3
+
+
+def test_penalize_blocks_for_the_flood_wait(clock):
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+    bucket.penalize(5)
+
+    clock.now = 5
+    bucket._refill()
+    assert bucket.tokens == 0
+    clock.now = 5.5
+    bucket._refill()
+    assert bucket.tokens == 1
+
+
+def test_messages_keep_their_order_per_destination():
+    destination = Destination()
+
+    async def run():
+        sender = OutboundSender(destination.send, rate=1000, burst=10)
+        for i in range(5):
+            sender.enqueue('@a', f'a{i}')
+            sender.enqueue('@b', f'b{i}')
+        await sender.close()
+        return sender.stats()
+
+    stats = asyncio.run(run())
+    assert [text for chat, text in destination.sent if chat == '@a'] == [f'a{i}' for i in range(5)]
+    assert [text for chat, text in destination.sent if chat == '@b'] == [f'b{i}' for i in range(5)]
+    assert stats['@a']['sent'] == stats['@b']['sent'] == 5
+
+
+def test_flood_wait_retries_the_same_message():
+    destination = Destination(FloodWait(0.01))
+    sent = []
+
+    async def run():
+        sender = OutboundSender(destination.send, rate=1000, burst=10, flood_wait_errors=(FloodWait,))
+        sender.enqueue('@a', 'first', on_sent=sent.append)
+        sender.enqueue('@a', 'second')
+        await sender.close()
+        return sender.stats()['@a']
+
+    stats = asyncio.run(run())
+    assert destination.sent == [('@a', 'first'), ('@a', 'second')]
+    assert sent == [1]
+    assert stats['flood_waits'] == 1
+    assert stats['sent'] == 2
+    assert stats['failed'] == 0
+
+
+def test_other_errors_give_up_after_max_retries():
+    destination = Destination(ConnectionError('down'))
+
+    async def run():
+        sender = OutboundSender(destination.send, rate=1000, burst=10, max_retries=0)
+        sender.enqueue('@a', 'lost')
+        sender.enqueue('@a', 'next')
+        await sender.close()
+        return sender.stats()['@a']
+
+    stats = asyncio.run(run())
+    assert destination.sent == [('@a', 'next')]
+    assert stats['failed'] == 1
+    assert stats['sent'] == 1
+
+
+def test_full_queue_drops_message():
+    async def run():
+        sender = OutboundSender(Destination().send, max_queue=1)
+        accepted = [sender.enqueue('@a', 'first'), sender.enqueue('@a', 'second')]
+        await sender.close(timeout=0)
+        return accepted, sender.stats()['@a']['dropped']
+
+    assert asyncio.run(run()) == ([True, False], 1)
+
+
+def test_edit_requires_edit_function():
+    sender = OutboundSender(Destination().send)
+    with pytest.raises(ValueError):
+        sender.enqueue_edit('@a', 1, 'text')
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+from functools import partial
+from threading import Thread
+
+from fake_telegram import FakeMessage, FakeTelegramClient
+from routing import Route, RouteTable
+from signal_bot import SignalBot
+
+CHANNEL = -1001
+OTHER_CHANNEL = -1002
+SIGNAL_TEXT = 'GOLD BUY 3373.33\nSL: 3360.00\nTP1: 3380\nTP2: 3390.50'
+
+
+def make_bot(catchup_limit=1000, routes=None):
+    bot = SignalBot(1, 'hash', 'test', [CHANNEL, OTHER_CHANNEL], 'dest', routes=routes,
+                    catchup_limit=catchup_limit, client_factory=FakeTelegramClient)
+    bot.client = FakeTelegramClient()
+    bot.writer.flush_interval = 0.05
+    return bot
+
+
+def checkpoints(db):
+    from models import ChannelCheckpoint
+
+    db.session.expire_all()
+    return {checkpoint.channel: checkpoint.last_message_id for checkpoint in ChannelCheckpoint.query.all()}
+
+
+def seed_checkpoint(db, message_id):
+    from models import ChannelCheckpoint
+
+    db.session.add(ChannelCheckpoint(channel=str(CHANNEL), last_message_id=message_id))
+    db.session.commit()
+
+
+def test_catch_up_releases_checkpoint_after_backlog(database):
+    seed_checkpoint(database, 10)
+    bot = make_bot()
+    bot.client.history[CHANNEL] = [FakeMessage(message_id, CHANNEL, 'hello') for message_id in (11, 12, 13)]
+
+    bot.writer.hold_checkpoints()
+    bot.writer.start()
+    asyncio.run(bot.catch_up())
+    bot.writer.stop()
+    assert checkpoints(database) == {str(CHANNEL): 13}
+
+
+def test_catch_up_warns_when_backlog_exceeds_limit(database, caplog):
+    seed_checkpoint(database, 10)
+    bot = make_bot(catchup_limit=2)
+    bot.client.history[CHANNEL] = [FakeMessage(message_id, CHANNEL, 'hello') for message_id in range(11, 16)]
+
+    bot.writer.hold_checkpoints()
+    bot.writer.start()
+    with caplog.at_level(logging.WARNING, logger='signal_bot'):
+        asyncio.run(bot.catch_up())
+    bot.writer.stop()
+    assert 'messages 13 to 15 were skipped' in caplog.text
+    assert checkpoints(database) == {str(CHANNEL): 12}
+
+
+def test_failed_catch_up_keeps_checkpoint_held(database):
+    seed_checkpoint(database, 10)
+    bot = make_bot()
+
+    async def unavailable(entity, limit=1):
+        raise ConnectionError('channel unavailable')
+
+    bot.client.get_messages = unavailable
+    bot.writer.hold_checkpoints()
+    bot.writer.start()
+    asyncio.run(bot.catch_up())
+    # A live message arriving afterwards must not skip the unfetched backlog
+    bot.writer.mark_processed(str(CHANNEL), 40)
+    bot.writer.stop()
+    assert checkpoints(database) == {str(CHANNEL): 10}
+
+
+class RecordingSender:
+    """Stands in for OutboundSender, keeping what would have been sent"""
+
+    def __init__(self):
+        self.sent = []
+
+    def enqueue(self, destination, text, on_sent=None):
+        self.sent.append(destination)
+
+
+def test_duplicate_reaches_destinations_the_first_post_missed(database):
+    routes = RouteTable([Route('@all'), Route('@other', source_channels=[str(OTHER_CHANNEL)])])
+    bot = make_bot(routes=routes)
+    bot.sender = RecordingSender()
+
+    async def post(*messages):
+        for message in messages:
+            await bot.process_message(message)
+
+    asyncio.run(post(FakeMessage(1, CHANNEL, SIGNAL_TEXT), FakeMessage(2, OTHER_CHANNEL, SIGNAL_TEXT),
+                     FakeMessage(3, OTHER_CHANNEL, SIGNAL_TEXT)))
+    assert bot.sender.sent == ['@all', '@other']
+    assert bot.messages_total.value(str(OTHER_CHANNEL), 'duplicate_routed') == 1
+    assert bot.messages_total.value(str(OTHER_CHANNEL), 'duplicate') == 1
+
+
+def test_edit_of_stored_duplicate_is_not_posted_again(database):
+    from models import Signal, SignalDuplicate
+
+    bot = make_bot()
+    bot.sender = RecordingSender()
+
+    async def post(*messages):
+        for message in messages:
+            await bot.process_message(message)
+
+    bot.writer.start()
+    asyncio.run(post(FakeMessage(1, CHANNEL, SIGNAL_TEXT), FakeMessage(2, OTHER_CHANNEL, SIGNAL_TEXT)))
+    bot.writer.stop()
+    assert SignalDuplicate.query.one().source_message_id == 2
+
+    # After a restart (or once the dedup window has passed) only the database remembers the repost
+    bot.clear_caches()
+    bot.writer.start()
+    asyncio.run(bot.process_edit(FakeMessage(2, OTHER_CHANNEL, SIGNAL_TEXT.replace('3390.50', '3391'))))
+    bot.writer.stop()
+
+    assert Signal.query.count() == 1
+    assert bot.sender.sent == ['dest']
+    assert bot.messages_total.value(str(OTHER_CHANNEL), 'edit_duplicate') == 1
+
+
+def test_stop_from_another_thread_ends_the_bot(database):
+    from models import Signal
+
+    # The second message keeps the fake client connected until stopped
+    script = [(0, FakeMessage(1, CHANNEL, SIGNAL_TEXT)), (3600, FakeMessage(2, CHANNEL, 'hello'))]
+    bot = SignalBot(1, 'hash', 'test', [CHANNEL], 'dest',
+                    client_factory=partial(FakeTelegramClient, script=script))
+    bot.writer.flush_interval = 0.05
+    thread = Thread(target=bot.start, daemon=True)
+    thread.start()
+
+    deadline = time.monotonic() + 5
+    while bot.writer.rows_written < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    bot.stop()
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert not bot.is_running()
+    assert bot._catch_up_task is None
+    assert Signal.query.count() == 1